@@ -0,0 +1,162 @@
+import os
+import math
+import asyncio
+import logging
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+
+logger = logging.getLogger("agent.admission")
+
+# === Admission Settings === #
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_QUEUE_SECONDS = float(os.getenv("ADMISSION_MAX_QUEUE_SECONDS", "10"))
+# Hard cap on pipelines one API key may have running or waiting at once; 0 = only a fair
+# share of the running+queued slots, enforced while other keys are active
+ADMISSION_PER_KEY_LIMIT = int(os.getenv("ADMISSION_PER_KEY_LIMIT", "0"))
+
+# === Per-Stage Concurrency Limits === #
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+SERP_MAX_CONCURRENCY = int(os.getenv("SERP_MAX_CONCURRENCY", "4"))
+SCRAPE_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "8"))
+
+stage_limits: Dict[str, asyncio.Semaphore] = {
+    "llm": asyncio.Semaphore(LLM_MAX_CONCURRENCY),
+    "search": asyncio.Semaphore(SERP_MAX_CONCURRENCY),
+    "scrape": asyncio.Semaphore(SCRAPE_MAX_CONCURRENCY),
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a pipeline run is shed instead of admitted."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class Lease:
+    """A held admission slot; `release()` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", key: str):
+        self._controller = controller
+        self._key = key
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self._key)
+
+
+# === Pipeline Admission Controller === #
+class AdmissionController:
+    """
+    Caps how many agent pipelines run at once in this worker process.
+
+    Up to `max_concurrent` runs are admitted immediately. Further requests wait in a
+    FIFO queue of at most `max_queue` entries for up to `max_wait` seconds; beyond that
+    they are rejected with 503. While several API keys are active, a key that already
+    holds its fair share of the running+queued slots is rejected with 429, so one client
+    cannot starve the others; a lone key may use them all. A positive `per_key_limit`
+    additionally caps every key at that many running or waiting requests.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_QUEUE_SECONDS,
+        per_key_limit: int = ADMISSION_PER_KEY_LIMIT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_key_limit = per_key_limit
+        self.running = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._per_key: Dict[str, int] = defaultdict(int)
+
+    def _key_limit(self, key: str) -> float:
+        limit = self.per_key_limit if self.per_key_limit > 0 else math.inf
+        others = len(self._per_key) - (key in self._per_key)
+        if others:
+            limit = min(limit, math.ceil((self.max_concurrent + self.max_queue) / (others + 1)))
+        return limit
+
+    async def acquire(self, key: str) -> Lease:
+        if self._per_key.get(key, 0) >= self._key_limit(key):
+            self.rejected += 1
+            raise AdmissionRejected(429, "Too many concurrent requests for this API key.")
+
+        if self.running < self.max_concurrent and not self._waiters:
+            self.running += 1
+            self._per_key[key] += 1
+            return Lease(self, key)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(503, "Agent is at capacity, try again shortly.", retry_after=int(self.max_wait) or 1)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._per_key[key] += 1
+        try:
+            await asyncio.wait_for(waiter, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter, key)
+            self.rejected += 1
+            logger.warning("[ADMISSION] Request waited %ss without a slot; shedding it.", self.max_wait)
+            raise AdmissionRejected(503, "Agent is at capacity, try again shortly.", retry_after=int(self.max_wait) or 1)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed to us just as we were cancelled: pass it on
+                self._release(key)
+            else:
+                self._abandon(waiter, key)
+            raise
+        return Lease(self, key)
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        lease = await self.acquire(key)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def _abandon(self, waiter: asyncio.Future, key: str) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._decrement_key(key)
+
+    def _release(self, key: str) -> None:
+        self._decrement_key(key)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the next waiter; `running` is unchanged
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def _decrement_key(self, key: str) -> None:
+        self._per_key[key] -= 1
+        if self._per_key[key] <= 0:
+            del self._per_key[key]
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiters),
+            "rejected": self.rejected,
+        }
+
+
+pipeline_admission = AdmissionController()
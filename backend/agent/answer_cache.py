@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import zlib
+import logging
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger("agent.answer_cache")
+
+# === Answer Cache Settings === #
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "1800"))
+# After the TTL, answers are still served this long while a background run refreshes them
+ANSWER_CACHE_STALE_SECONDS = float(os.getenv("ANSWER_CACHE_STALE_SECONDS", "7200"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+# Cosine similarity of query vectors at or above which a stored answer is reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.85"))
+# Share of content words (Jaccard) a match must have in common with the stored query
+ANSWER_CACHE_MIN_TERM_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_TERM_OVERLAP", "0.5"))
+VECTOR_DIMENSIONS = 512
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could for from give has have how i in is it its me of on or please "
+    "show tell that the this to was were what when where which who why will with you about".split()
+)
+# Words that flip a question's meaning; `\w+` splits "isn't" into "isn" + "t"
+_NEGATIONS = frozenset(
+    "not no never nor neither without cannot isn aren wasn weren don doesn didn won wouldn shouldn couldn "
+    "hasn haven hadn t".split()
+)
+_MONTHS = frozenset(
+    "january february march april may june july august september october november december "
+    "jan feb mar apr jun jul aug sep sept oct nov dec".split()
+)
+
+
+# === Query Vectorization === #
+def query_terms(query: str) -> List[str]:
+    """Lowercased content words with a naive plural strip, deduplicated and sorted (word order is ignored)."""
+    terms = set()
+    for token in _TOKEN_RE.findall(query.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.add(token)
+    return sorted(terms)
+
+
+def query_key(query: str) -> str:
+    """Queries with the same content words share one answer slot and one popularity count."""
+    return " ".join(query_terms(query))
+
+
+def guard_terms(terms: Iterable[str]) -> FrozenSet[str]:
+    """
+    Terms two queries must share exactly to share an answer: numbers, years, quarters
+    ("q1", "fy24"), months and negations. Near-identical wording says nothing about
+    whether "under 20000" and "under 30000" have the same answer.
+    """
+    return frozenset(
+        term for term in terms
+        if term in _NEGATIONS or term in _MONTHS or any(char.isdigit() for char in term)
+    )
+
+
+def vectorize_query(query: str, dimensions: int = VECTOR_DIMENSIONS) -> np.ndarray:
+    """
+    Embed a query as an L2-normalized hashed bag of character 3/4-grams plus whole words.
+
+    Character n-grams make "index"/"indices" and "trend"/"trends" overlap strongly, while
+    whole-word features keep unrelated queries that share a few letters apart.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for term in query_terms(query):
+        padded = f" {term} "
+        for n in (3, 4):
+            for i in range(len(padded) - n + 1):
+                vector[zlib.crc32(padded[i:i + n].encode("utf-8")) % dimensions] += 1.0
+        vector[zlib.crc32(b"w:" + term.encode("utf-8")) % dimensions] += 2.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+# === Semantic Answer Cache === #
+class AnswerHit:
+    """A stored answer matched by `lookup`: the query it was computed for, and how fresh it is."""
+
+    __slots__ = ("answer", "query", "similarity", "fresh_for")
+
+    def __init__(self, answer: dict, query: str, similarity: float, fresh_for: float):
+        self.answer = answer
+        self.query = query
+        self.similarity = similarity
+        self.fresh_for = fresh_for  # seconds until the answer goes stale; negative once it is
+
+    @property
+    def stale(self) -> bool:
+        return self.fresh_for <= 0
+
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of final answers, looked up by query similarity instead of exact text.
+
+    Query vectors live in one preallocated float32 matrix, so a lookup is a single
+    matrix-vector product plus an argmax over live (unexpired) rows. When the cache is
+    full, expired rows are reused first, then the least recently used one.
+
+    A row above the similarity threshold only matches if its query has the same guard
+    terms (numbers, dates, quarters, negations) and at least `min_overlap` of its content
+    words in common; otherwise the next most similar row is tried.
+
+    Answers are fresh for `ttl` seconds, then stale for `stale_seconds` more: still
+    served, but the caller is expected to refresh them (stale-while-revalidate). Adding
+    an answer for a query with the same content words replaces its row.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+        dimensions: int = VECTOR_DIMENSIONS,
+        stale_seconds: float = ANSWER_CACHE_STALE_SECONDS,
+        min_overlap: float = ANSWER_CACHE_MIN_TERM_OVERLAP,
+    ):
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((min(max_entries, 1024), dimensions), dtype=np.float32)
+        self._fresh_until = np.zeros(len(self._vectors), dtype=np.float64)
+        self._expires_at = np.zeros(len(self._vectors), dtype=np.float64)
+        self._last_used = np.zeros(len(self._vectors), dtype=np.float64)
+        self._queries: List[Optional[str]] = [None] * len(self._vectors)
+        self._terms: List[FrozenSet[str]] = [frozenset()] * len(self._vectors)
+        self._answers: List[Optional[dict]] = [None] * len(self._vectors)
+        self._slots: Dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires_at[:self._size] > time.time()))
+
+    def peek(self, query: str) -> Optional[AnswerHit]:
+        """The most similar unexpired (fresh or stale) answer, or None; counts nothing."""
+        if self._size == 0:
+            return None
+        now = time.time()
+        similarities = self._vectors[:self._size] @ vectorize_query(query, self._vectors.shape[1])
+        similarities[self._expires_at[:self._size] <= now] = -1.0
+        candidates = np.flatnonzero(similarities >= self.threshold)
+        if len(candidates) == 0:
+            return None
+        terms = frozenset(query_terms(query))
+        for row in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+            if self._matches(terms, self._terms[row]):
+                return AnswerHit(self._answers[row], self._queries[row], float(similarities[row]), self._fresh_until[row] - now)
+        return None
+
+    def _matches(self, terms: FrozenSet[str], stored: FrozenSet[str]) -> bool:
+        if guard_terms(terms) != guard_terms(stored):
+            return False
+        union = terms | stored
+        return not union or len(terms & stored) / len(union) >= self.min_overlap
+
+    def lookup(self, query: str) -> Optional[AnswerHit]:
+        """Like `peek`, for serving: counts hits, stale hits and misses and marks the row used."""
+        hit = self.peek(query)
+        if hit is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.stale_hits += hit.stale
+        self._last_used[self._slots[query_key(hit.query)]] = time.time()
+        logger.info(
+            "[ANSWER-CACHE] '%s' matched '%s' (similarity %.3f, fresh for %.0fs).",
+            query, hit.query, hit.similarity, hit.fresh_for,
+        )
+        return hit
+
+    def add(self, query: str, answer: dict) -> None:
+        now = time.time()
+        key = query_key(query)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._free_slot(now)
+            previous = self._queries[slot]
+            if previous is not None:
+                self._slots.pop(query_key(previous), None)
+            self._slots[key] = slot
+        self._vectors[slot] = vectorize_query(query, self._vectors.shape[1])
+        self._fresh_until[slot] = now + self.ttl
+        self._expires_at[slot] = now + self.ttl + self.stale_seconds
+        self._last_used[slot] = now
+        self._queries[slot] = query
+        self._terms[slot] = frozenset(query_terms(query))
+        self._answers[slot] = answer
+
+    def _free_slot(self, now: float) -> int:
+        if self._size < len(self._vectors):
+            self._size += 1
+            return self._size - 1
+        if len(self._vectors) < self.max_entries:
+            self._grow()
+            self._size += 1
+            return self._size - 1
+        # Full: reuse an expired row if any, else the least recently used one
+        recency = np.where(self._expires_at <= now, -np.inf, self._last_used)
+        return int(np.argmin(recency))
+
+    def _grow(self) -> None:
+        capacity = min(len(self._vectors) * 2, self.max_entries)
+        extra = capacity - len(self._vectors)
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self._vectors.shape[1]), dtype=np.float32)])
+        self._fresh_until = np.concatenate([self._fresh_until, np.zeros(extra)])
+        self._expires_at = np.concatenate([self._expires_at, np.zeros(extra)])
+        self._last_used = np.concatenate([self._last_used, np.zeros(extra)])
+        self._queries.extend([None] * extra)
+        self._terms.extend([frozenset()] * extra)
+        self._answers.extend([None] * extra)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+answer_cache: Optional[SemanticAnswerCache] = SemanticAnswerCache() if ANSWER_CACHE_ENABLED else None
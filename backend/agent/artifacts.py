@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import orjson
+import zstandard
+
+logger = logging.getLogger("agent.artifacts")
+
+# === Artifact Store Settings === #
+# "file" writes compressed per-task records; "none" turns artifact capture off entirely
+ARTIFACTS_SINK = os.getenv("ARTIFACTS_SINK", "file").lower()
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR", "artifacts")
+ARTIFACTS_QUEUE_MAX = int(os.getenv("ARTIFACTS_QUEUE_MAX", "256"))
+ARTIFACTS_MAX_BYTES = int(os.getenv("ARTIFACTS_MAX_BYTES", str(512 * 1024 * 1024)))
+ARTIFACTS_MAX_AGE_DAYS = float(os.getenv("ARTIFACTS_MAX_AGE_DAYS", "7"))
+ARTIFACTS_ZSTD_LEVEL = int(os.getenv("ARTIFACTS_ZSTD_LEVEL", "3"))
+# Enforce retention once every N records rather than after every write
+RETENTION_EVERY_N_WRITES = 50
+RECORD_SUFFIX = ".json.zst"
+
+
+# === Per-Task Artifact Record === #
+class ArtifactRecord:
+    """
+    Everything one pipeline run wants to keep for auditing, stored as a single record.
+
+    `append()` collects list-valued artifacts (one SERP result set per sub-query);
+    `put()` sets single-valued ones. Payloads are referenced, not copied, and are
+    serialized on the writer thread after the run has finished with them.
+    """
+
+    __slots__ = ("task_id", "query", "created_at", "artifacts")
+
+    def __init__(self, task_id: str, query: str):
+        self.task_id = task_id
+        self.query = query
+        self.created_at = time.time()
+        self.artifacts: Dict[str, Any] = {}
+
+    def append(self, kind: str, payload: Any) -> None:
+        self.artifacts.setdefault(kind, []).append(payload)
+
+    def put(self, kind: str, payload: Any) -> None:
+        self.artifacts[kind] = payload
+
+
+# === Sinks === #
+class ArtifactSink:
+    """Base sink: accepts finished records and drops them. Subclass `submit()` to store them."""
+
+    def open(self, task_id: str, query: str) -> ArtifactRecord:
+        return ArtifactRecord(task_id, query)
+
+    def submit(self, record: ArtifactRecord, status: str) -> None:
+        pass
+
+    def close(self, timeout: float = 5.0) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class ZstdFileArtifactSink(ArtifactSink):
+    """
+    Writes one zstd-compressed JSON file per task under `root/YYYY-MM-DD/`.
+
+    `submit()` never blocks the event loop: records go onto a bounded queue drained by
+    a single writer thread, and are dropped (and counted) when the queue is full. The
+    writer keeps the directory under `max_bytes` and `max_age_days`, oldest files first.
+    """
+
+    def __init__(
+        self,
+        root: str = ARTIFACTS_DIR,
+        queue_max: int = ARTIFACTS_QUEUE_MAX,
+        max_bytes: int = ARTIFACTS_MAX_BYTES,
+        max_age_days: float = ARTIFACTS_MAX_AGE_DAYS,
+        level: int = ARTIFACTS_ZSTD_LEVEL,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.level = level
+        self.written = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.bytes_written = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_max)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, record: ArtifactRecord, status: str) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((record, status))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("[ARTIFACTS] Writer queue full, dropped artifacts for task %s.", record.task_id)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued records and stop the writer thread."""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("[ARTIFACTS] Writer queue still full at shutdown; some records were not saved.")
+            return
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "deleted": self.deleted,
+            "bytes_written": self.bytes_written,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+                    self._thread.start()
+
+    # --- writer thread --- #
+    def _run(self) -> None:
+        compressor = zstandard.ZstdCompressor(level=self.level)
+        self._enforce_retention()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(compressor, *item)
+            except Exception as e:
+                logger.exception("[ARTIFACTS] Failed to write artifacts for task %s: %s", item[0].task_id, e)
+            if self.written % RETENTION_EVERY_N_WRITES == 0:
+                self._enforce_retention()
+
+    def _write(self, compressor: zstandard.ZstdCompressor, record: ArtifactRecord, status: str) -> None:
+        created = datetime.fromtimestamp(record.created_at, tz=timezone.utc)
+        directory = self.root / created.strftime("%Y-%m-%d")
+        directory.mkdir(parents=True, exist_ok=True)
+        data = compressor.compress(orjson.dumps(
+            {
+                "task_id": record.task_id,
+                "query": record.query,
+                "status": status,
+                "created_at": created.isoformat(),
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "artifacts": record.artifacts,
+            },
+            default=str,
+        ))
+        path = directory / f"{record.task_id}{RECORD_SUFFIX}"
+        # Write-then-rename so readers never see a partial record
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self.written += 1
+        self.bytes_written += len(data)
+        logger.info("[ARTIFACTS] Saved artifacts for task %s to %s (%s bytes).", record.task_id, path, len(data))
+
+    def _enforce_retention(self) -> None:
+        files = []
+        for path in self.root.glob(f"*/*{RECORD_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        cutoff = time.time() - self.max_age_seconds
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                self.deleted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        for directory in self.root.glob("*/"):
+            try:
+                directory.rmdir()  # only succeeds once a day directory is empty
+            except OSError:
+                pass
+
+
+def read_artifact(path: str) -> dict:
+    """Load one stored record (for debugging and fixture replay)."""
+    with open(path, "rb") as f:
+        return orjson.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+
+
+def find_artifacts(root: str) -> List[str]:
+    return sorted(str(path) for path in Path(root).glob(f"**/*{RECORD_SUFFIX}"))
+
+
+def create_sink(kind: str = ARTIFACTS_SINK) -> ArtifactSink:
+    if kind == "none":
+        return ArtifactSink()
+    if kind != "file":
+        logger.warning("[ARTIFACTS] Unknown ARTIFACTS_SINK '%s', using 'file'.", kind)
+    sink = ZstdFileArtifactSink()
+    atexit.register(sink.close)
+    return sink
+
+
+artifact_sink: ArtifactSink = create_sink()
+
+
+if __name__ == "__main__":
+    # Pretty-print stored records: python -m agent.artifacts artifacts/2025-07-21/<task_id>.json.zst
+    for record_path in sys.argv[1:]:
+        sys.stdout.buffer.write(orjson.dumps(read_artifact(record_path), option=orjson.OPT_INDENT_2) + b"\n")
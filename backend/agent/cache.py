@@ -0,0 +1,348 @@
+import os
+import time
+import sqlite3
+import hashlib
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import orjson
+import zstandard
+from cachetools import TLRUCache
+
+from agent.urls import canonical_host, canonicalize_url
+
+logger = logging.getLogger("agent.cache")
+
+# === Cache Settings === #
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "cache/agent_cache.sqlite3")
+SERP_CACHE_ENABLED = os.getenv("SERP_CACHE_ENABLED", "true").lower() == "true"
+SERP_CACHE_TTL_SECONDS = float(os.getenv("SERP_CACHE_TTL_SECONDS", "21600"))
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "5000"))
+# Expired results are kept this much longer, served only while SerpAPI is failing or rate limited
+SERP_CACHE_STALE_SECONDS = float(os.getenv("SERP_CACHE_STALE_SECONDS", "86400"))
+SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "true").lower() == "true"
+SCRAPE_CACHE_DEFAULT_TTL_SECONDS = float(os.getenv("SCRAPE_CACHE_DEFAULT_TTL_SECONDS", "21600"))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", "20000"))
+# Freshness per domain (suffix match), e.g. "nseindia.com=900,moneycontrol.com=1800"
+SCRAPE_CACHE_DOMAIN_TTLS = os.getenv("SCRAPE_CACHE_DOMAIN_TTLS", "")
+# Per-document extraction notes (map-reduce summarization); keyed by content, so the TTL only bounds space
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "86400"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "20000"))
+# Entries kept in the per-process memory tier in front of SQLite
+MEMORY_CACHE_ENTRIES = int(os.getenv("MEMORY_CACHE_ENTRIES", "256"))
+# Run expiry/LRU trimming once every N writes rather than on every write
+EVICT_EVERY_N_WRITES = 50
+
+
+# === Shared SQLite TTL Store === #
+class SqliteTTLStore:
+    """
+    Key/value store backed by a SQLite table, shared by all uvicorn workers and
+    persistent across restarts.
+
+    Every entry carries its own expiry time. Reads refresh `accessed_at`, and the
+    table is trimmed to `max_entries` by evicting the least recently used rows. A
+    small per-process TLRU cache sits in front of SQLite for the hottest keys.
+    Expired rows linger for `stale_seconds`, readable only with `allow_stale=True`.
+    The database is opened and the table created on first use (in the worker thread
+    that runs the read or write), so importing the module touches no files.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        max_entries: int,
+        path: str = CACHE_DB_PATH,
+        memory_entries: int = MEMORY_CACHE_ENTRIES,
+        stale_seconds: float = 0.0,
+    ):
+        self.table = table
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._memory = TLRUCache(maxsize=memory_entries, ttu=lambda _key, value, _now: value[1], timer=time.time)
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database and create the table on first use; callers hold `self._lock`."""
+        if self._conn is None:
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed_at ON {self.table} (accessed_at)")
+            self._conn = conn
+            logger.info("[CACHE] Opened '%s' in %s.", self.table, self._path)
+        return self._conn
+
+    # --- blocking primitives (run in a worker thread) --- #
+    def get_blocking(self, key: str, allow_stale: bool = False) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached[0]
+
+            conn = self._connect()
+            row = conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now and allow_stale and row[1] + self.stale_seconds > now:
+                self.stale_hits += 1
+                return row[0]
+            if row is None or row[1] <= now:
+                if row is not None and row[1] + self.stale_seconds <= now:
+                    conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._memory[key] = (row[0], row[1])
+            self.hits += 1
+            return row[0]
+
+    def set_blocking(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._connect().execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._memory[key] = (value, expires_at)
+            self._writes += 1
+            if self._writes % EVICT_EVERY_N_WRITES == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now - self.stale_seconds,))
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            logger.info("[CACHE] Evicted %s least recently used entries from '%s'.", overflow, self.table)
+
+    # --- async API --- #
+    async def get(self, key: str, allow_stale: bool = False) -> Optional[bytes]:
+        return await asyncio.to_thread(self.get_blocking, key, allow_stale)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self.set_blocking, key, value, ttl)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "stale_hits": self.stale_hits,
+        }
+
+
+def _hash_key(*parts: Any) -> str:
+    return hashlib.sha256(orjson.dumps(parts)).hexdigest()
+
+
+# === SERP Result Cache === #
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different spellings share an entry."""
+    return " ".join(query.lower().split())
+
+
+class SerpCache:
+    """Caches SerpAPI organic results keyed by normalized query, location, gl and hl."""
+
+    def __init__(self, store: SqliteTTLStore, ttl: float = SERP_CACHE_TTL_SECONDS):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(query: str, location: str, gl: str, hl: str) -> str:
+        return _hash_key("serp", normalize_query(query), location, gl, hl)
+
+    async def get(self, query: str, location: str, gl: str, hl: str, allow_stale: bool = False) -> Optional[list]:
+        try:
+            raw = await self.store.get(self.key(query, location, gl, hl), allow_stale)
+        except Exception as e:
+            logger.warning("[CACHE] SERP cache read failed: %s", e)
+            return None
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, query: str, location: str, gl: str, hl: str, results: list) -> None:
+        try:
+            await self.store.set(self.key(query, location, gl, hl), orjson.dumps(results), self.ttl)
+        except Exception as e:
+            logger.warning("[CACHE] SERP cache write failed: %s", e)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+# === Scrape (Markdown) Cache === #
+# Market data pages go stale within minutes; evergreen pages can be reused for hours
+DEFAULT_DOMAIN_TTLS = {
+    "nseindia.com": 900,
+    "bseindia.com": 900,
+    "moneycontrol.com": 1800,
+    "economictimes.indiatimes.com": 1800,
+    "groww.in": 3600,
+}
+
+
+def parse_domain_ttls(spec: str) -> dict:
+    """Parse a "domain=seconds,domain=seconds" override string."""
+    ttls = {}
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        domain, _, seconds = pair.partition("=")
+        try:
+            ttls[domain.strip().lower()] = float(seconds)
+        except ValueError:
+            logger.warning("[CACHE] Ignoring invalid domain TTL entry: '%s'", pair)
+    return ttls
+
+
+class ScrapeCache:
+    """
+    Caches scraped markdown keyed by canonical URL, stored zstd-compressed.
+
+    Freshness is decided per domain: the longest matching suffix in `domain_ttls`
+    wins, otherwise `default_ttl` applies.
+    """
+
+    def __init__(self, store: SqliteTTLStore, domain_ttls: dict, default_ttl: float = SCRAPE_CACHE_DEFAULT_TTL_SECONDS):
+        self.store = store
+        self.domain_ttls = domain_ttls
+        self.default_ttl = default_ttl
+        self._compressor = threading.local()
+
+    @staticmethod
+    def key(url: str) -> str:
+        # "v2": entries keyed before "ref"/"src"/"source" were kept in canonical URLs may hold another page
+        return _hash_key("scrape", 2, canonicalize_url(url))
+
+    def ttl_for(self, url: str) -> float:
+        host = canonical_host(url)
+        best = None
+        for domain in self.domain_ttls:
+            if (host == domain or host.endswith("." + domain)) and (best is None or len(domain) > len(best)):
+                best = domain
+        return self.domain_ttls[best] if best is not None else self.default_ttl
+
+    def _codecs(self):
+        # zstd contexts are not thread-safe; keep one pair per worker thread
+        local = self._compressor
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(level=3)
+            local.decompressor = zstandard.ZstdDecompressor()
+        return local.compressor, local.decompressor
+
+    def _get_many_blocking(self, urls: list) -> dict:
+        _, decompressor = self._codecs()
+        found = {}
+        for url in urls:
+            raw = self.store.get_blocking(self.key(url))
+            if raw is not None:
+                found[url] = decompressor.decompress(raw).decode("utf-8")
+        return found
+
+    def _set_many_blocking(self, documents: dict) -> None:
+        compressor, _ = self._codecs()
+        for url, markdown in documents.items():
+            self.store.set_blocking(self.key(url), compressor.compress(markdown.encode("utf-8")), self.ttl_for(url))
+
+    async def get_many(self, urls: list) -> dict:
+        """Return {url: markdown} for every URL with a fresh cached copy."""
+        try:
+            return await asyncio.to_thread(self._get_many_blocking, urls)
+        except Exception as e:
+            logger.warning("[CACHE] Scrape cache read failed: %s", e)
+            return {}
+
+    async def set_many(self, documents: dict) -> None:
+        """Store {url: markdown} pairs, each with its domain's freshness TTL."""
+        try:
+            await asyncio.to_thread(self._set_many_blocking, documents)
+        except Exception as e:
+            logger.warning("[CACHE] Scrape cache write failed: %s", e)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+# === Per-Document Summary Cache === #
+class SummaryCache:
+    """
+    Caches the notes extracted from one document for one query intent.
+
+    Keyed by a hash of the document's markdown plus the intent string, so a page
+    that changes gets new notes, and the same page read for the same kind of
+    question is only distilled once.
+    """
+
+    def __init__(self, store: SqliteTTLStore, ttl: float = SUMMARY_CACHE_TTL_SECONDS):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def key(markdown: str, intent: str) -> str:
+        return _hash_key("summary", hashlib.sha256(markdown.encode("utf-8")).hexdigest(), intent)
+
+    def _get_many_blocking(self, keys: list) -> dict:
+        found = {}
+        for key in keys:
+            raw = self.store.get_blocking(key)
+            if raw is not None:
+                found[key] = raw.decode("utf-8")
+        return found
+
+    def _set_many_blocking(self, notes: dict) -> None:
+        for key, text in notes.items():
+            self.store.set_blocking(key, text.encode("utf-8"), self.ttl)
+
+    async def get_many(self, keys: list) -> dict:
+        """Return {key: notes} for every key with cached notes."""
+        try:
+            return await asyncio.to_thread(self._get_many_blocking, keys)
+        except Exception as e:
+            logger.warning("[CACHE] Summary cache read failed: %s", e)
+            return {}
+
+    async def set_many(self, notes: dict) -> None:
+        try:
+            await asyncio.to_thread(self._set_many_blocking, notes)
+        except Exception as e:
+            logger.warning("[CACHE] Summary cache write failed: %s", e)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+serp_cache: Optional[SerpCache] = (
+    SerpCache(SqliteTTLStore("serp_cache", max_entries=SERP_CACHE_MAX_ENTRIES, stale_seconds=SERP_CACHE_STALE_SECONDS)) if SERP_CACHE_ENABLED else None
+)
+scrape_cache: Optional[ScrapeCache] = (
+    ScrapeCache(
+        SqliteTTLStore("scrape_cache", max_entries=SCRAPE_CACHE_MAX_ENTRIES),
+        domain_ttls={**DEFAULT_DOMAIN_TTLS, **parse_domain_ttls(SCRAPE_CACHE_DOMAIN_TTLS)},
+    )
+    if SCRAPE_CACHE_ENABLED else None
+)
+summary_cache: Optional[SummaryCache] = (
+    SummaryCache(SqliteTTLStore("summary_cache", max_entries=SUMMARY_CACHE_MAX_ENTRIES)) if SUMMARY_CACHE_ENABLED else None
+)
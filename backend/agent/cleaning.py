@@ -0,0 +1,176 @@
+import re
+import heapq
+import logging
+from collections import Counter
+from typing import Dict, List, Set
+
+from agent.passages import estimate_tokens, utf8_size
+
+logger = logging.getLogger("agent.cleaning")
+
+# === Cleaning Settings === #
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 32              # bottom-k MinHash sketch size per paragraph
+NEAR_DUPLICATE_JACCARD = 0.8  # estimated similarity at which a paragraph is dropped
+MIN_DEDUPE_WORDS = 25         # shorter paragraphs are never considered duplicates
+BOILERPLATE_MAX_LINE_CHARS = 200
+BOILERPLATE_WORD_SHARE = 0.5  # share of a line's words that must be boilerplate phrases to drop it
+LINK_FARM_RATIO = 0.6         # share of a line taken up by link markup
+
+_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\(([^)\s]*)(?:\s+\"[^\"]*\")?\)")
+_BARE_URL_LINE_RE = re.compile(r"^\s*(?:[-*+]\s+)?<?https?://\S+>?\s*$")
+_VIDEO_HOST_RE = re.compile(r"(?:youtube\.com|youtu\.be|vimeo\.com|dailymotion\.com)", re.IGNORECASE)
+_BOILERPLATE_RE = re.compile(
+    r"\b(?:(?:(?:we use|accept(?: all)?|manage) )?cookies?|privacy policy|terms (?:of|&) (?:use|service)|all rights reserved|subscribe|newsletter|"
+    r"sign ?(?:in|up)|log ?in|download (?:the |our )?app|follow us|advertisement|sponsored|skip to (?:main )?content|"
+    r"share (?:this|on)|back to top|read more)\b",
+    re.IGNORECASE,
+)
+# Words that carry no content on their own; outside boilerplate phrases they are not counted
+_FILLER_WORDS = frozenset(
+    "a an and are as at be by for from in is it of on or our the this to up us we with you your all more now here free".split()
+)
+_WS_RE = re.compile(r"[ \t ]+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def _is_boilerplate(line: str) -> bool:
+    """
+    True for short lines made up mostly of boilerplate phrases ("Subscribe to our newsletter",
+    "Accept all cookies"), but not for content that merely mentions one ("Retail investors
+    can subscribe to the IPO until June 5.").
+    """
+    if len(line) > BOILERPLATE_MAX_LINE_CHARS:
+        return False
+    phrases = _BOILERPLATE_RE.findall(line)
+    if not phrases:
+        return False
+    boilerplate = sum(len(_WORD_RE.findall(phrase)) for phrase in phrases)
+    rest = _WORD_RE.findall(_BOILERPLATE_RE.sub(" ", line).lower())
+    content = sum(1 for word in rest if word not in _FILLER_WORDS)
+    return boilerplate >= BOILERPLATE_WORD_SHARE * (boilerplate + content)
+
+
+def _strip_links(match: re.Match) -> str:
+    text, url = match.group(1), match.group(2)
+    # Keep video links intact: the summarizer reports them in its "videos" field
+    return match.group(0) if _VIDEO_HOST_RE.search(url) else text
+
+
+# === Per-Request Document Cleaner === #
+class DocumentCleaner:
+    """
+    Strips boilerplate from scraped markdown and drops paragraphs that near-duplicate a
+    paragraph already seen in an earlier document of the same request.
+
+    Each document is processed in a single pass over its lines: images and link-only
+    lines are dropped, short lines made up mostly of boilerplate (cookie banners, sign-in
+    prompts, share bars) are removed, inline links are reduced to their text and whitespace is
+    collapsed. Completed paragraphs are checked against a bottom-k MinHash index.
+    Create one instance per request; byte and token savings accumulate in `stats()`.
+    """
+
+    def __init__(self):
+        self._sketches: List[Set[int]] = []
+        self._postings: Dict[int, List[int]] = {}
+        self.documents = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicate_paragraphs = 0
+
+    def clean(self, markdown: str) -> str:
+        self.documents += 1
+        self.bytes_in += utf8_size(markdown)
+        self.tokens_in += estimate_tokens(markdown)
+
+        paragraphs: List[str] = []
+        current: List[str] = []
+        for raw_line in markdown.splitlines():
+            line = raw_line.strip()
+            if not line:
+                if current:
+                    self._flush(current, paragraphs)
+                    current = []
+                continue
+            line = self._clean_line(line)
+            if line:
+                current.append(line)
+        if current:
+            self._flush(current, paragraphs)
+
+        cleaned = "\n\n".join(paragraphs)
+        self.bytes_out += utf8_size(cleaned)
+        self.tokens_out += estimate_tokens(cleaned)
+        return cleaned
+
+    def _clean_line(self, line: str) -> str:
+        if _BARE_URL_LINE_RE.match(line):
+            return ""
+        line = _IMAGE_RE.sub("", line)
+        if not line:
+            return ""
+
+        links = list(_LINK_RE.finditer(line))
+        if links:
+            link_chars = sum(m.end() - m.start() for m in links)
+            if link_chars / len(line) >= LINK_FARM_RATIO and not any(_VIDEO_HOST_RE.search(m.group(2)) for m in links):
+                return ""
+            line = _LINK_RE.sub(_strip_links, line)
+
+        line = _WS_RE.sub(" ", line).strip()
+        if _is_boilerplate(line):
+            return ""
+        # Lines left with only markdown punctuation (list bullets, emphasis); table rules stay
+        if not line.startswith("|") and not any(ch.isalnum() for ch in line):
+            return ""
+        return line
+
+    def _flush(self, lines: List[str], paragraphs: List[str]) -> None:
+        paragraph = "\n".join(lines)
+        if self._is_near_duplicate(paragraph):
+            self.duplicate_paragraphs += 1
+            return
+        paragraphs.append(paragraph)
+
+    def _is_near_duplicate(self, paragraph: str) -> bool:
+        words = _WORD_RE.findall(paragraph.lower())
+        if len(words) < MIN_DEDUPE_WORDS:
+            return False
+
+        shingle_hashes = {hash(" ".join(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+        sketch = set(heapq.nsmallest(SKETCH_SIZE, shingle_hashes))
+
+        candidates = Counter(idx for h in sketch for idx in self._postings.get(h, ()))
+        for idx, shared in candidates.most_common():
+            # Bottom-k estimate: share of the union's k smallest hashes present in both sketches
+            other = self._sketches[idx]
+            union_bottom = heapq.nsmallest(SKETCH_SIZE, sketch | other)
+            both = sum(1 for h in union_bottom if h in sketch and h in other)
+            if both / len(union_bottom) >= NEAR_DUPLICATE_JACCARD:
+                return True
+            if shared / SKETCH_SIZE < NEAR_DUPLICATE_JACCARD / 2:
+                break
+
+        idx = len(self._sketches)
+        self._sketches.append(sketch)
+        for h in sketch:
+            self._postings.setdefault(h, []).append(idx)
+        return False
+
+    def close(self) -> None:
+        """Drop the duplicate index once the request's last document is cleaned; stats are kept."""
+        self._sketches = []
+        self._postings = {}
+
+    def stats(self) -> dict:
+        return {
+            "documents": self.documents,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "tokens_saved": self.tokens_in - self.tokens_out,
+            "duplicate_paragraphs": self.duplicate_paragraphs,
+        }
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Optional
+
+import httpx
+
+logger = logging.getLogger("agent.clients")
+
+# === Upstream Client Settings === #
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+# Keep-alive connections per upstream
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+# Build the Firecrawl and Gemini clients in the background right after startup
+CLIENTS_PREWARM = os.getenv("CLIENTS_PREWARM", "true").lower() == "true"
+# Swap SerpAPI, Firecrawl and Gemini for offline stand-ins (load tests, local development)
+AGENT_FAKE_SERVICES = os.getenv("AGENT_FAKE_SERVICES", "false").lower() == "true"
+
+
+# === SerpAPI === #
+class SerpApiClient:
+    """
+    Async SerpAPI client on a pooled keep-alive connection.
+
+    Sends the same request as `serpapi.GoogleSearch(params).get_dict()` without a thread
+    per call or a TLS handshake per search. Error payloads (`{"error": ...}`) are
+    returned as-is, like the official client does, except for throttling (429) and
+    server errors, which raise `httpx.HTTPStatusError` so agent.upstream can retry them.
+    """
+
+    def __init__(self, api_key: Optional[str], http: httpx.AsyncClient):
+        self.api_key = api_key
+        self.http = http
+
+    async def search(self, params: dict) -> dict:
+        response = await self.http.get(SERPAPI_URL, params={**params, "api_key": self.api_key, "output": "json", "source": "python"})
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response.json()
+
+
+# === Lazy Client Registry === #
+class ClientRegistry:
+    """
+    Creates each upstream client on first use and owns its connection pool.
+
+    Importing the agent therefore no longer imports langchain/Firecrawl or opens
+    connections, and every worker process builds its own clients after it starts.
+    `prewarm()` builds the heavy clients off the event loop once the app is serving;
+    `aclose()` releases the pools on shutdown (both called from the FastAPI lifespan).
+    """
+
+    def __init__(self, fake_services: bool = AGENT_FAKE_SERVICES):
+        self.fake_services = fake_services
+        self._lock = threading.Lock()
+        self._fakes = None
+        self._crawler = None
+        self._llm = None
+        self._serpapi: Optional[Any] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._local_fetcher = None
+
+    def _get_fakes(self):
+        if self._fakes is None:
+            from agent.fakes import FakeServiceConfig, FakeServices
+
+            self._fakes = FakeServices(FakeServiceConfig.from_env())
+            logger.warning("[CLIENTS] AGENT_FAKE_SERVICES is on: using offline SerpAPI/Firecrawl/Gemini stand-ins.")
+        return self._fakes
+
+    def crawler(self):
+        if self._crawler is None:
+            with self._lock:
+                if self._crawler is None:
+                    if self.fake_services:
+                        self._crawler = self._get_fakes().crawler
+                    else:
+                        from agent.firecrawl_client import PooledFirecrawlApp
+
+                        self._crawler = PooledFirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY"), pool_size=HTTP_POOL_SIZE)
+                        logger.info("[CLIENTS] Firecrawl client ready.")
+        return self._crawler
+
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    if self.fake_services:
+                        self._llm = self._get_fakes().llm
+                    else:
+                        # The Gemini client keeps one gRPC channel open for its lifetime
+                        from langchain_google_genai import ChatGoogleGenerativeAI
+
+                        self._llm = ChatGoogleGenerativeAI(model=LLM_MODEL, google_api_key=os.getenv("GOOGLE_API_KEY"))
+                        logger.info("[CLIENTS] Gemini client ready (%s).", LLM_MODEL)
+        return self._llm
+
+    def serpapi(self):
+        """Must be called from the event loop the client will be used on."""
+        if self._serpapi is None:
+            if self.fake_services:
+                self._serpapi = self._get_fakes().serpapi
+            else:
+                self._http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(30.0, connect=10.0),
+                    limits=httpx.Limits(
+                        max_connections=HTTP_POOL_SIZE,
+                        max_keepalive_connections=HTTP_POOL_SIZE,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+                    ),
+                )
+                self._serpapi = SerpApiClient(os.getenv("SERPAI_API_KEY"), self._http)
+        return self._serpapi
+
+    def local_fetcher(self):
+        """Must be called from the event loop the fetcher will be used on."""
+        if self._local_fetcher is None:
+            from agent.local_fetch import new_local_fetcher
+
+            self._local_fetcher = new_local_fetcher()
+        return self._local_fetcher
+
+    async def prewarm(self) -> None:
+        """Build the Firecrawl and Gemini clients (and their imports) in worker threads, and start the local fetcher's converters."""
+        from agent.local_fetch import LOCAL_FETCH_ENABLED
+
+        try:
+            await asyncio.gather(
+                asyncio.to_thread(self.crawler),
+                asyncio.to_thread(self.llm),
+                *([self.local_fetcher().prewarm()] if LOCAL_FETCH_ENABLED else []),
+            )
+        except Exception as e:
+            # Not fatal: the failing client is retried, and the error surfaced, on first use
+            logger.warning("[CLIENTS] Prewarm failed: %s", e)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self._serpapi = None
+        if self._local_fetcher is not None:
+            await self._local_fetcher.aclose()
+            self._local_fetcher = None
+        close = getattr(self._crawler, "close", None)
+        if close is not None:
+            close()
+        self._crawler = None
+
+
+clients = ClientRegistry()
@@ -0,0 +1,207 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from agent.metrics import hedged_requests
+
+logger = logging.getLogger("agent.deadline")
+
+T = TypeVar("T")
+
+# === Latency Budget Settings === #
+# End-to-end budget for one pipeline run; requests may ask for less (or more) per call
+PIPELINE_BUDGET_SECONDS = float(os.getenv("PIPELINE_BUDGET_SECONDS", "45"))
+# Longest share of the budget the breakdown and search stages may each take...
+BUDGET_BREAKDOWN_SHARE = float(os.getenv("BUDGET_BREAKDOWN_SHARE", "0.2"))
+BUDGET_SEARCH_SHARE = float(os.getenv("BUDGET_SEARCH_SHARE", "0.2"))
+# ...and the share kept back for summarization; scraping gets whatever is left before it
+BUDGET_SUMMARIZE_SHARE = float(os.getenv("BUDGET_SUMMARIZE_SHARE", "0.3"))
+
+# === Hedging Settings === #
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+# A backup request is sent once the first has been outstanding for this latency quantile
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+# No hedging until an operation has this many samples to estimate the quantile from
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.2"))
+LATENCY_WINDOW = 256
+
+
+# === Per-Request Latency Budget === #
+class LatencyBudget:
+    """
+    End-to-end time budget for one pipeline run, split across its stages.
+
+    Early stages get at most a fixed share of the total (`allot()`); the scrape stage
+    runs until only the summarization reserve is left (`remaining(reserve=...)`), so
+    time an early stage does not use goes to scraping.
+    """
+
+    def __init__(self, total_seconds: float = PIPELINE_BUDGET_SECONDS):
+        self._loop = asyncio.get_running_loop()
+        self.total = total_seconds
+        self.started_at = self._loop.time()
+        self.expires_at = self.started_at + total_seconds
+
+    def elapsed(self) -> float:
+        return self._loop.time() - self.started_at
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Seconds left before the budget is spent, keeping back `reserve` (a share of the total)."""
+        return max(0.0, self.expires_at - reserve * self.total - self._loop.time())
+
+    def allot(self, share: float) -> float:
+        """Time limit for a stage allowed `share` of the total budget."""
+        return min(share * self.total, self.remaining())
+
+
+# === Latency Tracking === #
+class LatencyTracker:
+    """Sliding window of recent latencies for one operation, used to pick the hedge delay."""
+
+    def __init__(self, name: str, window: int = LATENCY_WINDOW):
+        self.name = name
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait before sending a backup request, or None to not hedge."""
+        if not HEDGE_ENABLED or len(self._samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_SECONDS, self.quantile(HEDGE_QUANTILE))
+
+    def stats(self) -> Dict[str, float]:
+        return {"samples": len(self._samples), "p50": self.quantile(0.5) or 0.0, "p95": self.quantile(0.95) or 0.0}
+
+
+# === Hedged Requests === #
+async def hedged(tracker: LatencyTracker, call: Callable[[], Awaitable[T]]) -> T:
+    """
+    Await `call()`, sending one backup `call()` if the first is slower than the tracked p95.
+
+    Whichever attempt succeeds first wins and the other is cancelled. An attempt that
+    fails does not end the race while the other is still running.
+
+    Args:
+        tracker (LatencyTracker): Latency history of this operation; updated with the winner.
+        call (Callable[[], Awaitable[T]]): Starts one attempt; must be safe to run twice.
+
+    Returns:
+        T: The first successful result. If every attempt fails, the last error is raised.
+    """
+    loop = asyncio.get_running_loop()
+    delay = tracker.hedge_delay()
+    started = {asyncio.ensure_future(call()): loop.time()}
+    primary = next(iter(started))
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(started, timeout=delay)
+            if not done:
+                started[asyncio.ensure_future(call())] = loop.time()
+                hedged_requests.inc(tracker.name, "launched")
+                logger.info("[HEDGE] '%s' slower than %.2fs, sent a backup request.", tracker.name, delay)
+
+        pending = set(started)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    tracker.observe(loop.time() - started[attempt])
+                    if attempt is not primary:
+                        hedged_requests.inc(tracker.name, "won")
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    finally:
+        for attempt in started:
+            attempt.cancel()
+
+
+_EXHAUSTED = object()
+
+
+async def _first_item(stream: AsyncIterator[T]):
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return _EXHAUSTED
+
+
+async def hedged_stream(tracker: LatencyTracker, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+    """
+    Streaming variant of `hedged()`: races on time to the first item.
+
+    If no item arrives within the tracked p95, a second stream is opened; the one that
+    produces an item first is consumed to the end and the other is closed.
+
+    Args:
+        tracker (LatencyTracker): Time-to-first-item history of this operation.
+        open_stream (Callable[[], AsyncIterator[T]]): Opens one stream (e.g. `llm.astream(prompt)`).
+
+    Yields:
+        T: Items of the winning stream.
+    """
+    loop = asyncio.get_running_loop()
+    delay = tracker.hedge_delay()
+    streams = {}
+
+    def start() -> None:
+        stream = open_stream()
+        streams[asyncio.ensure_future(_first_item(stream))] = (stream, loop.time())
+
+    start()
+    primary = next(iter(streams))
+    winner = None
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(streams, timeout=delay)
+            if not done:
+                start()
+                hedged_requests.inc(tracker.name, "launched")
+                logger.info("[HEDGE] '%s' first chunk slower than %.2fs, opened a backup stream.", tracker.name, delay)
+
+        pending = set(streams)
+        error: Optional[BaseException] = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    winner = attempt
+                    break
+                error = attempt.exception()
+        if winner is None:
+            raise error
+    finally:
+        for attempt, (stream, _) in streams.items():
+            if attempt is winner:
+                continue
+            attempt.cancel()
+            await asyncio.gather(attempt, return_exceptions=True)
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+    stream, started_at = streams[winner]
+    tracker.observe(loop.time() - started_at)
+    if winner is not primary:
+        hedged_requests.inc(tracker.name, "won")
+    first = winner.result()
+    if first is _EXHAUSTED:
+        return
+    yield first
+    async for item in stream:
+        yield item
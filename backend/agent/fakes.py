@@ -0,0 +1,350 @@
+import os
+import re
+import glob
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent.artifacts import find_artifacts, read_artifact
+from agent.cache import normalize_query
+from agent.upstream import UpstreamError
+
+logger = logging.getLogger("agent.fakes")
+
+_WORDS = (
+    "market index trend growth shares investors quarter earnings policy rate inflation sector banking "
+    "technology energy analysts forecast volatility rally decline outlook economy exports demand supply "
+    "report data revenue margin capital fund valuation momentum support resistance weekly monthly annual"
+).split()
+
+
+# === Latency Model === #
+@dataclass
+class LatencyProfile:
+    """Log-normal latency given its median and p95, in seconds."""
+
+    median: float
+    p95: float
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95, self.median) / self.median) / 1.645
+        return rng.lognormvariate(math.log(self.median), sigma)
+
+
+def _profile_from_env(name: str, median_ms: float, p95_ms: float) -> LatencyProfile:
+    return LatencyProfile(
+        median=float(os.getenv(f"FAKE_{name}_LATENCY_MS", str(median_ms))) / 1000,
+        p95=float(os.getenv(f"FAKE_{name}_P95_MS", str(p95_ms))) / 1000,
+    )
+
+
+# === Fake Service Settings === #
+@dataclass
+class FakeServiceConfig:
+    serp_latency: LatencyProfile = field(default_factory=lambda: LatencyProfile(0.8, 2.5))
+    scrape_latency: LatencyProfile = field(default_factory=lambda: LatencyProfile(2.0, 8.0))  # per document
+    llm_latency: LatencyProfile = field(default_factory=lambda: LatencyProfile(1.5, 4.0))  # per call
+    serp_failure_rate: float = 0.0
+    scrape_failure_rate: float = 0.05  # per URL
+    llm_failure_rate: float = 0.0
+    doc_min_chars: int = 4000
+    doc_max_chars: int = 40000
+    llm_chunk_chars: int = 40
+    fixtures_dir: Optional[str] = None
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeServiceConfig":
+        seed = os.getenv("FAKE_SEED")
+        return cls(
+            serp_latency=_profile_from_env("SERP", 800, 2500),
+            scrape_latency=_profile_from_env("SCRAPE", 2000, 8000),
+            llm_latency=_profile_from_env("LLM", 1500, 4000),
+            serp_failure_rate=float(os.getenv("FAKE_SERP_FAILURE_RATE", "0")),
+            scrape_failure_rate=float(os.getenv("FAKE_SCRAPE_FAILURE_RATE", "0.05")),
+            llm_failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            doc_min_chars=int(os.getenv("FAKE_DOC_MIN_CHARS", "4000")),
+            doc_max_chars=int(os.getenv("FAKE_DOC_MAX_CHARS", "40000")),
+            fixtures_dir=os.getenv("FAKE_FIXTURES_DIR") or None,
+            seed=int(seed) if seed else None,
+        )
+
+
+# === Recorded Fixtures === #
+class FixtureLibrary:
+    """
+    Recorded search results and page markdown for replay.
+
+    Reads artifact store records (`**/*.json.zst`, see agent.artifacts) as well as the
+    legacy per-stage dumps: `serpai_folder/*.json` (lists of {"query", "output"}) and
+    `final_results/*.json` (lists of {"link", "metadata", "markdown"}).
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.searches: Dict[str, List[dict]] = {}
+        self.queries: List[str] = []
+        self.pages: Dict[str, str] = {}
+        if root:
+            self._load(root)
+
+    def _load(self, root: str) -> None:
+        searches, pages = [], []
+        for path in find_artifacts(root):
+            try:
+                artifacts = read_artifact(path).get("artifacts", {})
+            except Exception as e:
+                logger.warning("[FAKES] Skipping unreadable artifact record %s: %s", path, e)
+                continue
+            searches.extend(artifacts.get("search_results", []))
+            pages.extend(artifacts.get("enriched_targets", []))
+        for path in sorted(glob.glob(os.path.join(root, "serpai_folder", "*.json"))):
+            searches.extend(self._read(path))
+        for path in sorted(glob.glob(os.path.join(root, "final_results", "*.json"))):
+            pages.extend(self._read(path))
+
+        for entry in searches:
+            if entry.get("query") and entry.get("output"):
+                self.searches[normalize_query(entry["query"])] = entry["output"]
+                self.queries.append(entry["query"])
+        for item in pages:
+            if item.get("link") and item.get("markdown"):
+                self.pages[item["link"]] = item["markdown"]
+        logger.info("[FAKES] Loaded %s recorded searches and %s pages from %s.", len(self.searches), len(self.pages), root)
+
+    @staticmethod
+    def _read(path: str) -> list:
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, list) else []
+        except (OSError, ValueError) as e:
+            logger.warning("[FAKES] Skipping unreadable fixture %s: %s", path, e)
+            return []
+
+
+# === Fake SerpAPI === #
+class FakeSerpApi:
+    """Stand-in for `agent.clients.SerpApiClient`."""
+
+    def __init__(self, services: "FakeServices"):
+        self.services = services
+
+    async def search(self, params: dict) -> dict:
+        services = self.services
+        await asyncio.sleep(services.config.serp_latency.sample(services.rng))
+        if services.rng.random() < services.config.serp_failure_rate:
+            raise UpstreamError("Fake SerpAPI failure", status=503)
+
+        query = params.get("q", "")
+        recorded = services.fixtures.searches.get(normalize_query(query))
+        if recorded is not None:
+            return {"organic_results": recorded}
+        slug = "-".join(re.findall(r"\w+", query.lower())[:6]) or "result"
+        return {
+            "organic_results": [
+                {
+                    "position": i + 1,
+                    "title": f"{query.title()} - Source {i + 1}",
+                    "link": link,
+                    "redirect_link": None,
+                    "displayed_link": link.split("/")[2],
+                    "favicon": None,
+                    "snippet": f"Coverage of {query} from source {i + 1}.",
+                    "snippet_highlighted_words": [query],
+                    "source": f"Source {i + 1}",
+                }
+                for i, link in enumerate(
+                    f"https://source{services.rng.randrange(1000)}.example.com/{slug}-{n + 1}" for n in range(8)
+                )
+            ]
+        }
+
+
+# === Fake Firecrawl === #
+class _FakeDocument:
+    __slots__ = ("markdown", "metadata")
+
+    def __init__(self, url: str, markdown: str):
+        self.markdown = markdown
+        self.metadata = {"url": url, "sourceURL": url, "statusCode": 200}
+
+
+class _FakeJob:
+    __slots__ = ("id", "success")
+
+    def __init__(self, job_id: str):
+        self.id = job_id
+        self.success = True
+
+
+class _FakeJobStatus:
+    __slots__ = ("status", "data", "completed", "total")
+
+    def __init__(self, status: str, data: list, total: int):
+        self.status = status
+        self.data = data
+        self.completed = len(data)
+        self.total = total
+
+
+class FakeFirecrawl:
+    """
+    Stand-in for the `FirecrawlApp` batch scrape API used by `iter_batch_scrape`.
+
+    Each URL of a job gets its own completion time drawn from `scrape_latency`; a
+    `scrape_failure_rate` share of URLs never produce a document.
+    """
+
+    def __init__(self, services: "FakeServices"):
+        self.services = services
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def async_batch_scrape_urls(self, urls: List[str], formats: List[str] = ["markdown"], **kwargs) -> _FakeJob:
+        services = self.services
+        now = time.monotonic()
+        schedule = sorted(
+            (now + services.config.scrape_latency.sample(services.rng), url)
+            for url in urls
+            if services.rng.random() >= services.config.scrape_failure_rate
+        )
+        job = _FakeJob(str(uuid.uuid4()))
+        with self._lock:
+            self._jobs[job.id] = {"schedule": schedule, "total": len(urls), "documents": [], "cancelled": False}
+        return job
+
+    def check_batch_scrape_status(self, job_id: str) -> _FakeJobStatus:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job["cancelled"]:
+            # Finished jobs are forgotten once reported; polling them again reads as cancelled
+            return _FakeJobStatus("cancelled", [], 0)
+
+        now = time.monotonic()
+        schedule = job["schedule"]
+        while schedule and schedule[0][0] <= now:
+            _, url = schedule.pop(0)
+            job["documents"].append(_FakeDocument(url, self.services.page(url)))
+        status = "scraping" if schedule else "completed"
+        if status == "completed":
+            with self._lock:
+                self._jobs.pop(job_id, None)
+        return _FakeJobStatus(status, list(job["documents"]), job["total"])
+
+    def cancel_batch_scrape(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job["cancelled"] = True
+        return {"status": "cancelled"}
+
+
+# === Fake Gemini === #
+class FakeLLM:
+    """
+    Stand-in for `ChatGoogleGenerativeAI` (`ainvoke` / `astream`).
+
+    Breakdown prompts get bullet-list sub-queries (recorded queries when fixtures are
+    loaded); map-step extraction prompts get bullet notes; everything else gets a
+    summarizer-style JSON block. Streaming spreads the sampled latency evenly over
+    the chunks.
+    """
+
+    def __init__(self, services: "FakeServices"):
+        self.services = services
+
+    def _respond(self, prompt: str) -> str:
+        services = self.services
+        if services.rng.random() < services.config.llm_failure_rate:
+            raise UpstreamError("Fake LLM failure", status=503)
+        if prompt.rstrip().endswith("Sub-Queries:"):
+            return "\n".join(f"- {query}" for query in services.sub_queries(prompt))
+        if prompt.rstrip().endswith("NOTES:"):
+            return "\n".join(" ".join(["-", *(services.rng.choice(_WORDS) for _ in range(15))]) for _ in range(6))
+
+        links = list(dict.fromkeys(re.findall(r"\*\*Link:\*\* (\S+)", prompt)))[:5]
+        analysis = " ".join(services.rng.choice(_WORDS) for _ in range(250))
+        payload = {
+            "detailed_analysis": f"## Overview\n{analysis}",
+            "websites": [{"title": f"Source {i + 1}", "link": link, "snippet": "Summary of the page."} for i, link in enumerate(links)],
+            "videos": [],
+        }
+        return f"```json\n{json.dumps(payload, indent=2)}\n```"
+
+    @staticmethod
+    def _usage(prompt: str, response: str) -> dict:
+        input_tokens, output_tokens = len(prompt) // 4, len(response) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    @staticmethod
+    def _prompt(messages) -> str:
+        return messages if isinstance(messages, str) else messages[-1].content
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        prompt = self._prompt(messages)
+        await asyncio.sleep(self.services.config.llm_latency.sample(self.services.rng))
+        content = self._respond(prompt)
+        return AIMessage(content=content, usage_metadata=self._usage(prompt, content))
+
+    async def astream(self, messages, **kwargs):
+        prompt = self._prompt(messages)
+        content = self._respond(prompt)
+        size = self.services.config.llm_chunk_chars
+        chunks = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+        delay = self.services.config.llm_latency.sample(self.services.rng) / len(chunks)
+        for i, text in enumerate(chunks):
+            await asyncio.sleep(delay)
+            # Usage is reported once, on the last chunk
+            usage = self._usage(prompt, content) if i == len(chunks) - 1 else None
+            yield AIMessageChunk(content=text, usage_metadata=usage)
+
+
+# === Fake Service Bundle === #
+class FakeServices:
+    """Offline SerpAPI, Firecrawl and Gemini stand-ins sharing one config, RNG and fixture set (see agent.clients)."""
+
+    def __init__(self, config: Optional[FakeServiceConfig] = None):
+        self.config = config or FakeServiceConfig()
+        self.rng = random.Random(self.config.seed)
+        self.fixtures = FixtureLibrary(self.config.fixtures_dir)
+        self.serpapi = FakeSerpApi(self)
+        self.crawler = FakeFirecrawl(self)
+        self.llm = FakeLLM(self)
+        self._paragraphs = [
+            " ".join(self.rng.choice(_WORDS) for _ in range(self.rng.randint(40, 120))).capitalize() + "."
+            for _ in range(200)
+        ]
+
+    def sub_queries(self, prompt: str) -> List[str]:
+        """Three sub-queries, preferring recorded ones so replayed searches hit their fixtures."""
+        recorded = self.rng.sample(self.fixtures.queries, min(3, len(self.fixtures.queries)))
+        # The user query is the last triple-quoted block of the breakdown prompt
+        quoted = re.findall(r'"""(.*?)"""', prompt, re.DOTALL)
+        topic = quoted[-1].strip() if quoted else "the topic"
+        synthetic = [f"{topic} latest news", f"{topic} analysis and outlook", f"{topic} historical data"]
+        return (recorded + synthetic)[:3]
+
+    def page(self, url: str) -> str:
+        recorded = self.fixtures.pages.get(url)
+        if recorded is not None:
+            return recorded
+        target = self.rng.randint(self.config.doc_min_chars, max(self.config.doc_min_chars, self.config.doc_max_chars))
+        parts = [f"# {url}", "[Home](/) | [Markets](/markets) | [News](/news) | [Login](/login)"]
+        size = sum(len(part) for part in parts)
+        while size < target:
+            paragraph = self.rng.choice(self._paragraphs)
+            parts.append(paragraph)
+            size += len(paragraph) + 2
+        parts.append("© Example Media. All rights reserved. | Privacy Policy | Terms of Use")
+        return "\n\n".join(parts)
@@ -0,0 +1,72 @@
+import time
+import logging
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from firecrawl import FirecrawlApp
+
+logger = logging.getLogger("agent.firecrawl_client")
+
+
+class PooledFirecrawlApp(FirecrawlApp):
+    """
+    FirecrawlApp whose requests share one keep-alive connection pool.
+
+    The stock client calls `requests.get/post/delete` directly, paying a TCP+TLS
+    handshake on every submit and status poll. This overrides its three transport
+    hooks (same 502 retry behaviour) to go through a pooled `requests.Session`,
+    which is safe to share between the executor threads the agent calls it from.
+    """
+
+    def __init__(self, api_key: str = None, api_url: str = None, pool_size: int = 32) -> None:
+        super().__init__(api_key=api_key, api_url=api_url)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def cancel_batch_scrape(self, id: str) -> Dict[str, Any]:
+        """
+        Cancel an asynchronous batch scrape job.
+
+        The stock client only cancels crawl jobs (`DELETE /v1/crawl/{id}`); batch jobs
+        have their own endpoint.
+
+        Args:
+            id (str): The ID of the batch scrape job to cancel
+
+        Returns:
+            Dict[str, Any]: The API response
+
+        Raises:
+            requests.exceptions.HTTPError: If the API rejects the cancellation
+        """
+        response = self._delete_request(f"{self.api_url}/v1/batch/scrape/{id}", self._prepare_headers())
+        if response.status_code != 200:
+            self._handle_error(response, "cancel batch scrape job")
+        try:
+            return response.json()
+        except ValueError:
+            raise Exception("Failed to parse Firecrawl response as JSON.")
+
+    def _request_with_retries(self, method: str, url: str, retries: int, backoff_factor: float, **kwargs: Any) -> requests.Response:
+        for attempt in range(retries):
+            response = self.session.request(method, url, **kwargs)
+            if response.status_code != 502:
+                return response
+            time.sleep(backoff_factor * (2 ** attempt))
+        return response
+
+    def _post_request(self, url: str, data: Dict[str, Any], headers: Dict[str, str], retries: int = 3, backoff_factor: float = 0.5) -> requests.Response:
+        timeout = (data["timeout"] + 5000) if "timeout" in data else None
+        return self._request_with_retries("POST", url, retries, backoff_factor, headers=headers, json=data, timeout=timeout)
+
+    def _get_request(self, url: str, headers: Dict[str, str], retries: int = 3, backoff_factor: float = 0.5) -> requests.Response:
+        return self._request_with_retries("GET", url, retries, backoff_factor, headers=headers)
+
+    def _delete_request(self, url: str, headers: Dict[str, str], retries: int = 3, backoff_factor: float = 0.5) -> requests.Response:
+        return self._request_with_retries("DELETE", url, retries, backoff_factor, headers=headers)
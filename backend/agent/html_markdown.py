@@ -0,0 +1,221 @@
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin
+
+# === Conversion Settings === #
+# Subtrees that never hold article text
+_SKIP_TAGS = frozenset(
+    "script style noscript template svg canvas head nav footer aside form button select textarea dialog".split()
+)
+_BLOCK_TAGS = frozenset(
+    "p div section article main header address figure figcaption details summary dl dd dt ul ol table hr".split()
+)
+_HEADINGS = {f"h{level}": level for level in range(1, 7)}
+_VOID_TAGS = frozenset("area base br col embed hr img input link meta source track wbr".split())
+_VIDEO_SRC_RE = re.compile(r"(?:youtube\.com|youtube-nocookie\.com|youtu\.be|vimeo\.com|dailymotion\.com)", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+# Below this much text inside <main>/<article>, the whole body is used instead
+MIN_MAIN_CHARS = 200
+
+
+class _MarkdownBuilder(HTMLParser):
+    """
+    Single-pass HTML to markdown conversion for server-rendered pages.
+
+    Output goes to two buffers: everything in <body>, and only what sits inside
+    <main>/<article>. Navigation, scripts, forms and other chrome are skipped;
+    headings, paragraphs, lists, links, emphasis, code, quotes and tables are kept.
+    Video embeds (<iframe> on YouTube/Vimeo/...) become plain links so the
+    summarizer can report them.
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ""
+        self.body: List[str] = []
+        self.main: List[str] = []
+        self.main_chars = 0
+        self.scripts = 0
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._pre_depth = 0
+        self._lists: List[List] = []  # [tag, item count]
+        self._links: List[Optional[str]] = []
+        self._quote_depth = 0
+        self._row_cells = 0
+        self._table_rows = 0
+
+    # --- output --- #
+    def _emit(self, text: str) -> None:
+        self.body.append(text)
+        if self._main_depth:
+            self.main.append(text)
+
+    def _break(self, blank: bool = True) -> None:
+        prefix = "> " * self._quote_depth
+        self._emit(("\n\n" if blank else "\n") + prefix)
+
+    # --- parser callbacks --- #
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag == "title":
+            self._in_title = True
+            return
+        if tag == "script":
+            self.scripts += 1
+        if tag in _SKIP_TAGS:
+            if tag not in _VOID_TAGS:
+                self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag in ("main", "article"):
+            self._main_depth += 1
+        if tag in _HEADINGS:
+            self._break()
+            self._emit("#" * _HEADINGS[tag] + " ")
+        elif tag == "br":
+            self._break(blank=False)
+        elif tag in ("ul", "ol"):
+            self._lists.append([tag, 0])
+            self._break(blank=len(self._lists) == 1)
+        elif tag == "li":
+            indent = "  " * max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol":
+                self._lists[-1][1] += 1
+                marker = f"{self._lists[-1][1]}. "
+            else:
+                marker = "- "
+            self._break(blank=False)
+            self._emit(indent + marker)
+        elif tag == "pre":
+            self._pre_depth += 1
+            self._break()
+            self._emit("```\n")
+        elif tag == "code" and not self._pre_depth:
+            self._emit("`")
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("*")
+        elif tag == "blockquote":
+            self._quote_depth += 1
+            self._break()
+        elif tag == "a":
+            href = dict(attrs).get("href") or ""
+            self._links.append(urljoin(self.base_url, href) if href and not href.startswith(("#", "javascript:")) else None)
+            if self._links[-1]:
+                self._emit("[")
+        elif tag == "iframe":
+            src = dict(attrs).get("src") or ""
+            if _VIDEO_SRC_RE.search(src):
+                self._break()
+                self._emit(f"[Video]({urljoin(self.base_url, src)})")
+        elif tag == "tr":
+            self._row_cells = 0
+            self._break(blank=False)
+            self._emit("|")
+        elif tag in ("td", "th"):
+            self._row_cells += 1
+            self._emit(" ")
+        elif tag in _BLOCK_TAGS:
+            self._break()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "title":
+            self._in_title = False
+            return
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth:
+            return
+
+        if tag in _HEADINGS:
+            self._break()
+        elif tag in ("ul", "ol"):
+            if self._lists:
+                self._lists.pop()
+            self._break(blank=not self._lists)
+        elif tag == "pre":
+            self._pre_depth = max(0, self._pre_depth - 1)
+            self._emit("\n```")
+            self._break()
+        elif tag == "code" and not self._pre_depth:
+            self._emit("`")
+        elif tag in ("strong", "b"):
+            self._emit("**")
+        elif tag in ("em", "i"):
+            self._emit("*")
+        elif tag == "blockquote":
+            self._quote_depth = max(0, self._quote_depth - 1)
+            self._break()
+        elif tag == "a":
+            href = self._links.pop() if self._links else None
+            if href:
+                self._emit(f"]({href})")
+        elif tag in ("td", "th"):
+            self._emit(" |")
+        elif tag == "tr":
+            self._table_rows += 1
+            if self._table_rows == 1 and self._row_cells:
+                # Markdown tables need a header separator after the first row
+                self._break(blank=False)
+                self._emit("|" + " --- |" * self._row_cells)
+        elif tag == "table":
+            self._table_rows = 0
+            self._break()
+        elif tag in _BLOCK_TAGS:
+            self._break()
+        if tag in ("main", "article"):
+            self._main_depth = max(0, self._main_depth - 1)
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth:
+            return
+        if self._pre_depth:
+            self._emit(data)
+            return
+        text = _WS_RE.sub(" ", data)
+        if text.strip():
+            self._emit(text)
+            if self._main_depth:
+                self.main_chars += len(text)
+
+
+def html_to_markdown(html: str, base_url: str) -> Tuple[str, str, int]:
+    """
+    Convert a server-rendered HTML page to markdown.
+
+    Args:
+        html (str): The page source.
+        base_url (str): URL the page was fetched from; relative links are resolved against it.
+
+    Returns:
+        Tuple[str, str, int]: `(title, markdown, script_count)`. The markdown covers the
+                              page's <main>/<article> when that holds real text, otherwise
+                              the whole body; the title is prepended as a heading.
+    """
+    builder = _MarkdownBuilder(base_url)
+    builder.feed(html)
+    builder.close()
+    parts = builder.main if builder.main_chars >= MIN_MAIN_CHARS else builder.body
+    lines = [line.rstrip() for line in "".join(parts).splitlines()]
+    markdown = _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+    title = _WS_RE.sub(" ", builder.title).strip()
+    if title and not markdown.startswith("# "):
+        markdown = f"# {title}\n\n{markdown}"
+    return title, markdown, builder.scripts
+
+
+def convert_page(body: bytes, encoding: Optional[str], base_url: str) -> Tuple[str, str, int]:
+    """Process-pool entry point: decode the raw response body, then convert it."""
+    html = body.decode(encoding or "utf-8", errors="replace")
+    return html_to_markdown(html, base_url)
@@ -0,0 +1,204 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("agent.jobs")
+
+# === Job Scheduler Settings === #
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "900"))
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+FINISHED_STATES = frozenset({COMPLETED, FAILED, CANCELLED})
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the scheduler's queue is at capacity."""
+
+
+@dataclass
+class Job:
+    task_id: str
+    query: str
+    priority: int
+    status: str = QUEUED
+    stage: Optional[str] = None
+    message: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Extra keyword arguments for the runner (e.g. budget_seconds, session_id)
+    options: Dict[str, Any] = field(default_factory=dict, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "query": self.query,
+            "status": self.status,
+            "stage": self.stage,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# === In-Process Job Scheduler === #
+class JobScheduler:
+    """
+    Runs agent queries in the background on a bounded pool of worker tasks.
+
+    Jobs wait in a priority queue (higher `priority` first, FIFO within a priority),
+    report their current pipeline stage while running, can be cancelled while queued or
+    running, and keep their result for `result_ttl` seconds after finishing. Only jobs
+    still waiting count against `max_queued`: cancelling a queued job frees its place at
+    once, and its queue entry is skipped (or compacted away) later.
+
+    `runner` is called as `runner(query, on_event=..., task_id=..., **options)`, with the
+    options given to `submit`.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[..., Awaitable[Any]],
+        workers: int = JOB_WORKERS,
+        max_queued: int = JOB_QUEUE_MAX,
+        result_ttl: float = JOB_RESULT_TTL_SECONDS,
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._queued = 0  # jobs still waiting; the queue may also hold entries of cancelled ones
+        self._cancel_requested: set = set()  # running jobs cancelled through `cancel`
+        self._workers: list = []
+        self._sequence = itertools.count()
+
+    def _ensure_started(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info("[JOBS] Started %s job workers.", self.workers)
+
+    async def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._queued = 0
+
+    def submit(self, query: str, priority: int = 0, **options: Any) -> Job:
+        self._ensure_started()
+        self._expire()
+        if self._queued >= self.max_queued:
+            raise QueueFullError(f"Job queue is full ({self.max_queued} jobs waiting).")
+
+        job = Job(task_id=str(uuid.uuid4()), query=query, priority=priority, options=options)
+        self._jobs[job.task_id] = job
+        self._queue.put_nowait((-priority, next(self._sequence), job.task_id))
+        self._queued += 1
+        logger.info("[JOBS] Queued job %s (priority %s, %s waiting).", job.task_id, priority, self._queued)
+        return job
+
+    def get(self, task_id: str) -> Optional[Job]:
+        self._expire()
+        return self._jobs.get(task_id)
+
+    def cancel(self, task_id: str) -> Optional[Job]:
+        job = self.get(task_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        if job.status == RUNNING and job.task is not None:
+            self._cancel_requested.add(task_id)
+            job.task.cancel()
+        else:
+            # Still queued: free its place now; a worker skips the entry when it comes up
+            self._queued -= 1
+            self._finish(job, CANCELLED)
+            if self._queue is not None and self._queue.qsize() > self._queued + self.max_queued:
+                self._compact()
+        return job
+
+    def _compact(self) -> None:
+        """Drop queue entries of cancelled jobs, so bursts of cancels cannot grow the queue without bound."""
+        entries = []
+        while not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+        for entry in entries:
+            job = self._jobs.get(entry[2])
+            if job is not None and job.status == QUEUED:
+                self._queue.put_nowait(entry)
+
+    def stats(self) -> dict:
+        counts = {state: 0 for state in (QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED)}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return counts
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            _, _, task_id = await self._queue.get()
+            job = self._jobs.get(task_id)
+            if job is None or job.status != QUEUED:
+                continue
+
+            self._queued -= 1
+            job.status = RUNNING
+            job.started_at = time.time()
+            job.task = asyncio.create_task(self.runner(job.query, on_event=self._tracker(job), task_id=job.task_id, **job.options))
+            try:
+                job.result = await job.task
+                self._finish(job, COMPLETED)
+            except asyncio.CancelledError:
+                # Either the job was cancelled, or the worker itself is being shut down (when the
+                # event loop closes, both are cancelled at once, so job.task.cancelled() can't tell)
+                shutting_down = task_id not in self._cancel_requested
+                if shutting_down:
+                    job.task.cancel()
+                self._finish(job, CANCELLED)
+                if shutting_down:
+                    raise
+            except Exception as e:
+                logger.exception("[JOBS] Job %s failed: %s", task_id, e)
+                job.error = str(e)
+                self._finish(job, FAILED)
+            finally:
+                job.task = None
+                self._cancel_requested.discard(task_id)
+
+    @staticmethod
+    def _tracker(job: Job) -> Callable[[dict], None]:
+        def on_event(event: dict) -> None:
+            if event.get("stage") != "token":
+                job.stage = event.get("stage")
+                job.message = event.get("message")
+        return on_event
+
+    @staticmethod
+    def _finish(job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.time()
+        logger.info("[JOBS] Job %s %s.", job.task_id, status)
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            task_id for task_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for task_id in expired:
+            del self._jobs[task_id]
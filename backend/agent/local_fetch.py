@@ -0,0 +1,290 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+import ipaddress
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from agent.html_markdown import convert_page
+from agent.metrics import local_fetches
+from agent.urls import canonical_host
+
+logger = logging.getLogger("agent.local_fetch")
+
+# === Local Fetcher Settings === #
+# Fetch simple pages directly instead of through a Firecrawl job; Firecrawl stays the fallback
+LOCAL_FETCH_ENABLED = os.getenv("LOCAL_FETCH_ENABLED", "false").lower() == "true"
+LOCAL_FETCH_TIMEOUT_SECONDS = float(os.getenv("LOCAL_FETCH_TIMEOUT_SECONDS", "6"))
+LOCAL_FETCH_MAX_BYTES = int(os.getenv("LOCAL_FETCH_MAX_BYTES", str(3 * 1024 * 1024)))
+LOCAL_FETCH_MAX_CONNECTIONS = int(os.getenv("LOCAL_FETCH_MAX_CONNECTIONS", "64"))
+# Politeness: requests in flight per domain, and minimum spacing between their starts
+LOCAL_FETCH_PER_DOMAIN = int(os.getenv("LOCAL_FETCH_PER_DOMAIN", "2"))
+LOCAL_FETCH_DOMAIN_INTERVAL_SECONDS = float(os.getenv("LOCAL_FETCH_DOMAIN_INTERVAL_SECONDS", "0.5"))
+# Processes converting HTML to markdown
+LOCAL_FETCH_WORKERS = int(os.getenv("LOCAL_FETCH_WORKERS", "2"))
+# Pages converting to less text than this are treated as script-rendered shells
+LOCAL_FETCH_MIN_CHARS = int(os.getenv("LOCAL_FETCH_MIN_CHARS", "500"))
+# Pages that fell back within this long go to Firecrawl together; later fallbacks form a second job
+LOCAL_FETCH_FALLBACK_WAIT_SECONDS = float(os.getenv("LOCAL_FETCH_FALLBACK_WAIT_SECONDS", "1"))
+LOCAL_FETCH_USER_AGENT = os.getenv("LOCAL_FETCH_USER_AGENT", "Mozilla/5.0 (compatible; AgenticChatBot/1.0)")
+LOCAL_FETCH_MAX_REDIRECTS = int(os.getenv("LOCAL_FETCH_MAX_REDIRECTS", "5"))
+# Allow loopback/private/link-local destinations; only for tests and local benchmarks
+LOCAL_FETCH_ALLOW_PRIVATE = os.getenv("LOCAL_FETCH_ALLOW_PRIVATE", "false").lower() == "true"
+
+# === Routing Settings === #
+# Domains (suffix match) always sent to Firecrawl: script-rendered or bot-walled sites
+LOCAL_FETCH_SKIP_DOMAINS = os.getenv(
+    "LOCAL_FETCH_SKIP_DOMAINS", "x.com,twitter.com,instagram.com,facebook.com,linkedin.com,tiktok.com"
+)
+# Consecutive fallbacks after which a domain goes straight to Firecrawl, and for how long
+LOCAL_FETCH_FAILURES_TO_SKIP = int(os.getenv("LOCAL_FETCH_FAILURES_TO_SKIP", "2"))
+LOCAL_FETCH_SKIP_SECONDS = float(os.getenv("LOCAL_FETCH_SKIP_SECONDS", "3600"))
+# Documents Firecrawl converts better than an HTML parser can
+_FIRECRAWL_EXTENSIONS = (".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx")
+_HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/markdown")
+_BLOCKED_STATUSES = frozenset({401, 403, 429, 451, 503})
+MAX_DOMAIN_SLOTS = 2048
+
+
+class LocalFetchError(Exception):
+    """A page the local fetcher could not (or should not) handle; `reason` labels the fallback."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+# === Destination Check === #
+async def _resolve(host: str, port: int) -> List[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_destination(url: str) -> None:
+    """
+    Refuse URLs that would make the server call itself or its private network.
+
+    Search results (and any redirect they lead to) are untrusted input, so every
+    address the host resolves to must be public: loopback, RFC 1918, link-local (cloud
+    metadata at 169.254.169.254), multicast and reserved ranges are rejected.
+
+    Raises:
+        LocalFetchError: `forbidden_address` for such hosts, `network` if the host does not resolve.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise LocalFetchError("forbidden_address", f"unsupported URL {url!r}")
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = await _resolve(parts.hostname, port)
+    except ValueError as e:
+        raise LocalFetchError("forbidden_address", str(e)) from e
+    except OSError as e:
+        raise LocalFetchError("network", f"cannot resolve {parts.hostname}: {e}") from e
+    blocked = [address for address in addresses if not _is_public(address)]
+    if blocked or not addresses:
+        raise LocalFetchError("forbidden_address", f"{parts.hostname} resolves to {', '.join(blocked) or 'nothing'}")
+
+
+# === Per-Domain Politeness === #
+class _DomainSlot:
+    __slots__ = ("semaphore", "next_start")
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_start = 0.0
+
+
+# === Local Fetcher === #
+class LocalFetcher:
+    """
+    Fetches pages over pooled HTTP connections and converts them to markdown locally.
+
+    Each domain gets at most LOCAL_FETCH_PER_DOMAIN requests in flight, started at least
+    LOCAL_FETCH_DOMAIN_INTERVAL_SECONDS apart. Redirects are followed here, not by
+    httpx, so the destination check runs on the first request and on every hop. Bodies
+    are streamed and abandoned past LOCAL_FETCH_MAX_BYTES. HTML is decoded and
+    converted in a process pool, so large pages never hold the event loop. Anything
+    unsuitable raises `LocalFetchError`, and the caller falls back to Firecrawl.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, workers: int = LOCAL_FETCH_WORKERS, allow_private: bool = LOCAL_FETCH_ALLOW_PRIVATE):
+        self.http = http
+        self.workers = workers
+        self.allow_private = allow_private
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._domains: Dict[str, _DomainSlot] = {}
+
+    def _converter(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: the server process has threads (executor, artifact writer) by now
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _slot(self, host: str) -> _DomainSlot:
+        slot = self._domains.get(host)
+        if slot is None:
+            if len(self._domains) >= MAX_DOMAIN_SLOTS:
+                # Forget idle domains; their spacing window has long passed
+                now = asyncio.get_running_loop().time()
+                self._domains = {
+                    name: kept for name, kept in self._domains.items()
+                    if kept.semaphore.locked() or kept.next_start > now
+                }
+            slot = self._domains[host] = _DomainSlot(LOCAL_FETCH_PER_DOMAIN)
+        return slot
+
+    async def fetch(self, url: str) -> Tuple[str, str]:
+        """
+        Fetch one page and convert it to markdown.
+
+        Args:
+            url (str): Page URL.
+
+        Returns:
+            Tuple[str, str]: `(final_url, markdown)` after redirects.
+
+        Raises:
+            LocalFetchError: Blocked, non-HTML, too large, script-rendered or unreachable pages,
+                and private or internal destinations.
+        """
+        loop = asyncio.get_running_loop()
+        slot = self._slot(canonical_host(url))
+        async with slot.semaphore:
+            wait = slot.next_start - loop.time()
+            slot.next_start = max(slot.next_start, loop.time()) + LOCAL_FETCH_DOMAIN_INTERVAL_SECONDS
+            if wait > 0:
+                await asyncio.sleep(wait)
+            final_url, body, encoding = await self._download(url)
+
+        title, markdown, scripts = await loop.run_in_executor(self._converter(), convert_page, body, encoding, final_url)
+        if len(markdown) < LOCAL_FETCH_MIN_CHARS:
+            raise LocalFetchError("thin", f"{len(markdown)} chars of text, {scripts} scripts")
+        return final_url, markdown
+
+    async def _download(self, url: str) -> Tuple[str, bytes, Optional[str]]:
+        try:
+            for _ in range(LOCAL_FETCH_MAX_REDIRECTS + 1):
+                if not self.allow_private:
+                    await check_destination(url)
+                async with self.http.stream("GET", url) as response:
+                    if response.next_request is not None:
+                        url = str(response.next_request.url)
+                        continue
+                    return await self._read(response)
+            raise LocalFetchError("redirects", f"more than {LOCAL_FETCH_MAX_REDIRECTS}")
+        except httpx.TimeoutException as e:
+            raise LocalFetchError("timeout", str(e)) from e
+        except httpx.HTTPError as e:
+            raise LocalFetchError("network", str(e) or type(e).__name__) from e
+
+    async def _read(self, response: httpx.Response) -> Tuple[str, bytes, Optional[str]]:
+        if response.status_code in _BLOCKED_STATUSES:
+            raise LocalFetchError("blocked", f"HTTP {response.status_code}")
+        if response.status_code != 200:
+            raise LocalFetchError("http_error", f"HTTP {response.status_code}")
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type and content_type not in _HTML_TYPES:
+            raise LocalFetchError("not_html", content_type)
+        length = response.headers.get("content-length")
+        if length and length.isdigit() and int(length) > LOCAL_FETCH_MAX_BYTES:
+            raise LocalFetchError("too_large", f"{length} bytes")
+
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > LOCAL_FETCH_MAX_BYTES:
+                raise LocalFetchError("too_large", f"over {LOCAL_FETCH_MAX_BYTES} bytes")
+            chunks.append(chunk)
+        return str(response.url), b"".join(chunks), response.charset_encoding
+
+    async def prewarm(self) -> None:
+        """Start the converter processes before the first page needs them."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._converter(), convert_page, b"", None, "") for _ in range(self.workers)))
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def new_local_fetcher() -> LocalFetcher:
+    """A fetcher on its own connection pool (called once per worker by the client registry)."""
+    http = httpx.AsyncClient(
+        timeout=httpx.Timeout(LOCAL_FETCH_TIMEOUT_SECONDS),
+        # Redirects are followed by LocalFetcher, which checks every hop's destination
+        follow_redirects=False,
+        headers={"User-Agent": LOCAL_FETCH_USER_AGENT, "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5"},
+        limits=httpx.Limits(max_connections=LOCAL_FETCH_MAX_CONNECTIONS, max_keepalive_connections=LOCAL_FETCH_MAX_CONNECTIONS),
+    )
+    return LocalFetcher(http)
+
+
+# === Scrape Routing === #
+class ScrapeRouter:
+    """
+    Decides per URL whether to try the local fetcher or go straight to Firecrawl.
+
+    Documents (PDF, Office) and LOCAL_FETCH_SKIP_DOMAINS always go to Firecrawl. Other
+    domains are tried locally; a domain whose local fetches fall back
+    LOCAL_FETCH_FAILURES_TO_SKIP times in a row (script-rendered, bot-walled) is sent
+    to Firecrawl for LOCAL_FETCH_SKIP_SECONDS, then given another chance.
+    """
+
+    def __init__(self, enabled: bool = LOCAL_FETCH_ENABLED, skip_domains: str = LOCAL_FETCH_SKIP_DOMAINS):
+        self.enabled = enabled
+        self.skip_domains = tuple(domain.strip().lower() for domain in skip_domains.split(",") if domain.strip())
+        self._failures: Dict[str, int] = {}
+        self._skip_until: Dict[str, float] = {}
+
+    def use_local(self, url: str) -> bool:
+        if not self.enabled:
+            return False
+        if urlsplit(url).path.lower().endswith(_FIRECRAWL_EXTENSIONS):
+            return False
+        host = canonical_host(url)
+        if any(host == domain or host.endswith("." + domain) for domain in self.skip_domains):
+            return False
+        until = self._skip_until.get(host)
+        if until is not None:
+            if time.monotonic() < until:
+                return False
+            del self._skip_until[host]
+        return True
+
+    def record(self, url: str, reason: Optional[str]) -> None:
+        """Record a local fetch outcome: `reason` is None on success, else the fallback reason."""
+        local_fetches.inc(reason or "ok")
+        host = canonical_host(url)
+        if reason is None:
+            self._failures.pop(host, None)
+            return
+        failures = self._failures.get(host, 0) + 1
+        if failures >= LOCAL_FETCH_FAILURES_TO_SKIP:
+            self._failures.pop(host, None)
+            self._skip_until[host] = time.monotonic() + LOCAL_FETCH_SKIP_SECONDS
+            logger.info("[LOCAL FETCH] %s fell back %s times in a row (%s); using Firecrawl for it.", host, failures, reason)
+        else:
+            self._failures[host] = failures
+
+    def stats(self) -> dict:
+        return {"skipped_domains": len(self._skip_until)}
+
+
+scrape_router = ScrapeRouter()
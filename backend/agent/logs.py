@@ -0,0 +1,240 @@
+import os
+import sys
+import zlib
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Optional
+
+import orjson
+
+from agent.metrics import current_stage, current_task_id, log_records
+
+logger = logging.getLogger("agent.logs")
+
+# === Logging Settings === #
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" keeps the classic one-line format; "json" emits one object per line with task_id and stage
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Records waiting for the writer thread; beyond this they are dropped (and counted) rather than block the loop
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Share of a stage's INFO/DEBUG records kept, e.g. "search=0.2,scrape=0.2"; warnings and errors are always kept
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Longest payload (model output, job dumps) rendered into one record
+LOG_MAX_PAYLOAD_CHARS = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "2000"))
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse a "stage=rate,stage=rate" string."""
+    rates = {}
+    for pair in filter(None, (p.strip() for p in spec.split(","))):
+        stage, _, rate = pair.partition("=")
+        try:
+            rates[stage.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            logger.warning("[LOGS] Ignoring invalid LOG_SAMPLE_RATES entry: '%s'", pair)
+    return rates
+
+
+# === Lazy Payloads === #
+class _Lazy:
+    __slots__ = ("render",)
+
+    def __init__(self, render: Callable[[], Any]):
+        self.render = render
+
+    def __str__(self) -> str:
+        text = str(self.render())
+        return text if len(text) <= LOG_MAX_PAYLOAD_CHARS else f"{text[:LOG_MAX_PAYLOAD_CHARS]}... [{len(text)} chars]"
+
+    __repr__ = __str__
+
+
+def lazy(render: Callable[[], Any]) -> _Lazy:
+    """
+    Log argument rendered only if the record is actually written, by the writer thread,
+    truncated to LOG_MAX_PAYLOAD_CHARS: `logger.debug("[X] Payload: %s", lazy(lambda: json.dumps(big)))`.
+    `render` runs after the call returns, so it must only read data nobody mutates later.
+    """
+    return _Lazy(render)
+
+
+# Stands in for a lazy() payload in a message interpolated on the calling thread
+_PAYLOAD_MARK = "\x00"
+
+
+class _Mark:
+    __slots__ = ()
+
+    def __str__(self) -> str:
+        return _PAYLOAD_MARK
+
+    __repr__ = __str__
+
+
+class _PendingMessage:
+    """A message interpolated up to its lazy() payloads, which are rendered when it is written."""
+
+    __slots__ = ("parts", "payloads")
+
+    def __init__(self, parts: list, payloads: list):
+        self.parts = parts
+        self.payloads = payloads
+
+    def __str__(self) -> str:
+        out = [self.parts[0]]
+        for payload, part in zip(self.payloads, self.parts[1:]):
+            out.append(str(payload))
+            out.append(part)
+        return "".join(out)
+
+
+def _interpolate(record: logging.LogRecord) -> Any:
+    """`record.getMessage()`, except that lazy() payloads are left for the writer thread."""
+    args = record.args
+    if not isinstance(args, tuple) or not any(isinstance(arg, _Lazy) for arg in args):
+        return record.getMessage()
+    payloads = [arg for arg in args if isinstance(arg, _Lazy)]
+    text = str(record.msg) % tuple(_Mark() if isinstance(arg, _Lazy) else arg for arg in args)
+    parts = text.split(_PAYLOAD_MARK)
+    if len(parts) != len(payloads) + 1:
+        # A mark was truncated by its conversion (e.g. %.0s) or occurs in another argument
+        return record.getMessage()
+    return _PendingMessage(parts, payloads)
+
+
+# === Record Context and Sampling === #
+class ContextFilter(logging.Filter):
+    """
+    Tags every record with the current pipeline `task_id` and `stage` (set by the API
+    layer and `metrics.span`), then drops INFO/DEBUG records of sampled stages.
+
+    Sampling is decided per (task, stage): a request's stage is either logged in full
+    or not at all, so the records that are kept still read as a complete trace.
+    """
+
+    def __init__(self, sample_rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.sample_rates = sample_rates if sample_rates is not None else parse_sample_rates(LOG_SAMPLE_RATES)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        task_id = current_task_id.get()
+        stage = current_stage.get()
+        record.task_id = task_id
+        record.stage = stage
+        rate = self.sample_rates.get(stage) if stage is not None else None
+        if rate is None or rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if task_id is not None:
+            keep = zlib.crc32(f"{task_id}:{stage}".encode("utf-8")) / 0xFFFFFFFF < rate
+        else:
+            keep = random.random() < rate
+        if not keep:
+            log_records.inc("sampled_out")
+        return keep
+
+
+# === Formatters === #
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, task_id, stage and any traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        task_id = getattr(record, "task_id", None)
+        if task_id is not None:
+            entry["task_id"] = task_id
+        stage = getattr(record, "stage", None)
+        if stage is not None:
+            entry["stage"] = stage
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode("utf-8")
+
+
+# === Off-Loop Handler === #
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread without ever blocking, and drops them once the
+    queue is full.
+
+    As with the stdlib QueueHandler, the message is interpolated and any traceback
+    rendered here, so later changes to mutable arguments cannot leak into the record;
+    `lazy()` payloads are the exception and are rendered by the writer thread, along
+    with the formatting and I/O.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = _interpolate(record)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records.inc("dropped")
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    force: bool = False,
+    stream: Optional[IO[str]] = None,
+    sample_rates: Optional[str] = None,
+) -> None:
+    """
+    Route all logging through a bounded queue to a writer thread.
+
+    Like `logging.basicConfig`, this does nothing if the root logger already has
+    handlers (unless `force`), so tools that configure logging themselves keep theirs.
+
+    Args:
+        level (str): Root log level.
+        fmt (str): "text" or "json".
+        force (bool): Replace existing root handlers (and a previous listener).
+        stream (Optional[IO[str]]): Where records are written; stderr by default.
+        sample_rates (Optional[str]): Overrides LOG_SAMPLE_RATES.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    records: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter(parse_sample_rates(sample_rates) if sample_rates is not None else None))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    if _listener is not None:
+        _listener.stop()
@@ -5,37 +5,129 @@ import logging
 import uuid
 import json
 import asyncio
-from dotenv import load_dotenv, find_dotenv
-from firecrawl import FirecrawlApp
-from serpapi import GoogleSearch
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
-from langchain_core.prompts import PromptTemplate
-from pydantic import BaseModel, HttpUrl, ValidationError
-from typing import List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
-# Load environment variables
-load_dotenv(find_dotenv())
-SERPAPI_API_KEY = os.getenv("SERPAI_API_KEY")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from urllib.parse import urlsplit
+from agent.cache import SerpCache, SummaryCache, normalize_query, scrape_cache, serp_cache, summary_cache
+from agent.singleflight import InFlightMap, SingleFlight
+from agent.answer_cache import answer_cache, query_terms
+from agent.admission import SERP_MAX_CONCURRENCY, pipeline_admission, stage_limits
+from agent.urls import canonicalize_url
+from agent.streaming import JsonStringFieldStreamer
+from agent.passages import select_passages, utf8_size
+from agent.cleaning import DocumentCleaner
+from agent.artifacts import ArtifactRecord, artifact_sink
+from agent.clients import clients
+from agent.deadline import (
+    BUDGET_BREAKDOWN_SHARE,
+    BUDGET_SEARCH_SHARE,
+    BUDGET_SUMMARIZE_SHARE,
+    PIPELINE_BUDGET_SECONDS,
+    LatencyBudget,
+    LatencyTracker,
+    hedged,
+    hedged_stream,
 )
+from agent.selection import SCRAPE_BUDGET_URLS, SELECTION_RESULTS_PER_QUERY, select_sources
+from agent.sessions import SESSION_DOCS_PER_QUERY, session_store
+from agent.local_fetch import LOCAL_FETCH_FALLBACK_WAIT_SECONDS, LocalFetchError, scrape_router
+from agent.upstream import UpstreamUnavailable, firecrawl_upstream, llm_upstream, serpapi_upstream, upstreams
+from agent.warming import AnswerWarmer
+from agent.logs import lazy
+from agent.metrics import (
+    current_timings,
+    pipelines_in_flight,
+    record_llm_usage,
+    register_collector,
+    scrape_bytes,
+    scrape_documents,
+    skipped_sources,
+    span,
+)
+
+# Logging is configured once by the app (agent/logs.py `configure_logging`)
 logger = logging.getLogger("agent")
 
-# === Initialize Firecrawl Client === #
-crawler = FirecrawlApp(api_key=FIRECRAWL_API_KEY)
-# === Initialize LLM === #
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key=GOOGLE_API_KEY)
+# Firecrawl, Gemini and SerpAPI clients are created lazily by `clients` (agent/clients.py)
+# === Search Stage Settings === #
+SERP_TIMEOUT_SECONDS = float(os.getenv("SERP_TIMEOUT_SECONDS", "15"))
+SERP_LOCATION = "Delhi, India"
+SERP_GL = "in"
+SERP_HL = "en"
+
+# === Request Coalescing === #
+_query_flight = SingleFlight("query")
+_search_flight = SingleFlight("search")
+_scrape_inflight = InFlightMap("scrape")
+_query_listeners: Dict[str, List[Callable[[dict], None]]] = {}
+
+# === Latency History for Hedged Calls === #
+_search_latency = LatencyTracker("search")
+_breakdown_latency = LatencyTracker("breakdown")
+_summarize_latency = LatencyTracker("summarize")
+# Streaming summaries race on time to the first chunk
+_summarize_stream_latency = LatencyTracker("summarize_stream")
+
+
+def _collect_runtime_metrics() -> Dict[str, float]:
+    """Cache, coalescing and admission counters, sampled when /metrics is scraped."""
+    samples = {}
+    for name, cache in (("serp", serp_cache), ("scrape", scrape_cache), ("summary", summary_cache), ("answer", answer_cache)):
+        if cache is not None:
+            stats = cache.stats()
+            samples[f'agent_cache_hits_total{{cache="{name}"}}'] = stats["hits"]
+            samples[f'agent_cache_misses_total{{cache="{name}"}}'] = stats["misses"]
+            samples[f'agent_cache_hit_ratio{{cache="{name}"}}'] = stats["hit_ratio"]
+    for flight in (_query_flight, _search_flight):
+        stats = flight.stats()
+        samples[f'agent_singleflight_executions_total{{flight="{flight.name}"}}'] = stats["executions"]
+        samples[f'agent_singleflight_shared_total{{flight="{flight.name}"}}'] = stats["shared"]
+    samples['agent_singleflight_shared_total{flight="scrape"}'] = _scrape_inflight.shared
+    admission = pipeline_admission.stats()
+    samples["agent_admission_running"] = admission["running"]
+    samples["agent_admission_waiting"] = admission["waiting"]
+    samples["agent_admission_rejected_total"] = admission["rejected"]
+    for name, value in artifact_sink.stats().items():
+        samples[f'agent_artifacts{{stat="{name}"}}'] = value
+    if session_store is not None:
+        for name, value in session_store.stats().items():
+            samples[f'agent_sessions{{stat="{name}"}}'] = value
+    samples["agent_local_fetch_skipped_domains"] = scrape_router.stats()["skipped_domains"]
+    if answer_cache is not None:
+        samples['agent_cache_stale_hits_total{cache="answer"}'] = answer_cache.stats()["stale_hits"]
+    if answer_warmer is not None:
+        for name, value in answer_warmer.stats().items():
+            samples[f'agent_answer_warming{{stat="{name}"}}'] = value
+    if serp_cache is not None:
+        samples["agent_serp_stale_fallbacks_total"] = serp_cache.stats()["stale_hits"]
+    for upstream in upstreams:
+        stats = upstream.stats()
+        samples[f'agent_upstream_circuit_state{{provider="{upstream.name}"}}'] = stats["circuit_state"]
+        samples[f'agent_upstream_circuit_opened_total{{provider="{upstream.name}"}}'] = stats["circuit_opened"]
+        samples[f'agent_upstream_consecutive_failures{{provider="{upstream.name}"}}'] = stats["consecutive_failures"]
+        for key, tokens in stats["tokens_available"].items():
+            samples[f'agent_upstream_tokens_available{{provider="{upstream.name}",key="{key}"}}'] = tokens
+    for tracker in (_search_latency, _breakdown_latency, _map_latency, _summarize_latency, _summarize_stream_latency):
+        stats = tracker.stats()
+        samples[f'agent_recent_latency_seconds{{operation="{tracker.name}",quantile="0.5"}}'] = stats["p50"]
+        samples[f'agent_recent_latency_seconds{{operation="{tracker.name}",quantile="0.95"}}'] = stats["p95"]
+    return samples
+
+
+register_collector(_collect_runtime_metrics)
+
 # === Asynchronous SERP Search === #
 async def serp_search(query: str, num_results: int = 5) -> list:
     """
     Performs a Google search using SerpAPI and returns the top organic results.
 
+    Requests go through the shared async SerpAPI client, which reuses keep-alive
+    connections, under SerpAPI's rate limit, retry policy and circuit breaker
+    (agent.upstream). Concurrency is capped by SERP_MAX_CONCURRENCY and every call is bounded
+    by SERP_TIMEOUT_SECONDS so a slow search never stalls the pipeline. A search still
+    outstanding after the recent p95 search latency gets a hedged duplicate request.
+    If the search fails, expired cached results for the query are served when kept.
+
     Parameters:
         query (str): The search query to be executed.
         num_results (int): Number of results to fetch. (NOTE: Actual filtering must be handled manually after retrieval.)
@@ -44,117 +136,251 @@ async def serp_search(query: str, num_results: int = 5) -> list:
         List[dict]: A list of organic search result dictionaries.
 
     Production Considerations:
-    - Ensure API limits are handled and usage is monitored.
-    - Avoid making too many concurrent calls to stay within SerpAPI's rate limits.
+    - SerpAPI usage and throttling are counted in agent_upstream_calls_total.
     - Log all search activity for debugging and analytics.
     """
-    logger.info(f"[SEARCH] Initiating search for query: '{query}'")
-    
+    with span("search"):
+        logger.info("[SEARCH] Initiating search for query: '%s'", query)
+        if serp_cache is not None:
+            cached = await serp_cache.get(query, SERP_LOCATION, SERP_GL, SERP_HL)
+            if cached is not None:
+                logger.info("[SEARCH] Cache hit for query: '%s'", query)
+                return cached[:num_results]
+
+        # Concurrent requests for the same normalized sub-query share one SerpAPI call
+        search_key = SerpCache.key(query, SERP_LOCATION, SERP_GL, SERP_HL)
+        all_organic_results = await _search_flight.do(search_key, lambda: _fetch_organic_results(query))
+        organic_results = all_organic_results[:num_results]
+        logger.info("[SEARCH] Retrieved %s organic results.", len(organic_results))
+    return organic_results
+
+async def _fetch_organic_results(query: str) -> list:
+    """Calls SerpAPI over the shared keep-alive client and caches the full organic result list."""
     try:
-        search = GoogleSearch({
+        params = {
             "q": query,
-            "location": "Delhi, India",
+            "location": SERP_LOCATION,
             "google_domain": "google.co.in",
             "engine": "google",
-            "gl": "in",
-            "hl": "en",
-            "api_key": SERPAPI_API_KEY,
+            "gl": SERP_GL,
+            "hl": SERP_HL,
             # 'num' is ignored here; we manually truncate below
-        })
+        }
+
+        async with stage_limits["search"]:
+            result = await asyncio.wait_for(
+                hedged(_search_latency, lambda: serpapi_upstream.call(lambda: clients.serpapi().search(params), "search")),
+                timeout=SERP_TIMEOUT_SECONDS,
+            )
+        if "error" in result:
+            logger.warning("[SEARCH] SerpAPI returned an error for query '%s': %s", query, result['error'])
+        all_organic_results = result.get("organic_results", [])
+
+        # Only cache successful, non-empty searches
+        if serp_cache is not None and all_organic_results:
+            await serp_cache.set(query, SERP_LOCATION, SERP_GL, SERP_HL, all_organic_results)
+        return all_organic_results
 
-        result = search.get_dict()
-        organic_results = result.get("organic_results", [])[:num_results]
+    except asyncio.TimeoutError:
+        logger.error("[SEARCH] Search timed out after %ss for query: '%s'", SERP_TIMEOUT_SECONDS, query)
+        return await _stale_search_results(query, "timeout")
 
-        logger.info(f"[SEARCH] Retrieved {len(organic_results)} organic results.")
-        return organic_results
+    except UpstreamUnavailable as e:
+        logger.warning("[SEARCH] Skipping SerpAPI for query '%s': %s", query, e)
+        return await _stale_search_results(query, e.reason)
 
     except Exception as e:
-        logger.exception(f"[ERROR] Failed to perform SERP search: {e}")
+        logger.exception("[ERROR] Failed to perform SERP search: %s", e)
+        return await _stale_search_results(query, "error")
+
+async def _stale_search_results(query: str, reason: str) -> list:
+    """Fallback for a failed search: expired cached results for the query, while still kept (SERP_CACHE_STALE_SECONDS)."""
+    if serp_cache is None:
+        return []
+    stale = await serp_cache.get(query, SERP_LOCATION, SERP_GL, SERP_HL, allow_stale=True)
+    if not stale:
         return []
+    logger.warning("[SEARCH] Serving %s stale cached results for query '%s' (%s).", len(stale), query, reason)
+    return stale
 
-# === Crawl a Single URL (Async) === #
-async def crawl_url(url: str) -> str:
+# === Concurrent Search Stage === #
+async def search_sub_queries(sub_queries: List[str], num_results: int = 5, timeout: Optional[float] = None) -> List[list]:
     """
-    Crawls the given URL using Firecrawl and extracts the main textual content.
+    Runs SERP searches for all sub-queries concurrently.
 
     Args:
-        url (str): The target URL.
+        sub_queries (List[str]): The sub-queries to search.
+        num_results (int): Number of organic results to keep per sub-query.
+        timeout (Optional[float]): Time limit for the whole stage; searches still running
+                                   then are cancelled.
 
     Returns:
-        str: The extracted plain text, or empty string on failure.
+        List[list]: Organic results per sub-query, in the same order as `sub_queries`.
+                    A failed, timed-out or cancelled search yields an empty list in its slot.
     """
+    if not sub_queries:
+        return []
+    logger.info("[SEARCH] Fanning out %s searches (max %s concurrent).", len(sub_queries), SERP_MAX_CONCURRENCY)
+    searches = [asyncio.ensure_future(serp_search(sub_q, num_results)) for sub_q in sub_queries]
+    try:
+        done, pending = await asyncio.wait(searches, timeout=timeout)
+    finally:
+        for search in searches:
+            search.cancel()
+    if pending:
+        logger.warning("[SEARCH] Search budget of %.1fs spent; dropped %s/%s searches.", timeout, len(pending), len(searches))
+    return [search.result() if search in done and search.exception() is None else [] for search in searches]
+
+# === Batch Scrape Waiter Settings === #
+BATCH_SCRAPE_DEADLINE_SECONDS = float(os.getenv("BATCH_SCRAPE_DEADLINE_SECONDS", "90"))
+BATCH_POLL_MIN_SECONDS = float(os.getenv("BATCH_POLL_MIN_SECONDS", "0.25"))
+BATCH_POLL_MAX_SECONDS = float(os.getenv("BATCH_POLL_MAX_SECONDS", "2"))
+BATCH_POLL_BACKOFF = 1.6
+
+async def _cancel_batch_scrape(job_id: str) -> None:
+    """Best-effort cancellation of a remote Firecrawl batch job (`DELETE /v1/batch/scrape/{id}`); failures are logged, not raised."""
     try:
-        logger.info(f"[CRAWL] Initiating crawl for URL: {url}")
-        result = await crawler.extract(url)
+        crawler = clients.crawler()
+        await firecrawl_upstream.call(lambda: asyncio.to_thread(crawler.cancel_batch_scrape, job_id), "cancel", retries=0)
+        logger.info("[BATCH ASYNC] Cancelled remote job %s.", job_id)
+    except Exception as e:
+        logger.warning("[BATCH ASYNC] Failed to cancel remote job %s: %s", job_id, e)
+
+# === Batch Scrape Waiter === #
+async def iter_batch_scrape(
+    urls: List[str],
+    formats: List[str] = ["markdown"],
+    deadline_seconds: Optional[float] = None,
+) -> AsyncIterator[Any]:
+    """
+    Submit a Firecrawl batch scrape job and yield documents as soon as they complete.
 
-        if not result or "text" not in result:
-            logger.warning(f"[CRAWL] Missing 'text' in response for URL: {url}")
-            return ""
+    All client calls run in the default thread pool executor, under Firecrawl's rate
+    limit, retry policy and circuit breaker (agent.upstream). Polling starts at
+    BATCH_POLL_MIN_SECONDS and backs off towards BATCH_POLL_MAX_SECONDS while the job
+    makes no progress; the delay resets whenever new documents land. If the overall
+    deadline passes, or the consuming task is cancelled (e.g. the HTTP client
+    disconnected), the remote job is cancelled.
 
-        logger.info(f"[CRAWL] Successfully extracted {len(result['text'])} characters from {url}")
-        return result["text"]
+    Args:
+        urls (List[str]): URLs to scrape.
+        formats (List[str]): Output formats.
+        deadline_seconds (Optional[float]): Overall time budget for the job. Defaults to
+                                            BATCH_SCRAPE_DEADLINE_SECONDS.
 
-    except Exception as e:
-        logger.error(f"[CRAWL] Error crawling URL: {url} — {e}", exc_info=True)
-        return ""
+    Yields:
+        FirecrawlDocument: Each completed document, in completion order.
+    """
+    if not urls:
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (deadline_seconds or BATCH_SCRAPE_DEADLINE_SECONDS)
+
+    # Each running batch job holds one scrape-stage slot until it finishes or is cancelled
+    async with stage_limits["scrape"]:
+        logger.info("[BATCH ASYNC] Submitting async batch job for %s URLs...", len(urls))
+        crawler = clients.crawler()
+        job = await firecrawl_upstream.call(
+            lambda: asyncio.to_thread(crawler.async_batch_scrape_urls, urls, formats=formats), "submit"
+        )
+        job_id = job.id
+        logger.info("[BATCH ASYNC] Job submitted with ID: %s", job_id)
+
+        finished = False
+        yielded = 0
+        delay = BATCH_POLL_MIN_SECONDS
+        try:
+            while True:
+                job_status = await firecrawl_upstream.call(lambda: asyncio.to_thread(crawler.check_batch_scrape_status, job_id), "status")
+                logger.debug("[BATCH ASYNC] Job status: %s (%s/%s)", job_status.status, job_status.completed, job_status.total)
+
+                documents = job_status.data or []
+                if len(documents) > yielded:
+                    for doc in documents[yielded:]:
+                        yield doc
+                    yielded = len(documents)
+                    delay = BATCH_POLL_MIN_SECONDS
+                else:
+                    delay = min(delay * BATCH_POLL_BACKOFF, BATCH_POLL_MAX_SECONDS)
+
+                if job_status.status == "completed":
+                    logger.info("[BATCH ASYNC] Job %s completed successfully.", job_id)
+                    finished = True
+                    return
+                elif job_status.status == "failed":
+                    logger.error("[BATCH ASYNC] Job %s failed.", job_id)
+                    finished = True
+                    return
+                elif job_status.status == "cancelled":
+                    logger.warning("[BATCH ASYNC] Job %s was cancelled.", job_id)
+                    finished = True
+                    return
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning("[BATCH ASYNC] Job %s exceeded its deadline with %s/%s documents.", job_id, yielded, len(urls))
+                    return
+
+                await asyncio.sleep(min(delay, remaining))
+        finally:
+            # Deadline hit, consumer stopped early, or the task was cancelled.
+            if not finished:
+                await _cancel_batch_scrape(job_id)
 
 # === Batch Crawl === #
-async def batch_scrape_async(urls: List[str], formats: List[str] = ["markdown"]) -> dict:
+async def batch_scrape_async(urls: List[str], formats: List[str] = ["markdown"]) -> List[Any]:
     """
-    Perform an asynchronous batch scrape and poll until completion.
+    Perform an asynchronous batch scrape and wait for completion (or the deadline).
 
     Args:
         urls (List[str]): URLs to scrape.
         formats (List[str]): Output formats.
 
     Returns:
-        dict: Final result of the job.
+        List[FirecrawlDocument]: All documents completed before the job finished.
     """
     try:
-        print(urls)
-        logger.info(f"[BATCH ASYNC] Submitting async batch job for {len(urls)} URLs...")
-        job = crawler.async_batch_scrape_urls(urls, formats=formats)
-        job_id = job.id
-        logger.info(f"[BATCH ASYNC] Job submitted with ID: {job_id}")
-        while True:
-            job_status = crawler.check_batch_scrape_status(job_id)
-            logger.debug(f"[BATCH ASYNC] Job status: {job_status}")
-
-            if job_status.status == "completed":
-                logger.info(f"[BATCH ASYNC] Job {job_id} completed successfully.")
-                return job_status
-            elif job_status.status == "failed":
-                logger.error(f"[BATCH ASYNC] Job {job_id} failed.")
-                return job_status
-            elif job_status.status == "cancelled":
-                logger.warning(f"[BATCH ASYNC] Job {job_id} was cancelled.")
-                return job_status
-
-            await asyncio.sleep(2)
-
+        return [doc async for doc in iter_batch_scrape(urls, formats=formats)]
 
     except Exception as e:
-        logger.error(f"[BATCH ASYNC] Exception during async batch scrape: {e}", exc_info=True)
-        return {}
+        logger.error("[BATCH ASYNC] Exception during async batch scrape: %s", e, exc_info=True)
+        return []
 
 # === BREAKDOWN QUERY === #
-async def breakdown_query(user_query):
+# The prompt asks for 3 to 6 sub-queries; source selection weighs in results from all of them
+BREAKDOWN_MAX_SUB_QUERIES = int(os.getenv("BREAKDOWN_MAX_SUB_QUERIES", "6"))
+
+async def breakdown_query(user_query, history: Optional[List[str]] = None):
     """
     Breaks down the user's main query into multiple efficient and precise sub-queries 
     suitable for use as Google search queries.
 
     Parameters:
         user_query (str): The original query input provided by the user.
+        history (Optional[List[str]]): Earlier questions of the same conversation, so
+                                       follow-ups like "and last week?" can be resolved.
 
     Returns:
-        List[str]: A list of at least 3 (or more) search-optimized sub-queries.
+        List[str]: 3 to BREAKDOWN_MAX_SUB_QUERIES search-optimized sub-queries, most relevant first.
                    If the agent fails to return valid sub-queries after a retry, 
-                   it returns a hardcoded error message.
+                   it returns a hardcoded error message. If the LLM call itself fails
+                   (after agent.upstream's retries) or Gemini's circuit is open, the
+                   query is searched as-is.
 
     Raises:
         Logs error if both attempts fail.
     """
 
+    conversation = ""
+    if history:
+        earlier = "\n".join(f"- {question}" for question in history)
+        conversation = (
+            "### Earlier questions in this conversation:\n"
+            f"{earlier}\n"
+            "The user query may be a follow-up: resolve references to them so every search query stands on its own.\n\n"
+        )
+
     prompt_template = f"""
 You are a professional-grade research assistant designed to generate **efficient, Google-searchable queries** 
 from a user's question. Your task is to break down the user query into **3 to 6 concise and highly specific search queries**, 
@@ -187,7 +413,7 @@ Sub-Queries:
 
 ---
 
-Now respond to the following user query:
+{conversation}Now respond to the following user query:
 
 User Query:
 \"\"\"{user_query}\"\"\"
@@ -197,9 +423,13 @@ Sub-Queries:
 
     for attempt in range(2):
         try:
-            logger.info(f"[GEMINI-AGENT] Attempt {attempt + 1}: Generating search queries from user query.")
+            logger.info("[GEMINI-AGENT] Attempt %s: Generating search queries from user query.", attempt + 1)
 
-            response = await llm.ainvoke([HumanMessage(content=prompt_template)])
+            async with stage_limits["llm"]:
+                response = await hedged(
+                    _breakdown_latency, lambda: llm_upstream.call(lambda: clients.llm().ainvoke(prompt_template), "breakdown")
+                )
+            record_llm_usage("breakdown", response.usage_metadata, prompt_template, response.content)
             raw_lines = response.content.strip().splitlines()
 
             sub_qs = [
@@ -209,58 +439,105 @@ Sub-Queries:
             ]
 
             if len(sub_qs) >= 3:
-                logger.info(f"[GEMINI-AGENT] Successfully parsed {len(sub_qs)} sub-queries.")
-                return sub_qs[:3]
+                logger.info("[GEMINI-AGENT] Successfully parsed %s sub-queries.", len(sub_qs))
+                return sub_qs[:BREAKDOWN_MAX_SUB_QUERIES]
             else:
-                logger.warning(f"[GEMINI-AGENT] Invalid or insufficient sub-queries on attempt {attempt + 1}. Raw output:\n{response.content}")
+                logger.warning("[GEMINI-AGENT] Invalid or insufficient sub-queries on attempt %s. Raw output:\n%s", attempt + 1, lazy(lambda: response.content))
 
         except Exception as e:
-            logger.error(f"[GEMINI-AGENT] Exception while generating sub-queries: {str(e)}")
+            # Transient failures were already retried with backoff; asking again right away would not help
+            logger.error("[GEMINI-AGENT] Exception while generating sub-queries: %s; searching the query as-is.", str(e))
+            return [user_query]
 
     logger.error("[GEMINI-AGENT] Failed to generate valid sub-queries after 2 attempts.")
     return ["[GEMINI-ERROR] Failed to generate sub-queries for the given user query."]
 
 # === DATA MODELS === #
-class Metadata(BaseModel):
-    position: Optional[int]
-    title: str
-    link: HttpUrl
-    redirect_link: Optional[HttpUrl]
-    displayed_link: Optional[str]
-    favicon: Optional[HttpUrl]
-    snippet: Optional[str]
-    snippet_highlighted_words: Optional[List[str]]
-    source: Optional[str]
-
-class ScrapeDataPoint(BaseModel):
-    link: HttpUrl
-    metadata: Metadata
-    markdown: str
+# Documents are plain `__slots__` records: one per in-flight page, holding the only
+# copy of its cleaned markdown. Validation is lenient - only the link is required;
+# optional SERP fields that are missing or malformed become None instead of dropping the page.
+def _http_url(value: Any) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    parts = urlsplit(value)
+    return value if parts.scheme in ("http", "https") and parts.netloc else None
+
+
+def _optional_str(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) and value else None
+
+
+class Metadata:
+    """SERP fields of one source, as used in the prompts."""
+
+    __slots__ = (
+        "position", "title", "link", "redirect_link", "displayed_link",
+        "favicon", "snippet", "snippet_highlighted_words", "source",
+    )
+
+    def __init__(self, link: str, result: dict):
+        position = result.get("position")
+        self.position = position if isinstance(position, int) and not isinstance(position, bool) else None
+        self.title = _optional_str(result.get("title")) or link
+        self.link = link
+        self.redirect_link = _http_url(result.get("redirect_link"))
+        self.displayed_link = _optional_str(result.get("displayed_link"))
+        self.favicon = _http_url(result.get("favicon"))
+        self.snippet = _optional_str(result.get("snippet"))
+        words = result.get("snippet_highlighted_words")
+        self.snippet_highlighted_words = [w for w in words if isinstance(w, str)] if isinstance(words, list) else None
+        self.source = _optional_str(result.get("source"))
+
+
+class ScrapeDataPoint:
+    """One scraped source ready for the prompt: its link, SERP metadata and cleaned markdown."""
+
+    __slots__ = ("link", "metadata", "markdown")
+
+    def __init__(self, link: str, metadata: Metadata, markdown: str):
+        self.link = link
+        self.metadata = metadata
+        self.markdown = markdown
+
 
 # === PREPARE AND VALIDATE ENRICHED SCRAPE TARGETS === #
+def make_datapoint(link: Any, result: Any, markdown: Any) -> Optional[ScrapeDataPoint]:
+    """
+    Build a datapoint from a scrape target and its markdown, or None if it is unusable.
+
+    Args:
+        link (Any): The target URL; must be an absolute http(s) URL.
+        result (Any): The SERP result the target came from (a dict; anything else counts as empty).
+        markdown (Any): The cleaned page markdown; must be a non-blank string.
+
+    Returns:
+        Optional[ScrapeDataPoint]: The datapoint, with `markdown` stripped once here so
+                                   prompt builders can use it as-is.
+    """
+    link = _http_url(link)
+    if link is None:
+        logger.warning("[VALIDATION] Skipped document without a valid http(s) link.")
+        return None
+    markdown = markdown.strip() if isinstance(markdown, str) else ""
+    if not markdown:
+        logger.warning("[VALIDATION] Skipped document with no content: %s", link)
+        return None
+    return ScrapeDataPoint(link, Metadata(link, result if isinstance(result, dict) else {}), markdown)
+
+
 def convert_to_datapoints(raw_items: List[dict]) -> List[ScrapeDataPoint]:
-    valid_datapoints = []
-    for item in raw_items:
-        try:
-            # Validate necessary keys exist
-            if "link" not in item or "metadata" not in item or "markdown" not in item:
-                logger.warning(f"[VALIDATION] Missing required fields in item: {item.get('link', '[no-link]')}")
-                continue
+    datapoints = (make_datapoint(item.get("link"), item.get("metadata"), item.get("markdown")) for item in raw_items)
+    return [dp for dp in datapoints if dp is not None]
 
-            # Parse metadata using Pydantic model
-            metadata = Metadata(**item["metadata"])
-            dp = ScrapeDataPoint(link=item["link"], metadata=metadata, markdown=item["markdown"])
-            valid_datapoints.append(dp)
-        except Exception as e:
-            logger.warning(f"[DATAPOINT VALIDATION] Skipped invalid item due to error: {e}")
-    return valid_datapoints
+# === PROMPT BUDGET SETTINGS === #
+# Token budget for all MARKDOWN CONTENT sections together; 0 disables passage selection
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_MIN_TOKENS_PER_SOURCE = int(os.getenv("PROMPT_MIN_TOKENS_PER_SOURCE", "400"))
 
 # === PROMPT TEMPLATE === #
-def build_llm_prompt(user_query: str, datapoints: List[ScrapeDataPoint]) -> str:
-    blocks = [f"## USER QUERY\n\n{user_query}\n\n"]
-    for idx, dp in enumerate(datapoints):
-        meta = dp.metadata
-        blocks.append(f"""
+def _datapoint_header(idx: int, dp: ScrapeDataPoint, heading: str) -> str:
+    meta = dp.metadata
+    return f"""
 ### DATAPOINT #{idx + 1}
 **Title:** {meta.title}
 **Link:** {meta.link}
@@ -272,11 +549,21 @@ def build_llm_prompt(user_query: str, datapoints: List[ScrapeDataPoint]) -> str:
 **Favicon:** {meta.favicon or 'N/A'}
 **Highlighted Words:** {", ".join(meta.snippet_highlighted_words or [])}
 
-### MARKDOWN CONTENT
-{dp.markdown.strip()}
-        """)
-    # Add formatting expectations for the agent
-    blocks.append("""
+### {heading}
+"""
+
+
+def _assemble_prompt(user_query: str, datapoints: List[ScrapeDataPoint], heading: str, contents: List[str]) -> str:
+    # Pieces are joined once, so each document's text is copied into the prompt exactly once
+    parts = [f"## USER QUERY\n\n{user_query}\n\n"]
+    for idx, (dp, content) in enumerate(zip(datapoints, contents)):
+        parts += ("\n", _datapoint_header(idx, dp, heading), content, "\n        ")
+    parts += ("\n", SUMMARY_INSTRUCTIONS)
+    return "".join(parts)
+
+
+# Formatting expectations for the summarizer (single prompt and reduce step alike)
+SUMMARY_INSTRUCTIONS = """
 ---
 
 
@@ -315,21 +602,200 @@ You are a precise, factual assistant. Analyze the provided markdowns and generat
     -   Use only the content from the markdowns. DO NOT hallucinate.
 	-   Ensure returned JSON is well-formed, Markdown-wrapped, and fully parseable.
 	-   Do not include anything outside the code block.         
-""")
-    return "\n".join(blocks)
+"""
+
+
+def build_llm_prompt(user_query: str, datapoints: List[ScrapeDataPoint], sub_queries: Optional[List[str]] = None) -> str:
+    """
+    Build the summarizer prompt. When PROMPT_TOKEN_BUDGET is set, each datapoint's markdown
+    is reduced to its passages most relevant to the query and sub-queries (BM25), with
+    every source guaranteed at least PROMPT_MIN_TOKENS_PER_SOURCE tokens.
+    """
+    if PROMPT_TOKEN_BUDGET > 0:
+        contents = select_passages(
+            [dp.markdown for dp in datapoints],
+            [user_query, *(sub_queries or [])],
+            token_budget=PROMPT_TOKEN_BUDGET,
+            min_tokens_per_source=PROMPT_MIN_TOKENS_PER_SOURCE,
+        )
+    else:
+        contents = [dp.markdown for dp in datapoints]
+    return _assemble_prompt(user_query, datapoints, "MARKDOWN CONTENT", contents)
+
+
+# === Map-Reduce Summarization Settings === #
+# "single" sends every document in one prompt; "map_reduce" first distills each
+# document into short notes (concurrently, cached) and summarizes the notes
+SUMMARIZE_MODE = os.getenv("SUMMARIZE_MODE", "single").lower()
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "4"))
+# Tokens of each document's most relevant passages sent to its extraction call
+MAP_DOC_TOKEN_BUDGET = int(os.getenv("MAP_DOC_TOKEN_BUDGET", "3000"))
+MAP_NOTES_MAX_WORDS = 150
+# A source whose extraction call failed is represented by this much of its best text instead
+MAP_FALLBACK_TOKENS = 300
+NOT_RELEVANT = "NOT RELEVANT"
+_map_latency = LatencyTracker("map")
+
+
+def build_map_prompt(user_query: str, dp: ScrapeDataPoint) -> str:
+    """Extraction prompt for one document; depends only on the query and the document, so its output is cacheable."""
+    content = dp.markdown
+    if MAP_DOC_TOKEN_BUDGET > 0:
+        content = select_passages([content], [user_query], token_budget=MAP_DOC_TOKEN_BUDGET, min_tokens_per_source=MAP_DOC_TOKEN_BUDGET)[0]
+    return f"""
+You are extracting facts from one web page for a research assistant that will answer the user query below.
+
+## USER QUERY
+
+{user_query}
+
+## SOURCE
+**Title:** {dp.metadata.title}
+**Link:** {dp.metadata.link}
+
+### MARKDOWN CONTENT
+{content}
+
+### INSTRUCTIONS
+- List the facts from this source that help answer the user query as short markdown bullets, at most {MAP_NOTES_MAX_WORDS} words in total.
+- Keep numbers, dates, names and comparisons exactly as written, and include any video links (YouTube etc.) found in the content.
+- Use only this source. DO NOT add outside knowledge.
+- If nothing in the source is relevant, reply with exactly: {NOT_RELEVANT}
+
+NOTES:
+""".strip()
+
+
+def build_reduce_prompt(user_query: str, datapoints: List[ScrapeDataPoint], notes: List[str]) -> str:
+    """Summarizer prompt over per-document notes instead of markdown; stays small however many sources there are."""
+    return _assemble_prompt(user_query, datapoints, "EXTRACTED NOTES", notes)
+
+
+async def extract_document_notes(user_query: str, datapoints: List[ScrapeDataPoint]) -> List[str]:
+    """
+    Map step: distill every document into query-focused notes, MAP_CONCURRENCY calls at a time.
+
+    Notes are cached by document content plus query intent (the query's content words),
+    so popular pages are distilled once and reused across users' questions.
+
+    Args:
+        user_query (str): The user's question.
+        datapoints (List[ScrapeDataPoint]): Validated documents.
+
+    Returns:
+        List[str]: Notes per datapoint (aligned with `datapoints`); NOT_RELEVANT for
+                   sources with nothing useful.
+    """
+    intent = " ".join(query_terms(user_query))
+    keys = [SummaryCache.key(dp.markdown, intent) for dp in datapoints]
+    cached = await summary_cache.get_many(keys) if summary_cache is not None else {}
+    limit = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    async def extract(dp: ScrapeDataPoint) -> str:
+        prompt = build_map_prompt(user_query, dp)
+        async with limit, stage_limits["llm"]:
+            response = await hedged(_map_latency, lambda: llm_upstream.call(lambda: clients.llm().ainvoke(prompt), "map"))
+        record_llm_usage("map", response.usage_metadata, prompt, response.content)
+        return response.content.strip()
+
+    missing = [idx for idx, key in enumerate(keys) if key not in cached]
+    with span("map"):
+        outputs = await asyncio.gather(*(extract(datapoints[idx]) for idx in missing), return_exceptions=True)
+
+    notes = [cached.get(key) for key in keys]
+    fresh = {}
+    for idx, output in zip(missing, outputs):
+        if isinstance(output, Exception) or not output:
+            logger.warning("[MAP] Extraction failed for %s: %r; using an excerpt.", datapoints[idx].metadata.link, output)
+            notes[idx] = select_passages(
+                [datapoints[idx].markdown], [user_query], token_budget=MAP_FALLBACK_TOKENS, min_tokens_per_source=MAP_FALLBACK_TOKENS
+            )[0]
+        else:
+            notes[idx] = fresh[keys[idx]] = output
+    if summary_cache is not None and fresh:
+        await summary_cache.set_many(fresh)
+    logger.info("[MAP] Notes for %s documents: %s cached, %s extracted.", len(datapoints), len(datapoints) - len(missing), len(fresh))
+    return notes
+
+def sources_only_answer(user_query: str, datapoints: List[ScrapeDataPoint], reason: str) -> dict:
+    """
+    Fallback answer while Gemini is unavailable: the gathered sources, each with its
+    most relevant excerpt. Marked `"degraded": True` so it is never cached.
+    """
+    excerpts = select_passages(
+        [dp.markdown for dp in datapoints], [user_query],
+        token_budget=MAP_FALLBACK_TOKENS * len(datapoints), min_tokens_per_source=MAP_FALLBACK_TOKENS,
+    ) if datapoints else []
+    sections = [f"The summarizer is temporarily unavailable ({reason}). These are the sources found for your question."]
+    for dp, excerpt in zip(datapoints, excerpts):
+        sections.append(f"## [{dp.metadata.title}]({dp.link})\n{excerpt}")
+    return {
+        "detailed_analysis": "\n\n".join(sections),
+        "websites": [
+            {"favicon_url": dp.metadata.favicon, "link": dp.link, "snippet": dp.metadata.snippet or excerpt[:200]}
+            for dp, excerpt in zip(datapoints, excerpts)
+        ],
+        "videos": [],
+        "degraded": True,
+    }
 
 # === AGENT INVOCATION === #
-async def summarize_for_user(user_query: str, datapoints: List[ScrapeDataPoint]):
+async def summarize_for_user(
+    user_query: str,
+    datapoints: List[ScrapeDataPoint],
+    on_token: Optional[Callable[[str], None]] = None,
+    sub_queries: Optional[List[str]] = None,
+):
         # === Build Prompt === #
-    prompt_template = build_llm_prompt(user_query, datapoints)
+    if SUMMARIZE_MODE == "map_reduce" and datapoints:
+        notes = await extract_document_notes(user_query, datapoints)
+        relevant = [(dp, text) for dp, text in zip(datapoints, notes) if text.strip() != NOT_RELEVANT]
+        if relevant:
+            datapoints, notes = [dp for dp, _ in relevant], [text for _, text in relevant]
+        with span("prompt_build"):
+            prompt_template = build_reduce_prompt(user_query, datapoints, notes)
+    else:
+        with span("prompt_build"):
+            prompt_template = build_llm_prompt(user_query, datapoints, sub_queries=sub_queries)
 
         # === Invoke LLM === #
     logger.info("[GEMINI-SUMMARIZER-AGENT] Sending prompt to LLM...")
-    response = await llm.ainvoke([HumanMessage(content=prompt_template)])
+    try:
+        async with stage_limits["llm"]:
+            with span("summarize"):
+                if on_token is None:
+                    response = await hedged(
+                        _summarize_latency, lambda: llm_upstream.call(lambda: clients.llm().ainvoke(prompt_template), "summarize")
+                    )
+                    content = response.content
+                    usage = response.usage_metadata
+                else:
+                    # Stream the detailed_analysis text out while the rest of the JSON is still being generated
+                    streamer = JsonStringFieldStreamer("detailed_analysis")
+                    parts = []
+                    usage = {}
+                    stream = lambda: llm_upstream.stream(lambda: clients.llm().astream(prompt_template), "summarize_stream")
+                    async for chunk in hedged_stream(_summarize_stream_latency, stream):
+                        parts.append(chunk.content)
+                        # Streamed chunks carry usage deltas, so they add up to the call's total
+                        for name, count in (chunk.usage_metadata or {}).items():
+                            if isinstance(count, int):
+                                usage[name] = usage.get(name, 0) + count
+                        text = streamer.feed(chunk.content)
+                        if text:
+                            on_token(text)
+                    text = streamer.finish()
+                    if text:
+                        on_token(text)
+                    content = "".join(parts)
+    except UpstreamUnavailable as e:
+        logger.warning("[GEMINI-SUMMARIZER-AGENT] %s; answering with the sources only.", e)
+        return sources_only_answer(user_query, datapoints, e.reason)
+    record_llm_usage("summarize", usage, prompt_template, content)
     logger.info("[GEMINI-SUMMARIZER-AGENT] Response received.")
 
     # === Extract JSON Block from Markdown === #
-    json_block_match = re.search(r"```json\s*(\{.*?\})\s*```", response.content, re.DOTALL)
+    json_block_match = re.search(r"```json\s*(\{.*?\})\s*```", content, re.DOTALL)
     if not json_block_match:
         logger.error("[GEMINI-SUMMARIZER-AGENT] Failed to extract JSON from model output.")
         raise ValueError("Failed to extract JSON from model output.")
@@ -341,11 +807,11 @@ async def summarize_for_user(user_query: str, datapoints: List[ScrapeDataPoint])
         parsed_response = json.loads(json_str)
         logger.info("[PARSE] Successfully parsed JSON with json.loads.")
     except Exception as e:
-        logger.warning(f"[PARSE] json.loads failed: {e}, trying ast.literal_eval...")
+        logger.warning("[PARSE] json.loads failed: %s, trying ast.literal_eval...", e)
         try:
             parsed_response = ast.literal_eval(json_str)
         except Exception as e:
-            logger.error(f"[PARSE] Failed to parse JSON via ast.literal_eval: {e}")
+            logger.error("[PARSE] Failed to parse JSON via ast.literal_eval: %s", e)
             raise
 
     # === Final Schema Validation (safe access with defaults) === #
@@ -355,184 +821,742 @@ async def summarize_for_user(user_query: str, datapoints: List[ScrapeDataPoint])
         "videos": parsed_response.get("videos", []),
     }
 
-    # === Save Output to Disk === #
-    output_dir = Path("user_response")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    filename = f"user_response_result_{uuid.uuid4()}.json"
-    output_path = output_dir / filename
+    return final_output
+
+
+
+# === Streaming Pipeline Settings === #
+# Start summarizing once this many validated documents are in hand...
+PIPELINE_DOC_QUORUM = int(os.getenv("PIPELINE_DOC_QUORUM", "4"))
+# ...or once this many seconds have passed since the search stage started
+PIPELINE_QUORUM_DEADLINE_SECONDS = float(os.getenv("PIPELINE_QUORUM_DEADLINE_SECONDS", "30"))
+
+
+# === Producer: Scrape the Selected Sources === #
+async def _scrape_sources(urls: List[str], doc_queue: asyncio.Queue) -> None:
+    """
+    Scrapes the selected URLs and pushes their documents onto `doc_queue` as they land.
+
+    Each queue item is a `(requested_url, final_url, markdown, source)` tuple, where `source`
+    is "fresh" (scraped by this job's Firecrawl batch), "local" (fetched by the local fetcher),
+    "cache" (scrape cache) or "shared" (another request's job).
 
+    URLs the scrape router deems simple are fetched locally first; the ones that fail
+    (blocked, script-rendered, too large, ...) go to Firecrawl in one follow-up batch job.
+    While Firecrawl's circuit is open, every URL is tried with the local fetcher (if enabled).
+
+    Args:
+        urls (List[str]): URLs picked by source selection.
+        doc_queue (asyncio.Queue): Shared queue feeding the validation/prompt stage.
+    """
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(final_output, f, ensure_ascii=False, indent=2)
-        logger.info(f"[SAVE] Output saved to {output_path}")
-    except Exception as e:
-        logger.error(f"[SAVE ERROR] Failed to save output: {e}")
-        raise
+        with span("scrape"):
+            # === Serve already-scraped pages from the scrape cache === #
+            cached = await scrape_cache.get_many(urls) if scrape_cache is not None else {}
+            for url, markdown in cached.items():
+                doc_queue.put_nowait((url, url, markdown, "cache"))
+            # === Share URLs already being scraped by another (or this) request === #
+            urls_to_fetch = []
+            joined = {}
+            for url in urls:
+                if url in cached:
+                    continue
+                future = _scrape_inflight.claim(canonicalize_url(url))
+                if future is None:
+                    urls_to_fetch.append(url)
+                else:
+                    joined[url] = future
+            logger.info(
+                "[SCRAPER] %s URLs from cache, %s joined in-flight, %s to fetch.", len(cached), len(joined), len(urls_to_fetch)
+            )
+
+            # === Scrape the rest, handing documents over as they complete === #
+            def deliver(requested_url: str, final_url: str, markdown: str, source: str) -> None:
+                doc_queue.put_nowait((requested_url, final_url, markdown, source))
+                _scrape_inflight.resolve(canonicalize_url(requested_url), markdown)
+
+            async def firecrawl(batch_urls: List[str]) -> None:
+                try:
+                    async for doc in iter_batch_scrape(batch_urls):
+                        metadata = doc.metadata or {}
+                        url = metadata.get("url")
+                        if url and doc.markdown is not None:
+                            deliver(metadata.get("sourceURL") or url, url, doc.markdown, "fresh")
+                except UpstreamUnavailable as e:
+                    logger.warning("[SCRAPER] Skipping Firecrawl for %s URLs: %s", len(batch_urls), e)
+
+            async def fetch_locally(url: str) -> Optional[str]:
+                """Returns the URL back if it has to go to Firecrawl instead."""
+                try:
+                    final_url, markdown = await clients.local_fetcher().fetch(url)
+                except LocalFetchError as e:
+                    reason = e.reason
+                except Exception as e:
+                    logger.warning("[LOCAL FETCH] Unexpected error for %s: %s", url, e)
+                    reason = "error"
+                else:
+                    scrape_router.record(url, None)
+                    deliver(url, final_url, markdown, "local")
+                    return None
+                scrape_router.record(url, reason)
+                logger.info("[LOCAL FETCH] Falling back to Firecrawl for %s (%s).", url, reason)
+                return url
+
+            async def local_then_firecrawl(local_urls: List[str]) -> None:
+                # Fallbacks known within LOCAL_FETCH_FALLBACK_WAIT_SECONDS go to Firecrawl right
+                # away; slow local attempts (timeouts, politeness waits) fail into a second job
+                attempts = [asyncio.ensure_future(fetch_locally(url)) for url in local_urls]
+                try:
+                    done, pending = await asyncio.wait(attempts, timeout=LOCAL_FETCH_FALLBACK_WAIT_SECONDS) if attempts else ((), ())
 
-    return final_output
+                    async def late_fallbacks() -> None:
+                        await firecrawl([url for url in await asyncio.gather(*pending) if url])
 
+                    await asyncio.gather(firecrawl([task.result() for task in done if task.result()]), late_fallbacks())
+                finally:
+                    for task in attempts:
+                        task.cancel()
 
+            async def scrape_owned():
+                try:
+                    if firecrawl_upstream.available():
+                        local_urls = [url for url in urls_to_fetch if scrape_router.use_local(url)]
+                    else:
+                        local_urls = urls_to_fetch if scrape_router.enabled else []
+                    firecrawl_urls = [url for url in urls_to_fetch if url not in local_urls]
+                    if local_urls:
+                        logger.info("[SCRAPER] %s URLs routed to the local fetcher, %s to Firecrawl.", len(local_urls), len(firecrawl_urls))
+                    await asyncio.gather(firecrawl(firecrawl_urls), local_then_firecrawl(local_urls))
+                finally:
+                    # Wake anyone waiting on URLs this job did not deliver
+                    for url in urls_to_fetch:
+                        _scrape_inflight.resolve(canonicalize_url(url), None)
+
+            async def await_joined(url, future):
+                markdown = await asyncio.shield(future)
+                if markdown is not None:
+                    doc_queue.put_nowait((url, url, markdown, "shared"))
+
+            await asyncio.gather(scrape_owned(), *(await_joined(url, future) for url, future in joined.items()))
 
-# === Define the schema for a single scraped target === #
-class ScrapeTarget(BaseModel):
-    link: HttpUrl
-    metadata: dict
+    except Exception as e:
+        logger.exception("[ERROR] Failed to scrape selected sources: %s", e)
 
 
 # === Process User Query and Prepare Scraping Targets === #
-async def process_query(user_query: str):
+async def process_query(
+    user_query: str,
+    on_event: Optional[Callable[[dict], None]] = None,
+    task_id: Optional[str] = None,
+    budget_seconds: Optional[float] = None,
+    session_id: Optional[str] = None,
+):
     """
-    Handles the full processing pipeline for a given user query:
-    1. Breaks down the query into optimized sub-queries.
-    2. Searches each sub-query using SERP API.
-    3. Saves the search results in disk-safe JSON format.
-    4. Extracts top URLs to scrape with associated metadata.
+    Handles the full processing pipeline for a given user query as a streaming pipeline,
+    within an end-to-end latency budget split across the stages:
+    1. Breaks down the query into optimized sub-queries (falls back to the query itself
+       if this takes more than BUDGET_BREAKDOWN_SHARE of the budget).
+    2. In a session, sub-queries already answered by documents gathered in earlier turns
+       reuse them; only the remaining sub-queries are searched, concurrently, for up to
+       BUDGET_SEARCH_SHARE of the budget.
+    3. Source selection dedupes the results of all sub-queries by canonical URL and
+       picks the best SCRAPE_BUDGET_URLS pages, favouring domain diversity; they are
+       scraped in one job (cache hits skip the scrape entirely).
+    4. Scraped documents are enriched and validated as they land.
+    5. Summarization starts once PIPELINE_DOC_QUORUM documents are ready, the
+       PIPELINE_QUORUM_DEADLINE_SECONDS deadline passes, only BUDGET_SUMMARIZE_SHARE of
+       the budget is left, or every scrape has finished. Scrapes still running at that
+       point are cancelled and listed in "skipped_sources".
     
     Parameters:
         user_query (str): The original user-supplied query string.
+        on_event (Optional[Callable[[dict], None]]): Receives progress events as the pipeline
+            advances. Every event has "stage" and "message" keys; "token" events carry
+            a "text" chunk of the streamed detailed_analysis.
+        task_id (Optional[str]): ID to tag this run with (e.g. a background job ID);
+            generated when omitted.
+        budget_seconds (Optional[float]): End-to-end latency budget; defaults to
+            PIPELINE_BUDGET_SECONDS. A coalesced run keeps the budget of its first caller.
+        session_id (Optional[str]): Session key (see `agent.sessions.session_key`). Documents
+            scraped in this run are kept in the session for follow-up questions.
     
     Returns:
         dict: {
-            "task_id": str,              # UUID for the task
-            "sub_queries": List[str],    # All derived sub-queries
-            "to_scrape": List[dict]      # Each item contains 'link' and 'metadata'
+            "detailed_analysis": str,
+            "websites": List[dict],
+            "videos": List[str],
+            "skipped_sources": List[dict]  # {"link", "reason"} for selected pages left out
+            "degraded": bool               # only on sources-only answers while Gemini is unavailable
         }
+    
+    Concurrent calls with the same normalized query share a single pipeline run; every
+    caller receives its result, and callers with `on_event` receive its remaining events.
+    Near-duplicate questions answered within ANSWER_CACHE_TTL_SECONDS are served from
+    the semantic answer cache without running the pipeline, unless they follow up on
+    earlier turns of a session (their meaning then depends on the conversation). For
+    ANSWER_CACHE_STALE_SECONDS after that, the stored answer is still served at once
+    while a background run refreshes it (see `agent.warming`).
+    """
+    session = session_store.get(session_id, create=False) if session_id and session_store is not None else None
+    follow_up = session is not None and bool(session.history)
+    if answer_cache is not None and not follow_up:
+        answer_warmer.record(user_query)
+        hit = answer_cache.lookup(user_query)
+        if hit is not None:
+            if hit.stale:
+                answer_warmer.refresh_soon(hit.query, "stale")
+            if on_event is not None:
+                on_event({"stage": "answer_cache", "message": "Serving a recent answer to a similar question"})
+            return hit.answer
+
+    return await _run_coalesced(user_query, on_event, task_id, budget_seconds, session_id)
+
+
+async def _run_coalesced(
+    user_query: str,
+    on_event: Optional[Callable[[dict], None]] = None,
+    task_id: Optional[str] = None,
+    budget_seconds: Optional[float] = None,
+    session_id: Optional[str] = None,
+):
     """
-    task_id = str(uuid.uuid4())
-    logger.info(f"[AGENT] Starting task {task_id} for user query: '{user_query}'")
+    Runs the pipeline for `user_query`, or joins the run already in flight for the same
+    normalized query. The shared run records its stage timings on its own; every caller,
+    leader or joiner, gets them added to its request's timings (Server-Timing header).
+    """
+    key = normalize_query(user_query)
+    if session_id:
+        key = f"{session_id}\x00{key}"
+    listeners = _query_listeners.setdefault(key, [])
+    if on_event is not None:
+        listeners.append(on_event)
+
+    def broadcast(event: dict) -> None:
+        for listener in list(listeners):
+            listener(event)
+
+    try:
+        result, run_timings = await _query_flight.do(key, lambda: _timed_pipeline(
+            user_query, on_event=broadcast, task_id=task_id, budget_seconds=budget_seconds, session_id=session_id
+        ))
+        timings = current_timings.get()
+        if timings is not None:
+            for stage, seconds in run_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        return result
+    finally:
+        if on_event is not None:
+            listeners.remove(on_event)
+        if not listeners and key not in _query_flight:
+            _query_listeners.pop(key, None)
+
+
+# === Background Answer Refresh === #
+# Stale answers and popular queries are recomputed off the request path, bypassing the answer cache
+answer_warmer: Optional[AnswerWarmer] = (
+    AnswerWarmer(answer_cache, refresh=lambda query: _run_coalesced(query)) if answer_cache is not None else None
+)
+
+
+async def _timed_pipeline(user_query: str, **kwargs) -> Tuple[dict, Dict[str, float]]:
+    # Runs as the single-flight task, so this only replaces the timings dict in the task's own context
+    timings: Dict[str, float] = {}
+    current_timings.set(timings)
+    return await _run_pipeline(user_query, **kwargs), timings
+
+
+async def _run_pipeline(
+    user_query: str,
+    on_event: Optional[Callable[[dict], None]] = None,
+    task_id: Optional[str] = None,
+    budget_seconds: Optional[float] = None,
+    session_id: Optional[str] = None,
+):
+    """
+    Runs one uncoalesced pipeline execution for `process_query`. Its search results,
+    scrape targets, enriched documents and answer are saved as one artifact record.
+    """
+    task_id = task_id or str(uuid.uuid4())
+    artifacts = artifact_sink.open(task_id, user_query)
+    status = "failed"
+    pipelines_in_flight.inc()
+    try:
+        with span("pipeline", task_id):
+            result = await _run_stages(user_query, on_event, task_id, artifacts, budget_seconds, session_id)
+        status = "completed"
+        return result
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        pipelines_in_flight.dec()
+        artifact_sink.submit(artifacts, status)
+
+
+async def _run_stages(
+    user_query: str,
+    on_event: Optional[Callable[[dict], None]],
+    task_id: str,
+    artifacts: ArtifactRecord,
+    budget_seconds: Optional[float] = None,
+    session_id: Optional[str] = None,
+):
+    budget = LatencyBudget(budget_seconds or PIPELINE_BUDGET_SECONDS)
+    session = session_store.get(session_id) if session_id and session_store is not None else None
+    history = list(session.history) if session is not None else []
+    logger.info("[AGENT] Starting task %s for user query: '%s'", task_id, user_query)
+
+    def emit(stage: str, message: str, **fields) -> None:
+        if on_event is not None:
+            on_event({"stage": stage, "message": message, "task_id": task_id, **fields})
     
     # === Step 1: Break query into sub-queries === #
-    sub_questions = await breakdown_query(user_query)
+    emit("breakdown", "Creating sub-queries...")
+    with span("breakdown", task_id):
+        try:
+            sub_questions = await asyncio.wait_for(
+                breakdown_query(user_query, history=history), timeout=budget.allot(BUDGET_BREAKDOWN_SHARE)
+            )
+        except asyncio.TimeoutError:
+            logger.warning("[BUDGET] Breakdown overran its share of the %.0fs budget; searching the query as-is.", budget.total)
+            sub_questions = [user_query]
+    emit("sub_queries", "Scraping the web...", sub_queries=sub_questions)
+
+    # === Step 2: Reuse documents this session already gathered === #
+    reused: Dict[str, ScrapeDataPoint] = {}
+    uncovered = sub_questions
+    if session is not None and session.documents:
+        uncovered = []
+        for sub_q in sub_questions:
+            matches = session.search(sub_q, limit=SESSION_DOCS_PER_QUERY)
+            for document, _ in matches:
+                if document.link not in reused:
+                    dp = make_datapoint(document.link, document.metadata, document.markdown)
+                    if dp is not None:
+                        reused[document.link] = dp
+            if not matches:
+                uncovered.append(sub_q)
+        logger.info(
+            "[SESSION] Reusing %s of %s session documents; %s/%s sub-queries still need a search.",
+            len(reused), len(session.documents), len(uncovered), len(sub_questions),
+        )
+        if reused:
+            emit("session", "Reusing sources from earlier in the conversation", documents=len(reused))
+
+    # === Step 3: Search the rest, then pick the pages worth scraping === #
+    loop = asyncio.get_running_loop()
+    quorum_deadline = loop.time() + PIPELINE_QUORUM_DEADLINE_SECONDS
+    search_results = await search_sub_queries(
+        uncovered, num_results=SELECTION_RESULTS_PER_QUERY, timeout=budget.allot(BUDGET_SEARCH_SHARE)
+    )
+    # === Keep search results for auditability === #
+    for sub_q, results in zip(uncovered, search_results):
+        artifacts.append("search_results", {"query": sub_q, "output": results})
+
+    # Follow-ups top up with one new page per uncovered angle at least, not a full scrape budget
+    scrape_budget = max(SCRAPE_BUDGET_URLS - len(reused), len(uncovered)) if uncovered else 0
+    exclude = set(session.documents) if session is not None else set()
+    to_scrape: List[dict] = []
+    for candidate in select_sources(search_results, scrape_budget, exclude=exclude):
+        if _http_url(candidate.link) is None:
+            logger.warning("[SKIP] Invalid result link skipped: %r", candidate.link)
+            continue
+        to_scrape.append({"link": candidate.link, "metadata": candidate.result})
+
+    # Scraping may use the budget up to the share kept back for summarization
+    deadline = min(quorum_deadline, loop.time() + budget.remaining(reserve=BUDGET_SUMMARIZE_SHARE))
+    doc_queue: asyncio.Queue = asyncio.Queue()
+    producers = asyncio.ensure_future(_scrape_sources([item["link"] for item in to_scrape], doc_queue))
+
+    # === Step 4: Consume documents as they land === #
+    freshly_scraped = {}
+    enriched_links = set()
+    datapoints_by_link: Dict[str, ScrapeDataPoint] = {}
+    targets_by_link = {item["link"]: item for item in to_scrape}
+    cleaner = DocumentCleaner()
+
+    def handle_document(entry) -> None:
+        requested_url, final_url, markdown, source = entry
+        if source in ("fresh", "local") and scrape_cache is not None:
+            freshly_scraped[requested_url] = markdown
+        scrape_documents.inc(source)
+        scrape_bytes.inc(source, amount=utf8_size(markdown))
+
+        # Match the requested URL as well as the final one, so redirected pages still enrich their target.
+        # The cleaner remembers what it has seen, so each document is cleaned once, not once per link.
+        cleaned = None
+        for link in {requested_url, final_url}:
+            item = targets_by_link.get(link)
+            if item is None or link in enriched_links:
+                continue
+            enriched_links.add(link)
+            with span("postprocess"):
+                if cleaned is None:
+                    cleaned = cleaner.clean(markdown)
+                dp = make_datapoint(link, item["metadata"], cleaned)
+            if dp is not None:
+                datapoints_by_link[link] = dp
+                emit("scraped", "Batch-Scraping the selected websites", url=link)
+
+    # Session documents count towards the quorum, but follow-ups still wait for new
+    # pages covering the angles the session could not answer
+    for link, dp in reused.items():
+        datapoints_by_link.setdefault(link, dp)
+    doc_quorum = PIPELINE_DOC_QUORUM
+    if reused:
+        doc_quorum = len(datapoints_by_link) + min(len(to_scrape), max(PIPELINE_DOC_QUORUM - len(datapoints_by_link), len(uncovered)))
+
+    get_task = None
+    stop_reason = "complete"
+    try:
+        while len(datapoints_by_link) < doc_quorum:
+            if producers.done() and doc_queue.empty():
+                logger.info("[PIPELINE] All searches and scrapes finished.")
+                break
+            if get_task is None:
+                get_task = asyncio.ensure_future(doc_queue.get())
+            waiting_on = {get_task} if producers.done() else {get_task, producers}
+            # Past the deadline we only keep waiting if there is nothing to summarize yet
+            remaining = deadline - loop.time()
+            timeout = remaining if remaining > 0 else (None if not datapoints_by_link else 0)
+
+            done, _ = await asyncio.wait(waiting_on, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if get_task in done:
+                handle_document(get_task.result())
+                get_task = None
+            elif not done:
+                logger.warning(
+                    "[PIPELINE] Scrape deadline reached with %s documents (%.1fs of the %.0fs budget used).",
+                    len(datapoints_by_link), budget.elapsed(), budget.total,
+                )
+                stop_reason = "deadline"
+                break
+        else:
+            logger.info("[PIPELINE] Document quorum of %s reached.", doc_quorum)
+            stop_reason = "quorum"
+    finally:
+        if get_task is not None:
+            get_task.cancel()
+            try:
+                handle_document(await get_task)
+            except asyncio.CancelledError:
+                pass
+        if not producers.done():
+            # Stragglers are dropped; cancelling them also cancels their remote scrape jobs
+            producers.cancel()
+            try:
+                await producers
+            except asyncio.CancelledError:
+                pass
+
+    # Documents that landed while we were wrapping up are free to use
+    while not doc_queue.empty():
+        handle_document(doc_queue.get_nowait())
+
+    if scrape_cache is not None and freshly_scraped:
+        await scrape_cache.set_many(freshly_scraped)
+    # Raw pages and the duplicate index are not needed past this point; free them before the LLM call
+    freshly_scraped.clear()
+    cleaner.close()
+
+    clean_stats = cleaner.stats()
+    logger.info(
+        "[CLEAN] Task %s: saved %s bytes (~%s tokens) across %s documents, dropped %s duplicate paragraphs.",
+        task_id, clean_stats['bytes_saved'], clean_stats['tokens_saved'], clean_stats['documents'], clean_stats['duplicate_paragraphs'],
+    )
+
+    # === Keep selection order (most valuable first) and record what was left out === #
+    enriched_scrape_targets = []
+    skipped = []
+    for item in to_scrape:
+        link = item["link"]
+        if link in datapoints_by_link:
+            enriched_scrape_targets.append({**item, "markdown": datapoints_by_link[link].markdown})
+            continue
+        enriched_scrape_targets.append(item)
+        if link in enriched_links:
+            reason = "invalid"
+        elif stop_reason == "complete":
+            reason = "failed"
+        else:
+            # Still being scraped when the quorum or the deadline cut the stage short
+            reason = "straggler" if stop_reason == "quorum" else "deadline"
+        logger.warning("[ENRICH] No document for URL (%s): %s", reason, link)
+        skipped_sources.inc(reason)
+        skipped.append({"link": link, "reason": reason})
+    datapoints = [datapoints_by_link[link] for link in [*reused, *(item["link"] for item in to_scrape)] if link in datapoints_by_link]
+
+    # === Keep scrape targets and enriched documents (serialized off the event loop) === #
+    artifacts.put("scrape_targets", [{"link": item["link"], "metadata": item["metadata"]} for item in to_scrape])
+    artifacts.put("enriched_targets", enriched_scrape_targets)
 
-    # === Step 2: Prepare output directory for saving search results === #
-    output_dir = "serpai_folder"
-    os.makedirs(output_dir, exist_ok=True)
+    # === Final Summary === #
+    logger.info("[SUMMARY] Total URLs collected for scraping: %s", len(to_scrape))
+    logger.info("[SUMMARY] Enriched scrape target count: %s, valid datapoints: %s", len(enriched_links), len(datapoints))
+
+    emit("summarizing", "Summarizing", documents=len(datapoints))
+    on_token = (lambda text: emit("token", "", text=text)) if on_event is not None else None
+    result = await summarize_for_user(user_query, datapoints=datapoints, on_token=on_token, sub_queries=sub_questions)
+    result["skipped_sources"] = skipped
+    logger.info("[BUDGET] Task %s used %.1fs of its %.0fs budget.", task_id, budget.elapsed(), budget.total)
+    artifacts.put("user_response", result)
+    if session is not None:
+        # === Keep this turn's new documents for follow-up questions === #
+        for item in to_scrape:
+            dp = datapoints_by_link.get(item["link"])
+            if dp is not None:
+                session_store.add_document(session, dp.link, item["metadata"], dp.markdown)
+        session.add_turn(user_query)
+    if answer_cache is not None and datapoints and not history and not result.get("degraded"):
+        answer_cache.add(user_query, result)
+    logger.info("[AGENT] Query finished , response sent to user.")
+    return result
 
-    to_scrape: List[dict] = []
-    to_scrape_url_list: List[str] = []
-    for sub_q in sub_questions:
-        logger.info(f"[SUBTASK] Processing sub-query: '{sub_q}'")
-        try:
-            # === Step 3: Perform Google Search via SerpAPI === #
-            search_results = await serp_search(sub_q)
-            top_results = search_results[:2]  # Limit to top 2 results only
-            top_urls = [res.get("link") for res in search_results[:2] if res.get("link")]
-            to_scrape_url_list.extend(top_urls)
-            # === Step 4: Persist search results to JSON for auditability === #
-            wrapped_results = [{"query": sub_q, "output": top_results}]
-            filename = f"search_result_{uuid.uuid4()}.json"
-            filepath = os.path.join(output_dir, filename)
-
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(wrapped_results, f, indent=2, ensure_ascii=False)
-            logger.info(f"[SAVE] SERP results for query '{sub_q}' saved to: {filepath}")
-
-            # === Step 5: Extract valid URLs and package with metadata === #
-            for res in top_results:
-                try:
-                    item = ScrapeTarget(link=res["link"], metadata=res)
-                    to_scrape.append(item.model_dump(mode="json"))
-                except (KeyError, ValidationError) as ve:
-                    logger.warning(f"[SKIP] Invalid result skipped: {ve}")
 
-        except Exception as e:
-            logger.exception(f"[ERROR] Failed to handle sub-query '{sub_q}': {e}")
 
-    output_dir = "precrawl_results"
-    os.makedirs(output_dir, exist_ok=True)
+# === Batch Settings === #
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+# URLs per combined Firecrawl batch job; larger jobs mean fewer submits and status polls
+BATCH_SCRAPE_JOB_SIZE = int(os.getenv("BATCH_SCRAPE_JOB_SIZE", "100"))
+BATCH_SUMMARIZE_CONCURRENCY = int(os.getenv("BATCH_SUMMARIZE_CONCURRENCY", "4"))
 
-    filename = f"precrawl_result_{uuid.uuid4()}.json"
-    filepath = os.path.join(output_dir, filename)
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(to_scrape, f, indent=2, ensure_ascii=False)
+class _ScrapeJobDone:
+    """Queue marker: a combined scrape job finished; its undelivered URLs will not arrive."""
 
-    logger.info(f"[SAVE] SERP results for query '{sub_q}' saved to: {filepath}")
+    __slots__ = ("urls",)
 
-    # === Final Summary Logging === #
-    logger.info(f"[SUMMARY] Total URLs collected for scraping: {len(to_scrape)}")
-    logger.debug(f"[SUMMARY] URLs to scrape: {json.dumps(to_scrape, indent=2)}")
+    def __init__(self, urls: List[str]):
+        self.urls = urls
 
-    # # # === Run the batch scrape === # # #
-    logger.info(f"[SCRAPER] Starting batch scrape for {len(to_scrape)} URLs...")
-    try:
-        result = await batch_scrape_async(to_scrape_url_list)
-        logger.info(f"[SCRAPER] Batch scrape completed successfully.")
-    except Exception as scrape_err:
-        logger.exception(f"[SCRAPER] Batch scrape failed: {scrape_err}")
-        raise RuntimeError("Batch scrape failed.") from scrape_err
 
-    # === Extract clean markdown + URL per document === #
-    logger.info(f"[POSTPROCESS] Extracting markdown and appending to scrape targets...")
-    clean_data = []
-    url_to_markdown = {}
+class _BatchQuery:
+    """Per-question state of a batch run."""
 
-    try:
-        for doc in result.data:
-            url = doc.metadata.get("url")
-            markdown = doc.markdown
-            clean_data.append({
-                "url": url,
-                "markdown": markdown
-            })
-            if url:
-                url_to_markdown[url] = markdown
-        logger.info(f"[POSTPROCESS] Extracted markdown for {len(url_to_markdown)} documents.")
-    except Exception as e:
-        logger.exception(f"[POSTPROCESS] Failed to extract markdown from scrape result: {e}")
-        raise RuntimeError("Failed to extract markdown data.") from e
+    __slots__ = (
+        "index", "query", "task_id", "artifacts", "sub_questions", "targets",
+        "pending", "received", "datapoints_by_link", "cleaner", "released", "skipped",
+    )
 
-    # === Append markdown to each ScrapeTarget if matching URL exists === #
-    enriched_scrape_targets = []
-    for item in to_scrape:
+    def __init__(self, index: int, query: str):
+        self.index = index
+        self.query = query
+        self.task_id = str(uuid.uuid4())
+        self.artifacts = artifact_sink.open(self.task_id, query)
+        self.sub_questions: List[str] = []
+        self.targets: List[dict] = []
+        self.pending: set = set()  # canonical URLs still being scraped
+        self.received: set = set()  # links whose markdown arrived
+        self.datapoints_by_link: Dict[str, ScrapeDataPoint] = {}
+        self.cleaner = DocumentCleaner()
+        self.released = False
+        self.skipped: List[dict] = []
+
+
+# === Batch Processing === #
+async def process_batch(queries: List[str]) -> AsyncIterator[tuple]:
+    """
+    Answers many questions together, sharing searches and scrape jobs across the batch.
+
+    1. Answer-cache hits are yielded right away; the rest are broken down concurrently.
+    2. Sub-queries are deduplicated across the batch (normalized text) and searched once.
+    3. Source selection runs per question; the chosen URLs are deduplicated across the
+       batch by canonical URL and scraped in combined Firecrawl jobs of up to
+       BATCH_SCRAPE_JOB_SIZE URLs (scrape cache and in-flight scrapes are reused as usual).
+    4. Documents are fanned back out to every question that selected them. A question
+       is summarized as soon as it has PIPELINE_DOC_QUORUM documents or none of its
+       URLs are outstanding, at most BATCH_SUMMARIZE_CONCURRENCY at a time.
+
+    Args:
+        queries (List[str]): The questions, at most BATCH_MAX_QUERIES.
+
+    Yields:
+        tuple: `(index, result)` per question, in completion order. `result` is the
+               answer dict (as returned by `process_query`) or the exception that
+               failed that question.
+    """
+    loop = asyncio.get_running_loop()
+    results: asyncio.Queue = asyncio.Queue()
+    summarize_limit = asyncio.Semaphore(BATCH_SUMMARIZE_CONCURRENCY)
+    states = [_BatchQuery(index, query) for index, query in enumerate(queries)]
+    summaries = set()
+    started_at = loop.time()
+
+    async def summarize(state: _BatchQuery) -> None:
+        status = "failed"
         try:
-            url = item["link"]
-            markdown = url_to_markdown.get(url, None)
-            if markdown is not None:
-                item["markdown"] = markdown.strip()
+            datapoints = [state.datapoints_by_link[item["link"]] for item in state.targets if item["link"] in state.datapoints_by_link]
+            async with summarize_limit:
+                result = await summarize_for_user(state.query, datapoints=datapoints, sub_queries=state.sub_questions)
+            result["skipped_sources"] = state.skipped
+            state.artifacts.put("user_response", result)
+            if answer_cache is not None and datapoints and not result.get("degraded"):
+                answer_cache.add(state.query, result)
+            status = "completed"
+            results.put_nowait((state.index, result))
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("[BATCH] Summarizing '%s' failed: %s", state.query, e)
+            results.put_nowait((state.index, e))
+        finally:
+            artifact_sink.submit(state.artifacts, status)
+
+    def release(state: _BatchQuery) -> None:
+        if state.released:
+            return
+        state.released = True
+        state.cleaner.close()
+        for item in state.targets:
+            link = item["link"]
+            if link in state.datapoints_by_link:
+                continue
+            if link in state.received:
+                reason = "invalid"
+            elif canonicalize_url(link) in state.pending:
+                reason = "straggler"
             else:
-                logger.warning(f"[ENRICH] No markdown found for URL: {url}")
-            enriched_scrape_targets.append(item)
-        except Exception as enrich_err:
-            logger.warning(f"[ENRICH] Failed to enrich item {item.get('link', '[unknown]')}: {enrich_err}")
-            enriched_scrape_targets.append(item)  # Append as-is to avoid data loss
-
-    # === Prepare output path === #
-    output_dir = os.path.join("final_results")
-    os.makedirs(output_dir, exist_ok=True)
+                reason = "failed"
+            skipped_sources.inc(reason)
+            state.skipped.append({"link": link, "reason": reason})
+        summaries.add(asyncio.ensure_future(summarize(state)))
 
-    # === Write enriched result to file === #
-    filename = f"final_result_{uuid.uuid4()}.json"
-    output_path = os.path.join(output_dir, filename)
+    async def gather_documents() -> None:
+        try:
+            await collect_documents()
+        except Exception as e:
+            # Every question still waiting for documents fails with the stage
+            logger.exception("[BATCH] Collecting documents failed: %s", e)
+            for state in states:
+                if not state.released:
+                    state.released = True
+                    artifact_sink.submit(state.artifacts, "failed")
+                    results.put_nowait((state.index, e))
+
+    async def collect_documents() -> None:
+        # === Step 1: Answer cache, then break every remaining question down === #
+        live = []
+        for state in states:
+            hit = answer_cache.lookup(state.query) if answer_cache is not None else None
+            if hit is not None:
+                if hit.stale:
+                    answer_warmer.refresh_soon(hit.query, "stale")
+                state.released = True
+                results.put_nowait((state.index, hit.answer))
+            else:
+                live.append(state)
+        with span("breakdown"):
+            breakdowns = await asyncio.gather(*(breakdown_query(state.query) for state in live))
+
+        # === Step 2: Search each distinct sub-query once === #
+        distinct: Dict[str, str] = {}
+        for state, sub_questions in zip(live, breakdowns):
+            state.sub_questions = sub_questions
+            for sub_q in sub_questions:
+                distinct.setdefault(normalize_query(sub_q), sub_q)
+        logger.info("[BATCH] %s questions -> %s sub-queries, %s distinct.", len(live), sum(map(len, breakdowns)), len(distinct))
+        distinct_results = dict(zip(distinct, await search_sub_queries(list(distinct.values()), num_results=SELECTION_RESULTS_PER_QUERY)))
+
+        # === Step 3: Select sources per question, dedupe URLs across the batch === #
+        owners: Dict[str, List[tuple]] = {}  # canonical URL -> [(state, target)]
+        urls: List[str] = []
+        for state in live:
+            search_results = [distinct_results[normalize_query(sub_q)] for sub_q in state.sub_questions]
+            for sub_q, output in zip(state.sub_questions, search_results):
+                state.artifacts.append("search_results", {"query": sub_q, "output": output})
+            for candidate in select_sources(search_results, SCRAPE_BUDGET_URLS):
+                if _http_url(candidate.link) is None:
+                    logger.warning("[SKIP] Invalid result link skipped: %r", candidate.link)
+                    continue
+                item = {"link": candidate.link, "metadata": candidate.result}
+                canonical = canonicalize_url(item["link"])
+                if canonical not in owners:
+                    owners[canonical] = []
+                    urls.append(item["link"])
+                owners[canonical].append((state, item))
+                state.targets.append(item)
+                state.pending.add(canonical)
+            state.artifacts.put("scrape_targets", [{"link": item["link"], "metadata": item["metadata"]} for item in state.targets])
+            if not state.targets:
+                release(state)
+        selected = sum(len(state.targets) for state in live)
+        logger.info("[BATCH] %s selected pages -> %s distinct URLs in %s scrape jobs.", selected, len(urls), -(-len(urls) // BATCH_SCRAPE_JOB_SIZE))
+
+        # === Step 4: Scrape in combined jobs, fanning documents out as they land === #
+        doc_queue: asyncio.Queue = asyncio.Queue()
+
+        async def scrape_job(job_urls: List[str]) -> None:
+            try:
+                await _scrape_sources(job_urls, doc_queue)
+            finally:
+                doc_queue.put_nowait(_ScrapeJobDone(job_urls))
+
+        def resolve(canonical: str, markdown: Optional[str]) -> None:
+            for state, item in owners.pop(canonical, ()):
+                state.pending.discard(canonical)
+                if state.released:
+                    continue
+                if markdown is not None:
+                    state.received.add(item["link"])
+                    with span("postprocess"):
+                        dp = make_datapoint(item["link"], item["metadata"], state.cleaner.clean(markdown))
+                    if dp is not None:
+                        state.datapoints_by_link.setdefault(item["link"], dp)
+                if len(state.datapoints_by_link) >= PIPELINE_DOC_QUORUM or not state.pending:
+                    release(state)
+
+        jobs = [
+            asyncio.ensure_future(scrape_job(urls[start:start + BATCH_SCRAPE_JOB_SIZE]))
+            for start in range(0, len(urls), BATCH_SCRAPE_JOB_SIZE)
+        ]
+        freshly_scraped = {}
+        running = len(jobs)
+        try:
+            while running:
+                entry = await doc_queue.get()
+                if isinstance(entry, _ScrapeJobDone):
+                    running -= 1
+                    for url in entry.urls:
+                        resolve(canonicalize_url(url), None)
+                    continue
+                requested_url, final_url, markdown, source = entry
+                if source in ("fresh", "local") and scrape_cache is not None:
+                    freshly_scraped[requested_url] = markdown
+                scrape_documents.inc(source)
+                scrape_bytes.inc(source, amount=utf8_size(markdown))
+                resolve(canonicalize_url(requested_url), markdown)
+        finally:
+            for job in jobs:
+                job.cancel()
+            if scrape_cache is not None and freshly_scraped:
+                await scrape_cache.set_many(freshly_scraped)
+        for state in live:
+            release(state)
+
+    gathering = asyncio.ensure_future(gather_documents())
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(enriched_scrape_targets, f, indent=2, ensure_ascii=False)
-        logger.info(f"[SAVE] Final enriched scrape targets saved to: {output_path}")
-    except Exception as save_err:
-        logger.exception(f"[SAVE] Failed to save final enriched results: {save_err}")
-
-    # === Final Summary === #
-    logger.info(f"[SUMMARY] Enriched scrape target count: {len(enriched_scrape_targets)}")
-    logger.debug(f"[SUMMARY] Final enriched to_scrape: {json.dumps(enriched_scrape_targets, indent=2)}")
-
-    # # await asyncio.sleep(8)
-    # with open(f"./final_results/{filename}", encoding="utf-8") as f:
-    #     sample_data = json.load(f)
-    datapoints = convert_to_datapoints(enriched_scrape_targets)
-    # logger.info(f"[SUMMARIZER-AGENT] No of datapoints: {len(datapoints)}")
-    result = await summarize_for_user(user_query, datapoints=datapoints)
-    logger.info(f"[AGENT] Query finished , response sent to user.")
-    return result
-    return {
-        "task_id": task_id,
-        "sub_queries": sub_questions,
-        "to_scrape": enriched_scrape_targets
-    }
+        # Every question ends up in `results` exactly once: cached, summarized or failed
+        for _ in range(len(states)):
+            yield await results.get()
+        logger.info("[BATCH] Answered %s questions in %.1fs.", len(states), loop.time() - started_at)
+    finally:
+        gathering.cancel()
+        for task in summaries:
+            task.cancel()
+        await asyncio.gather(gathering, *summaries, return_exceptions=True)
+        for state in states:
+            if not state.released:
+                artifact_sink.submit(state.artifacts, "cancelled")
 
 
 if __name__ == "__main__":
     import sys
 
+    from agent.logs import configure_logging
+
+    configure_logging()
+
     # # === for testing user response summarizer === # 
     # sample_data = json.load(open("./final_results/final_result_2cf1bc79-7cac-4030-879f-7dc1dab078e5.json"))
     # datapoints = convert_to_datapoints(sample_data)
@@ -0,0 +1,168 @@
+import os
+import time
+import bisect
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("agent.metrics")
+
+# === Metrics Settings === #
+# Add a Server-Timing header with per-stage durations to /api/ask responses
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# === Metric Types (Prometheus text exposition) === #
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help_text, labels
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+
+
+class Gauge(Counter):
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> Iterable[str]:
+        for line in super().render():
+            yield line.replace(" counter", " gauge") if line.startswith("# TYPE") else line
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names, self.buckets = name, help_text, labels, buckets
+        self._series: Dict[LabelValues, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self._series.items():
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-1]}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}"
+
+
+# === Registry === #
+stage_seconds = Histogram("agent_stage_duration_seconds", "Duration of agent pipeline stages.", ("stage",))
+stage_in_flight = Gauge("agent_stage_in_flight", "Stage executions currently running.", ("stage",))
+stage_errors = Counter("agent_stage_errors_total", "Stage executions that raised.", ("stage",))
+llm_tokens = Counter("agent_llm_tokens_total", "LLM tokens by call and direction.", ("call", "direction"))
+scrape_bytes = Counter("agent_scrape_bytes_total", "Markdown bytes received per source.", ("source",))
+scrape_documents = Counter("agent_scrape_documents_total", "Documents received per source.", ("source",))
+pipelines_in_flight = Gauge("agent_pipelines_in_flight", "Pipeline executions currently running.")
+hedged_requests = Counter("agent_hedged_requests_total", "Backup requests sent for slow calls, and how many of them won.", ("operation", "outcome"))
+skipped_sources = Counter("agent_skipped_sources_total", "Selected sources left out of the answer.", ("reason",))
+local_fetches = Counter("agent_local_fetch_total", "Pages tried with the local fetcher, by outcome (ok or fallback reason).", ("outcome",))
+upstream_calls = Counter("agent_upstream_calls_total", "Outbound provider calls by outcome (ok, error, throttled, http_<status>, circuit_open, rate_limited).", ("provider", "operation", "outcome"))
+upstream_retries = Counter("agent_upstream_retries_total", "Outbound provider calls retried after a failure.", ("provider", "operation"))
+log_records = Counter("agent_log_records_total", "Log records not written: sampled_out (LOG_SAMPLE_RATES) or dropped (queue full).", ("outcome",))
+answer_refreshes = Counter("agent_answer_refresh_total", "Background answer refreshes by trigger (stale, warm) and outcome.", ("trigger", "outcome"))
+
+_METRICS = [stage_seconds, stage_in_flight, stage_errors, llm_tokens, scrape_bytes, scrape_documents, pipelines_in_flight, hedged_requests, skipped_sources, local_fetches, upstream_calls, upstream_retries, answer_refreshes, log_records]
+# Callbacks returning {metric_name: value} for gauges sampled at scrape time (cache ratios, queue depth)
+_collectors: List[Callable[[], Dict[str, float]]] = []
+
+
+def register_collector(collector: Callable[[], Dict[str, float]]) -> None:
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            for name, value in collector().items():
+                lines.append(f"{name} {value}")
+        except Exception as e:
+            logger.warning("[METRICS] Collector failed: %s", e)
+    return "\n".join(lines) + "\n"
+
+
+# === Per-Request Stage Timings === #
+# Set by the API layer; tasks spawned afterwards share the same dict
+current_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("current_timings", default=None)
+# Pipeline run and innermost running stage, attached to log records (agent.logs)
+current_task_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_task_id", default=None)
+current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_stage", default=None)
+
+
+@contextmanager
+def span(stage: str, task_id: Optional[str] = None):
+    """
+    Time one execution of a pipeline stage: feeds the stage histogram and in-flight gauge,
+    and accumulates into the current request's timings (for the Server-Timing header).
+    Records logged inside the span carry its stage (and `task_id`, when given).
+    """
+    stage_in_flight.inc(stage)
+    stage_token = current_stage.set(stage)
+    task_token = current_task_id.set(task_id) if task_id is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # Cancellation (dropped stragglers, client disconnects) is not an error
+        stage_errors.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        current_stage.reset(stage_token)
+        if task_token is not None:
+            current_task_id.reset(task_token)
+        stage_in_flight.dec(stage)
+        stage_seconds.observe(elapsed, stage)
+        timings = current_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+        if task_id is not None and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[SPAN] task=%s stage=%s ms=%.1f", task_id, stage, elapsed * 1000)
+
+
+def record_llm_usage(call: str, usage: Optional[dict], prompt_text: str = "", response_text: str = "") -> None:
+    """Count LLM tokens, preferring provider-reported usage over a chars/4 estimate."""
+    usage = usage or {}
+    prompt_tokens = usage.get("input_tokens") or len(prompt_text) // 4
+    response_tokens = usage.get("output_tokens") or len(response_text) // 4
+    llm_tokens.inc(call, "prompt", amount=prompt_tokens)
+    llm_tokens.inc(call, "response", amount=response_tokens)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,176 @@
+import re
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger("agent.passages")
+
+# === Passage Selection Settings === #
+# Rough token estimate for Gemini-style tokenizers on English/markdown text
+CHARS_PER_TOKEN = 4
+CHUNK_TARGET_TOKENS = 200
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this "
+    "to was were what when where which who why will with".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def utf8_size(text: str) -> int:
+    """Encoded size of `text` in bytes, without building the encoded copy for ASCII text."""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+# === Chunking === #
+def chunk_markdown(markdown: str, target_tokens: int = CHUNK_TARGET_TOKENS) -> List[str]:
+    """
+    Split markdown into passages of roughly `target_tokens`, on paragraph boundaries where possible.
+
+    Args:
+        markdown (str): The document markdown.
+        target_tokens (int): Approximate passage size.
+
+    Returns:
+        List[str]: Passages in document order.
+    """
+    target_chars = target_tokens * CHARS_PER_TOKEN
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+
+    for paragraph in _PARAGRAPH_SPLIT_RE.split(markdown):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        # Hard-split paragraphs that alone exceed twice the target size
+        while len(paragraph) > 2 * target_chars:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            chunks.append(paragraph[:target_chars])
+            paragraph = paragraph[target_chars:]
+        if current and current_len + len(paragraph) > target_chars:
+            chunks.append("\n\n".join(current))
+            current, current_len = [], 0
+        current.append(paragraph)
+        current_len += len(paragraph)
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+# === BM25 === #
+class BM25Index:
+    """Minimal in-process Okapi BM25 index over a fixed list of passages."""
+
+    def __init__(self, passages: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(p)) for p in passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freq: Counter = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query: str) -> List[float]:
+        query_terms = set(tokenize(query))
+        results = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+
+# === Budgeted Selection === #
+def select_passages(
+    documents: Sequence[str],
+    queries: Sequence[str],
+    token_budget: int,
+    min_tokens_per_source: int,
+) -> List[str]:
+    """
+    Pick the most query-relevant passages from every document under a shared token budget.
+
+    Every document first receives its best-scoring passages up to `min_tokens_per_source`
+    (scaled down if the budget cannot cover all sources), then the remaining budget is
+    filled with the highest-scoring passages overall. Selected passages are returned in
+    their original order, with `[...]` marking skipped text.
+
+    Args:
+        documents (Sequence[str]): Markdown per source.
+        queries (Sequence[str]): The user query and its sub-queries.
+        token_budget (int): Total token budget for all documents together.
+        min_tokens_per_source (int): Guaranteed share per source.
+
+    Returns:
+        List[str]: The condensed text per document, aligned with `documents`.
+    """
+    chunked = [chunk_markdown(doc) for doc in documents]
+    flat = [(doc_idx, chunk_idx, chunk) for doc_idx, chunks in enumerate(chunked) for chunk_idx, chunk in enumerate(chunks)]
+    if not flat:
+        return ["" for _ in documents]
+
+    index = BM25Index([chunk for _, _, chunk in flat])
+    scores = index.scores(" ".join(queries))
+    costs = [estimate_tokens(chunk) for _, _, chunk in flat]
+
+    sources = sum(1 for chunks in chunked if chunks)
+    min_share = min(min_tokens_per_source, token_budget // max(sources, 1))
+
+    ranked = sorted(range(len(flat)), key=lambda i: scores[i], reverse=True)
+    selected = set()
+    spent_per_doc: Dict[int, int] = Counter()
+    spent = 0
+
+    # Pass 1: guaranteed minimum share per source (always at least its best passage)
+    for i in ranked:
+        doc_idx = flat[i][0]
+        if spent_per_doc[doc_idx] == 0 or spent_per_doc[doc_idx] + costs[i] <= min_share:
+            selected.add(i)
+            spent_per_doc[doc_idx] += costs[i]
+            spent += costs[i]
+
+    # Pass 2: fill the remaining budget by global relevance
+    for i in ranked:
+        if i not in selected and spent + costs[i] <= token_budget and scores[i] > 0:
+            selected.add(i)
+            spent += costs[i]
+
+    condensed: List[List[str]] = [[] for _ in documents]
+    last_chunk: Dict[int, int] = {}
+    for i in sorted(selected):
+        doc_idx, chunk_idx, chunk = flat[i]
+        if chunk_idx > last_chunk.get(doc_idx, -1) + 1:
+            condensed[doc_idx].append("[...]")
+        condensed[doc_idx].append(chunk)
+        last_chunk[doc_idx] = chunk_idx
+    for doc_idx, chunks in enumerate(chunked):
+        if condensed[doc_idx] and last_chunk[doc_idx] < len(chunks) - 1:
+            condensed[doc_idx].append("[...]")
+
+    original_tokens = sum(costs)
+    logger.info("[PROMPT] Selected %s/%s passages: ~%s of ~%s tokens.", len(selected), len(flat), spent, original_tokens)
+    return ["\n\n".join(parts) for parts in condensed]
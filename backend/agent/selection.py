@@ -0,0 +1,120 @@
+import os
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AbstractSet, List, Set
+
+from agent.urls import canonical_host, canonicalize_url
+
+logger = logging.getLogger("agent.selection")
+
+# === Source Selection Settings === #
+# Pages scraped per query, across all sub-queries
+SCRAPE_BUDGET_URLS = int(os.getenv("SCRAPE_BUDGET_URLS", "6"))
+# Organic results per sub-query considered as candidates
+SELECTION_RESULTS_PER_QUERY = int(os.getenv("SELECTION_RESULTS_PER_QUERY", "5"))
+# Score multiplier per page already selected from the same domain (1 = no diversity preference)
+SELECTION_DOMAIN_PENALTY = float(os.getenv("SELECTION_DOMAIN_PENALTY", "0.35"))
+# Score boost for a page from a sub-query that has no page selected yet
+SELECTION_COVERAGE_BONUS = float(os.getenv("SELECTION_COVERAGE_BONUS", "0.5"))
+# How much less each later (less relevant) sub-query's results weigh
+SUB_QUERY_RANK_DECAY = 0.25
+
+
+@dataclass
+class Candidate:
+    """One distinct page found by the search stage, possibly under several sub-queries."""
+
+    link: str
+    canonical: str
+    host: str
+    result: dict  # SERP result from the sub-query that ranked it best
+    score: float = 0.0
+    sub_queries: Set[int] = field(default_factory=set)
+
+
+def rank_candidates(
+    results_per_query: List[list],
+    results_per_query_limit: int = SELECTION_RESULTS_PER_QUERY,
+    exclude: AbstractSet[str] = frozenset(),
+) -> List[Candidate]:
+    """
+    Merge SERP results of all sub-queries into distinct candidates, best first.
+
+    Results are deduplicated by canonical URL (scheme, `www.`, tracking parameters and
+    fragments do not count). A result at SERP position p of the sub-query ranked r adds
+    `1 / (p + 1) / (1 + SUB_QUERY_RANK_DECAY * r)` to its page's score, so pages found
+    by several sub-queries rank above pages found by one.
+
+    Args:
+        results_per_query (List[list]): Organic results per sub-query, most relevant sub-query first.
+        results_per_query_limit (int): Results per sub-query to consider.
+        exclude (AbstractSet[str]): Canonical URLs to leave out (pages already in hand).
+
+    Returns:
+        List[Candidate]: Distinct candidates sorted by descending score.
+    """
+    candidates = {}
+    for rank, results in enumerate(results_per_query):
+        for index, result in enumerate(results[:results_per_query_limit]):
+            link = result.get("link")
+            if not link:
+                continue
+            position = result.get("position") or index + 1
+            weight = 1.0 / (position + 1) / (1 + SUB_QUERY_RANK_DECAY * rank)
+
+            canonical = canonicalize_url(link)
+            if canonical in exclude:
+                continue
+            candidate = candidates.get(canonical)
+            if candidate is None:
+                candidate = candidates[canonical] = Candidate(link=link, canonical=canonical, host=canonical_host(link), result=result)
+            candidate.score += weight
+            candidate.sub_queries.add(rank)
+    return sorted(candidates.values(), key=lambda c: c.score, reverse=True)
+
+
+def select_sources(
+    results_per_query: List[list],
+    budget: int = SCRAPE_BUDGET_URLS,
+    exclude: AbstractSet[str] = frozenset(),
+) -> List[Candidate]:
+    """
+    Pick the `budget` pages worth scraping out of every sub-query's search results.
+
+    Greedy: each pick takes the candidate with the best score after a penalty for
+    domains already picked (SELECTION_DOMAIN_PENALTY per page) and a bonus for covering
+    a sub-query no earlier pick came from (SELECTION_COVERAGE_BONUS).
+
+    Args:
+        results_per_query (List[list]): Organic results per sub-query, most relevant sub-query first.
+        budget (int): Maximum number of pages to pick.
+        exclude (AbstractSet[str]): Canonical URLs to leave out (pages already in hand).
+
+    Returns:
+        List[Candidate]: Picked candidates, in pick order (most valuable first).
+    """
+    remaining = rank_candidates(results_per_query, exclude=exclude)
+    total_results = sum(min(len(results), SELECTION_RESULTS_PER_QUERY) for results in results_per_query)
+    picked: List[Candidate] = []
+    domain_counts: Counter = Counter()
+    covered: Set[int] = set()
+
+    def adjusted_score(candidate: Candidate) -> float:
+        score = candidate.score * SELECTION_DOMAIN_PENALTY ** domain_counts[candidate.host]
+        if candidate.sub_queries - covered:
+            score *= 1 + SELECTION_COVERAGE_BONUS
+        return score
+
+    while remaining and len(picked) < budget:
+        best = max(remaining, key=adjusted_score)
+        remaining.remove(best)
+        picked.append(best)
+        domain_counts[best.host] += 1
+        covered |= best.sub_queries
+
+    logger.info(
+        "[SELECT] %s results -> %s distinct pages -> picked %s from %s domains covering %s/%s sub-queries.",
+        total_results, len(picked) + len(remaining), len(picked), len(domain_counts), len(covered), len(results_per_query),
+    )
+    return picked
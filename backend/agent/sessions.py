@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from agent.passages import BM25_B, BM25_K1, chunk_markdown, tokenize, utf8_size
+from agent.urls import canonicalize_url
+
+logger = logging.getLogger("agent.sessions")
+
+# === Session Settings === #
+SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", "true").lower() == "true"
+# Markdown kept across all sessions in this worker; least recently used sessions go first
+SESSIONS_MAX_BYTES = int(os.getenv("SESSIONS_MAX_BYTES", str(256 * 1024 * 1024)))
+# Markdown kept per session; least recently used documents go first
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(8 * 1024 * 1024)))
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# Share of a sub-query's terms one passage must contain for a stored document to answer it
+SESSION_MATCH_COVERAGE = float(os.getenv("SESSION_MATCH_COVERAGE", "0.6"))
+SESSION_DOCS_PER_QUERY = int(os.getenv("SESSION_DOCS_PER_QUERY", "2"))
+# Earlier questions passed to sub-query generation to resolve follow-ups
+SESSION_HISTORY_TURNS = 5
+
+
+# === Per-Session Document Index === #
+class SessionDocument:
+    __slots__ = ("link", "metadata", "markdown", "size", "passage_ids")
+
+    def __init__(self, link: str, metadata: dict, markdown: str):
+        self.link = link
+        self.metadata = metadata
+        self.markdown = markdown
+        self.size = utf8_size(markdown)
+        self.passage_ids: List[int] = []
+
+
+class SessionIndex:
+    """
+    Documents gathered during one conversation, with an inverted index over their passages.
+
+    Passages are the same ~200-token chunks the prompt builder uses. Postings map each
+    term to {passage_id: term frequency}, so a lookup only touches passages sharing a
+    term with the query. Documents are kept in LRU order and evicted, oldest first,
+    once the session holds more than `max_bytes` of markdown.
+    """
+
+    def __init__(self, key: str, max_bytes: int = SESSION_MAX_BYTES):
+        self.key = key
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.last_seen = time.monotonic()
+        self.history: List[str] = []
+        self.documents: "OrderedDict[str, SessionDocument]" = OrderedDict()  # canonical URL -> document
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._passages: Dict[int, Tuple[str, int]] = {}  # id -> (canonical URL, length in terms)
+        self._next_passage_id = 0
+        self._total_length = 0
+
+    def add(self, link: str, metadata: dict, markdown: str) -> int:
+        """Index a document (replacing an earlier copy); returns the change in stored bytes."""
+        before = self.bytes
+        canonical = canonicalize_url(link)
+        self.remove(canonical)
+        document = SessionDocument(link, metadata, markdown)
+        for passage in chunk_markdown(markdown):
+            term_freqs = Counter(tokenize(passage))
+            if not term_freqs:
+                continue
+            passage_id = self._next_passage_id
+            self._next_passage_id += 1
+            for term, freq in term_freqs.items():
+                self._postings.setdefault(term, {})[passage_id] = freq
+            length = sum(term_freqs.values())
+            self._passages[passage_id] = (canonical, length)
+            self._total_length += length
+            document.passage_ids.append(passage_id)
+        self.documents[canonical] = document
+        self.bytes += document.size
+
+        while self.bytes > self.max_bytes and len(self.documents) > 1:
+            self.remove(next(iter(self.documents)))
+        return self.bytes - before
+
+    def remove(self, canonical: str) -> None:
+        document = self.documents.pop(canonical, None)
+        if document is None:
+            return
+        removed = set(document.passage_ids)
+        for passage_id in removed:
+            self._total_length -= self._passages.pop(passage_id)[1]
+        for term in set(tokenize(document.markdown)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            for passage_id in removed.intersection(postings):
+                del postings[passage_id]
+            if not postings:
+                del self._postings[term]
+        self.bytes -= document.size
+
+    def search(self, query: str, limit: int = SESSION_DOCS_PER_QUERY) -> List[Tuple[SessionDocument, float]]:
+        """
+        Find stored documents that answer `query`.
+
+        Passages are scored with BM25; a document qualifies through its best passage if
+        that passage contains at least SESSION_MATCH_COVERAGE of the query's terms.
+
+        Args:
+            query (str): A sub-query (or the user query).
+            limit (int): Maximum number of documents to return.
+
+        Returns:
+            List[Tuple[SessionDocument, float]]: Matching documents with their BM25 score, best first.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._passages:
+            return []
+        n = len(self._passages)
+        avg_length = self._total_length / n
+        scores: Counter = Counter()
+        matched_terms: Counter = Counter()
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage_id, freq in postings.items():
+                length = self._passages[passage_id][1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[passage_id] += idf * freq * (BM25_K1 + 1) / (freq + norm)
+                matched_terms[passage_id] += 1
+
+        best: Dict[str, float] = {}
+        for passage_id, score in scores.items():
+            if matched_terms[passage_id] / len(terms) < SESSION_MATCH_COVERAGE:
+                continue
+            canonical = self._passages[passage_id][0]
+            if score > best.get(canonical, 0.0):
+                best[canonical] = score
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:limit]
+        for canonical, _ in ranked:
+            self.documents.move_to_end(canonical)
+        return [(self.documents[canonical], score) for canonical, score in ranked]
+
+    def add_turn(self, query: str) -> None:
+        self.history.append(query)
+        del self.history[:-SESSION_HISTORY_TURNS]
+
+
+# === Session Store === #
+class SessionStore:
+    """
+    Per-worker map of session key -> SessionIndex, bounded by total bytes and idle time.
+
+    Sessions live in this process only, so follow-ups must reach the same worker
+    (sticky routing) to find their documents; on any other worker they simply start
+    a fresh session. Everything runs on the event loop thread.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = SESSIONS_MAX_BYTES,
+        session_max_bytes: int = SESSION_MAX_BYTES,
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+    ):
+        self.max_bytes = max_bytes
+        self.session_max_bytes = session_max_bytes
+        self.idle_seconds = idle_seconds
+        self.bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        self._sessions: "OrderedDict[str, SessionIndex]" = OrderedDict()
+
+    def get(self, key: str, create: bool = True) -> Optional[SessionIndex]:
+        """Return the live session for `key` (marking it used), creating it if asked to."""
+        self._expire_idle()
+        session = self._sessions.get(key)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[key] = SessionIndex(key, self.session_max_bytes)
+        self._sessions.move_to_end(key)
+        session.last_seen = time.monotonic()
+        return session
+
+    def add_document(self, session: SessionIndex, link: str, metadata: dict, markdown: str) -> None:
+        if self._sessions.get(session.key) is not session:
+            return  # evicted or dropped while its pipeline was running
+        self.bytes += session.add(link, metadata, markdown)
+        while self.bytes > self.max_bytes and len(self._sessions) > 1:
+            _, oldest = self._sessions.popitem(last=False)
+            self.bytes -= oldest.bytes
+            self.evicted += 1
+            logger.info("[SESSION] Evicted least recently used session (%s bytes) to stay under %s bytes.", oldest.bytes, self.max_bytes)
+
+    def drop(self, key: str) -> bool:
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return False
+        self.bytes -= session.bytes
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.bytes,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+    def _expire_idle(self) -> None:
+        # Sessions are kept in last-used order, so expired ones are all at the front
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            del self._sessions[key]
+            self.bytes -= session.bytes
+            self.expired += 1
+
+
+def session_key(api_key: Optional[str], session_id: str) -> str:
+    """
+    Scope client-chosen session IDs to the API key, so one client cannot read another's
+    session. The key is hashed: session keys end up in flight keys and the session store,
+    and a credential must never be kept or logged there.
+    """
+    owner = hashlib.sha256(api_key.encode("utf-8")).hexdigest() if api_key else "anonymous"
+    return f"{owner}:{session_id}"
+
+
+session_store: Optional[SessionStore] = SessionStore() if SESSIONS_ENABLED else None
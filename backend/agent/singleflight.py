@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("agent.singleflight")
+
+
+# === Single-Flight Call Deduplication === #
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key: the first caller starts the work and
+    every caller that arrives while it is running awaits the same result (or exception).
+
+    The shared task only gets cancelled once *all* of its callers have been cancelled, so
+    one client disconnecting never aborts a run other clients are waiting on.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.shared = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            self.executions += 1
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.shared += 1
+            # Keys can be built from user input, so they are never logged
+            logger.info("[SINGLEFLIGHT] %s: joined an in-flight call (%s waiting).", self.name, self._waiters[key] + 1)
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    task.cancel()
+                    # Forget it now: a caller arriving before the task finishes unwinding must start afresh
+                    self._forget(key, task)
+            raise
+        finally:
+            if self._inflight.get(key) is task and task.done():
+                self._forget(key, task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "shared": self.shared, "in_flight": len(self._inflight)}
+
+
+# === In-Flight Result Registry === #
+class InFlightMap:
+    """
+    Registry of results currently being produced by someone else, e.g. URLs inside
+    another request's scrape job.
+
+    `claim()` returns None when the caller becomes the owner of a key (and must later
+    `resolve()` it), or the owner's future to await otherwise.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.shared = 0
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def claim(self, key: str) -> Optional[asyncio.Future]:
+        future = self._futures.get(key)
+        if future is not None and not future.done():
+            self.shared += 1
+            return future
+        self._futures[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def resolve(self, key: str, value: Any) -> None:
+        future = self._futures.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(value)
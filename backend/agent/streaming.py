@@ -0,0 +1,100 @@
+import re
+
+
+# === Incremental JSON String Field Decoder === #
+class JsonStringFieldStreamer:
+    """
+    Incrementally decodes a single string field (e.g. "detailed_analysis") from a JSON
+    document that arrives in arbitrary chunks, such as LLM streaming output.
+
+    Feed every chunk to `feed()`; it returns the newly decoded characters of the field's
+    value (JSON escapes resolved) and an empty string before the field starts or after
+    its closing quote. Call `finish()` once the stream ends to flush what is still held
+    back. Unpaired surrogate escapes come out as U+FFFD, since they cannot be encoded.
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    _LOW_SURROGATE = re.compile(r"\\u[dD][c-fC-F][0-9a-fA-F]{2}")
+    # What may still turn into a low surrogate escape once more text arrives
+    _LOW_SURROGATE_PREFIX = re.compile(r"(\\(u([dD]([c-fC-F][0-9a-fA-F]{0,2})?)?)?)?")
+
+    def __init__(self, field: str):
+        self._marker = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""   # raw text seen before the field value starts
+        self._pending = ""  # escape sequence split across chunks
+        self._state = "seek"
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> str:
+        if self._state == "done":
+            return ""
+
+        if self._state == "seek":
+            self._buffer += chunk
+            match = self._marker.search(self._buffer)
+            if not match:
+                return ""
+            chunk = self._buffer[match.end():]
+            self._buffer = ""
+            self._state = "value"
+
+        text = self._pending + chunk
+        self._pending = ""
+        out = []
+        i = 0
+        while i < len(text):
+            ch = text[i]
+            if ch == '"':
+                self._state = "done"
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+
+            if i + 1 >= len(text):
+                self._pending = text[i:]
+                break
+            esc = text[i + 1]
+            if esc != "u":
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+                continue
+
+            # \uXXXX, possibly a surrogate pair (😀)
+            if i + 6 > len(text):
+                self._pending = text[i:]
+                break
+            try:
+                code = int(text[i + 2:i + 6], 16)
+            except ValueError:
+                i += 6
+                continue
+            if 0xD800 <= code < 0xDC00:
+                follow = text[i + 6:i + 12]
+                if len(follow) < 6 and self._LOW_SURROGATE_PREFIX.fullmatch(follow):
+                    # The low half may be in the next chunk
+                    self._pending = text[i:]
+                    break
+                if self._LOW_SURROGATE.fullmatch(follow):
+                    low = int(follow[2:], 16)
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                else:
+                    out.append("\ufffd")  # lone high surrogate
+                    i += 6
+                continue
+            out.append("\ufffd" if 0xDC00 <= code < 0xE000 else chr(code))
+            i += 6
+
+        return "".join(out)
+
+    def finish(self) -> str:
+        """Flush at the end of the stream: a dangling high surrogate becomes U+FFFD, a cut-off escape is dropped."""
+        pending, self._pending = self._pending, ""
+        if self._state == "value" and len(pending) >= 6 and pending[1] == "u":
+            return "\ufffd"
+        return ""
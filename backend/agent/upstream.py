@@ -0,0 +1,363 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from agent.metrics import upstream_calls, upstream_retries
+
+logger = logging.getLogger("agent.upstream")
+
+T = TypeVar("T")
+
+# === Outbound Call Settings === #
+# Longest a call waits for a rate-limit token (or a Retry-After pause) before failing fast
+UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "5"))
+# Retry delays: jittered exponential backoff from the base, capped; a longer Retry-After is not waited out
+UPSTREAM_BACKOFF_BASE_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "0.5"))
+UPSTREAM_BACKOFF_MAX_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "8"))
+# Statuses worth another attempt; other 4xx responses are the request's own fault
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+_RETRYABLE_ERROR_NAMES = frozenset({
+    # google.api_core exceptions raised through the Gemini client
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "TooManyRequests",
+    # transport errors from httpx / requests
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "WriteTimeout", "PoolTimeout", "RemoteProtocolError",
+    "ReadError", "ConnectionError", "Timeout",
+})
+
+
+class UpstreamError(Exception):
+    """An upstream call failed; `status` and `retry_after` are filled in when the provider said so."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UpstreamUnavailable(UpstreamError):
+    """Raised without calling the provider: its circuit is open or its rate limit would make the caller wait too long."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float):
+        super().__init__(f"{provider} unavailable ({reason}), retry in {retry_after:.1f}s", retry_after=retry_after)
+        self.provider = provider
+        self.reason = reason
+
+
+# === Error Classification === #
+def _parse_retry_after(value) -> Optional[float]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify(exc: BaseException) -> Tuple[Optional[int], bool, Optional[float]]:
+    """
+    Read what a provider error says about retrying.
+
+    Understands `UpstreamError`, httpx and requests errors carrying a `response`, and
+    google.api_core exceptions (`code` is the HTTP status).
+
+    Returns:
+        Tuple[Optional[int], bool, Optional[float]]: `(status, retryable, retry_after_seconds)`.
+    """
+    if isinstance(exc, UpstreamError):
+        status, retry_after = exc.status, exc.retry_after
+    else:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+        if status is None and isinstance(getattr(exc, "code", None), int):
+            status = exc.code
+        headers = getattr(response, "headers", None) or {}
+        retry_after = _parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+    if status is not None:
+        return status, status in RETRYABLE_STATUSES, retry_after
+    retryable = isinstance(exc, (asyncio.TimeoutError, ConnectionError)) or type(exc).__name__ in _RETRYABLE_ERROR_NAMES
+    return None, retryable, retry_after
+
+
+def key_id(secret: Optional[str]) -> str:
+    """Short, non-reversible label for a credential, used to key its rate limit and metrics."""
+    if not secret:
+        return "none"
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:8]
+
+
+# === Token Bucket === #
+class TokenBucket:
+    """
+    Rate limit of `rate` calls per second with bursts of up to `burst`.
+
+    Tokens are reserved up front, so callers queue in arrival order: a reservation
+    returns how long the caller must sleep before its call. A provider's Retry-After
+    pauses the bucket, and no tokens accrue until the pause ends.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a token; returns the wait before using it, or None (nothing taken) if that exceeds `max_wait`."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now) + max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self.tokens -= 1
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+    def available(self) -> float:
+        self._refill(time.monotonic())
+        return self.tokens
+
+
+# === Circuit Breaker === #
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls and rejects calls for `reset_seconds`.
+
+    Then one probe call is let through (half-open): success closes the circuit,
+    failure opens it for another `reset_seconds`.
+    """
+
+    __slots__ = ("threshold", "reset_seconds", "state", "failures", "opened_at", "probing", "opened")
+
+    def __init__(self, failures: int, reset_seconds: float):
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+
+    def allow(self) -> bool:
+        if self.threshold <= 0:
+            return True
+        if self.state == OPEN and time.monotonic() >= self.opened_at + self.reset_seconds:
+            self.state = HALF_OPEN
+            self.probing = False
+        if self.state == HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic()) if self.state == OPEN else 0.0
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if it opened the circuit."""
+        self.failures += 1
+        self.probing = False
+        if self.threshold > 0 and (self.state == HALF_OPEN or self.failures >= self.threshold):
+            reopened = self.state != OPEN
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.opened += reopened
+            return reopened
+        return False
+
+    def release_probe(self) -> None:
+        """The probe ended without a verdict (cancelled, or a caller-side error)."""
+        self.probing = False
+
+
+# === Upstream Provider === #
+def _setting(provider: str, name: str, default: float) -> float:
+    return float(os.getenv(f"UPSTREAM_{provider.upper()}_{name}", str(default)))
+
+
+class Upstream:
+    """
+    Shared outbound-call layer for one provider (SerpAPI, Firecrawl or Gemini).
+
+    Every call takes a token from the rate-limit bucket of the credential it uses
+    (UPSTREAM_<PROVIDER>_RATE calls/s, bursts of UPSTREAM_<PROVIDER>_BURST), goes
+    through the provider's circuit breaker, and is retried up to
+    UPSTREAM_<PROVIDER>_RETRIES times on throttling, 5xx and network errors with
+    jittered exponential backoff, or after the provider's Retry-After. A Retry-After
+    pauses the whole bucket, so concurrent callers back off together instead of
+    each hitting the same 429. When the circuit is open, or the bucket would keep a
+    caller waiting past UPSTREAM_MAX_WAIT_SECONDS, `UpstreamUnavailable` is raised
+    at once so the caller can take its fallback.
+    """
+
+    def __init__(self, name: str, credential_env: str, rate: float, burst: float, retries: int, failures: int, reset_seconds: float):
+        self.name = name
+        self.credential_env = credential_env
+        self.rate = _setting(name, "RATE", rate)
+        self.burst = _setting(name, "BURST", burst)
+        self.retries = int(_setting(name, "RETRIES", retries))
+        self.breaker = CircuitBreaker(int(_setting(name, "BREAKER_FAILURES", failures)), _setting(name, "BREAKER_RESET_SECONDS", reset_seconds))
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, key: Optional[str] = None) -> TokenBucket:
+        key = key or key_id(os.getenv(self.credential_env))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def available(self) -> bool:
+        """False while the circuit is open; callers can skip straight to their fallback."""
+        return self.breaker.state != OPEN or self.breaker.retry_after() <= 0
+
+    async def _admit(self, bucket: TokenBucket, operation: str) -> None:
+        if not self.breaker.allow():
+            upstream_calls.inc(self.name, operation, "circuit_open")
+            raise UpstreamUnavailable(self.name, "circuit open", self.breaker.retry_after())
+        wait = bucket.reserve(UPSTREAM_MAX_WAIT_SECONDS)
+        if wait is None:
+            self.breaker.release_probe()
+            upstream_calls.inc(self.name, operation, "rate_limited")
+            raise UpstreamUnavailable(self.name, "rate limited", max(bucket.paused_until - time.monotonic(), 1 / max(bucket.rate, 1e-9)))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _failed(self, exc: Exception, bucket: TokenBucket, operation: str, attempt: int, retries: int) -> Optional[float]:
+        """Record a failed attempt; returns the delay before retrying, or None to give up."""
+        status, retryable, retry_after = classify(exc)
+        if status is not None and not retryable:
+            # The provider answered; the request itself was bad (or out of credits), so the circuit stays as it is
+            self.breaker.release_probe()
+            upstream_calls.inc(self.name, operation, f"http_{status}")
+            return None
+        upstream_calls.inc(self.name, operation, "throttled" if status == 429 else "error")
+        if self.breaker.record_failure():
+            logger.warning(
+                "[UPSTREAM] %s circuit opened after %s failures; failing fast for %.0fs.",
+                self.name, self.breaker.failures, self.breaker.reset_seconds,
+            )
+        if retry_after is not None:
+            bucket.pause(retry_after)
+        if not retryable or attempt >= retries:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= UPSTREAM_BACKOFF_MAX_SECONDS else None
+        return random.uniform(0, min(UPSTREAM_BACKOFF_MAX_SECONDS, UPSTREAM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[T]], operation: str = "call", retries: Optional[int] = None, key: Optional[str] = None) -> T:
+        """
+        Run one provider call under this provider's rate limit, retry policy and circuit breaker.
+
+        Args:
+            fn (Callable[[], Awaitable[T]]): Starts a fresh attempt each time it is called.
+            operation (str): Label for the usage counters (e.g. "search", "submit").
+            retries (Optional[int]): Overrides UPSTREAM_<PROVIDER>_RETRIES for this call.
+            key (Optional[str]): Rate-limit key; defaults to the provider credential's `key_id`.
+
+        Returns:
+            T: The first successful attempt's result.
+
+        Raises:
+            UpstreamUnavailable: Circuit open, or no rate-limit token within UPSTREAM_MAX_WAIT_SECONDS.
+            Exception: The last attempt's error once retries are spent or the error is not retryable.
+        """
+        bucket = self.bucket(key)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            await self._admit(bucket, operation)
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                delay = self._failed(e, bucket, operation, attempt, retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                upstream_retries.inc(self.name, operation)
+                logger.info("[UPSTREAM] %s %s failed (%r); retry %s/%s in %.2fs.", self.name, operation, e, attempt, retries, delay)
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                upstream_calls.inc(self.name, operation, "ok")
+                return result
+
+    async def stream(self, factory: Callable[[], AsyncIterator[T]], operation: str = "stream", key: Optional[str] = None) -> AsyncIterator[T]:
+        """Like `call` for a streaming response; attempts are only retried until the first chunk arrives."""
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            await self._admit(bucket, operation)
+            started = False
+            try:
+                async for chunk in factory():
+                    started = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                delay = self._failed(e, bucket, operation, attempt, 0 if started else self.retries)
+                if delay is None:
+                    raise
+                attempt += 1
+                upstream_retries.inc(self.name, operation)
+                logger.info("[UPSTREAM] %s %s failed before its first chunk (%r); retry %s/%s in %.2fs.", self.name, operation, e, attempt, self.retries, delay)
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                upstream_calls.inc(self.name, operation, "ok")
+                return
+
+    def stats(self) -> dict:
+        return {
+            "circuit_state": {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[self.breaker.state],
+            "circuit_opened": self.breaker.opened,
+            "consecutive_failures": self.breaker.failures,
+            "tokens_available": {key: round(bucket.available(), 2) for key, bucket in self._buckets.items()},
+        }
+
+
+# Conservative defaults; raise them to match each provider plan's limits
+serpapi_upstream = Upstream("serpapi", "SERPAI_API_KEY", rate=5, burst=10, retries=2, failures=5, reset_seconds=30)
+firecrawl_upstream = Upstream("firecrawl", "FIRECRAWL_API_KEY", rate=10, burst=20, retries=2, failures=5, reset_seconds=30)
+# The Gemini client already retries once internally
+llm_upstream = Upstream("llm", "GOOGLE_API_KEY", rate=20, burst=20, retries=1, failures=5, reset_seconds=20)
+
+upstreams = (serpapi_upstream, firecrawl_upstream, llm_upstream)
@@ -0,0 +1,60 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# === URL Canonicalization === #
+# Ad-click and analytics IDs that never change page content. Generic names such as "ref",
+# "src" or "source" stay: sites use them for content (GitHub `?ref=<branch>`), and a wrong
+# merge hands one page's markdown to another through the scrape cache and in-flight map.
+TRACKING_PARAMS = frozenset({
+    "gclid", "gbraid", "wbraid", "dclid", "fbclid", "msclkid", "yclid", "twclid", "ttclid",
+    "igshid", "mc_cid", "mc_eid", "_ga", "_gl", "srsltid",
+})
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
+
+
+def canonical_host(url: str) -> str:
+    """Return the lowercased host of `url` without a leading `www.` or port ("" if unparsable)."""
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a URL so that trivially different spellings of the same page compare equal.
+
+    - scheme is forced to https and host lowercased, without `www.` or default ports
+    - tracking query parameters (utm_*, gclid, fbclid, ...) are dropped, the rest sorted
+    - fragments and trailing slashes are removed
+
+    Args:
+        url (str): The raw URL as returned by search or scrape results.
+
+    Returns:
+        str: The canonical form of the URL, or the stripped input if it cannot be parsed
+             (e.g. a non-numeric port), so one malformed link never fails a request.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    host = canonical_host(url)
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = urlencode(sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    ))
+    return urlunsplit(("https", host, path, query, ""))
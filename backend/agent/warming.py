@@ -0,0 +1,195 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from agent.answer_cache import SemanticAnswerCache, query_key
+from agent.metrics import answer_refreshes
+from agent.upstream import TokenBucket, upstreams
+
+logger = logging.getLogger("agent.warming")
+
+# === Answer Refresh Settings === #
+# Re-run the most popular queries on a schedule so their answers never go stale
+WARM_ENABLED = os.getenv("WARM_ENABLED", "false").lower() == "true"
+WARM_INTERVAL_SECONDS = float(os.getenv("WARM_INTERVAL_SECONDS", "60"))
+WARM_TOP_K = int(os.getenv("WARM_TOP_K", "200"))
+# Popular answers with less freshness left than this are refreshed ahead of time
+WARM_LEAD_SECONDS = float(os.getenv("WARM_LEAD_SECONDS", "300"))
+# Background pipeline runs per hour per worker, shared by warming and stale-answer refreshes
+WARM_BUDGET_RUNS_PER_HOUR = float(os.getenv("WARM_BUDGET_RUNS_PER_HOUR", "120"))
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", "2"))
+# Popularity is a request count that halves every WARM_HALF_LIFE_SECONDS
+WARM_HALF_LIFE_SECONDS = float(os.getenv("WARM_HALF_LIFE_SECONDS", "21600"))
+WARM_TRACKED_QUERIES = int(os.getenv("WARM_TRACKED_QUERIES", "5000"))
+
+
+# === Query Popularity === #
+class _Popularity:
+    __slots__ = ("query", "score", "updated")
+
+    def __init__(self, query: str, now: float):
+        self.query = query
+        self.score = 0.0
+        self.updated = now
+
+
+class QueryPopularity:
+    """
+    Exponentially decayed request counts per query (keyed by content words, so
+    rephrasings share a count). Past `max_queries`, the least popular half is dropped.
+    """
+
+    def __init__(self, half_life: float = WARM_HALF_LIFE_SECONDS, max_queries: int = WARM_TRACKED_QUERIES):
+        self.half_life = half_life
+        self.max_queries = max_queries
+        self._entries: Dict[str, _Popularity] = {}
+
+    def _decayed(self, entry: _Popularity, now: float) -> float:
+        return entry.score * 0.5 ** ((now - entry.updated) / self.half_life)
+
+    def record(self, query: str) -> None:
+        now = time.time()
+        key = query_key(query)
+        if not key:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_queries:
+                self._prune(now)
+            entry = self._entries[key] = _Popularity(query, now)
+        entry.score = self._decayed(entry, now) + 1.0
+        entry.updated = now
+        entry.query = query
+
+    def _prune(self, now: float) -> None:
+        keep = heapq.nlargest(self.max_queries // 2, self._entries.items(), key=lambda item: self._decayed(item[1], now))
+        self._entries = dict(keep)
+
+    def top(self, k: int) -> List[str]:
+        """The `k` most popular queries, most popular first (latest wording of each)."""
+        now = time.time()
+        return [entry.query for entry in heapq.nlargest(k, self._entries.values(), key=lambda entry: self._decayed(entry, now))]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# === Background Answer Refresh === #
+class AnswerWarmer:
+    """
+    Keeps popular answers fresh in the background.
+
+    `refresh_soon` re-runs one query off the request path: `process_query` calls it
+    when it serves a stale answer (stale-while-revalidate), and the warming loop calls
+    it every WARM_INTERVAL_SECONDS for each of the WARM_TOP_K most popular queries whose
+    answer is missing or has less than WARM_LEAD_SECONDS of freshness left. Both draw
+    on one budget of WARM_BUDGET_RUNS_PER_HOUR pipeline runs, at most WARM_CONCURRENCY
+    at a time, and pause while an upstream provider's circuit is open.
+    """
+
+    def __init__(
+        self,
+        cache: SemanticAnswerCache,
+        refresh: Callable[[str], Awaitable],
+        runs_per_hour: float = WARM_BUDGET_RUNS_PER_HOUR,
+        concurrency: int = WARM_CONCURRENCY,
+    ):
+        self.cache = cache
+        self.refresh = refresh
+        self.popularity = QueryPopularity()
+        self.runs_per_hour = runs_per_hour
+        # A sixth of the hourly budget may be spent at once (e.g. right after startup)
+        self.budget = TokenBucket(runs_per_hour / 3600, runs_per_hour / 6)
+        self.concurrency = concurrency
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def record(self, query: str) -> None:
+        self.popularity.record(query)
+
+    def refresh_soon(self, query: str, trigger: str) -> bool:
+        """
+        Start a background run for `query` unless one is already running for it.
+
+        Args:
+            query (str): The query to recompute.
+            trigger (str): "stale" or "warm"; labels the refresh counters.
+
+        Returns:
+            bool: False if it was not started because the budget is spent or a provider is down.
+        """
+        key = query_key(query)
+        if key in self._running:
+            return True
+        if self.runs_per_hour <= 0 or not all(upstream.available() for upstream in upstreams):
+            answer_refreshes.inc(trigger, "skipped")
+            return False
+        if self.budget.reserve(0) is None:
+            answer_refreshes.inc(trigger, "over_budget")
+            return False
+        if self._limit is None:
+            self._limit = asyncio.Semaphore(self.concurrency)
+        self._running[key] = asyncio.ensure_future(self._run(key, query, trigger))
+        return True
+
+    async def _run(self, key: str, query: str, trigger: str) -> None:
+        try:
+            async with self._limit:
+                logger.info("[WARM] Refreshing answer for '%s' (%s).", query, trigger)
+                await self.refresh(query)
+            answer_refreshes.inc(trigger, "ok")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            answer_refreshes.inc(trigger, "error")
+            logger.warning("[WARM] Refresh of '%s' failed: %s", query, e)
+        finally:
+            self._running.pop(key, None)
+
+    def warm_once(self) -> int:
+        """Schedule refreshes for popular queries about to go stale; returns how many were started."""
+        started = 0
+        for query in self.popularity.top(WARM_TOP_K):
+            if query_key(query) in self._running:
+                continue
+            hit = self.cache.peek(query)
+            if hit is not None and hit.fresh_for > WARM_LEAD_SECONDS:
+                continue
+            if not self.refresh_soon(query, "warm"):
+                break
+            started += 1
+        if started:
+            logger.info("[WARM] Refreshing %s popular answers ahead of expiry.", started)
+        return started
+
+    async def _warm_forever(self) -> None:
+        while True:
+            await asyncio.sleep(WARM_INTERVAL_SECONDS)
+            try:
+                self.warm_once()
+            except Exception as e:
+                logger.warning("[WARM] Warming pass failed: %s", e)
+
+    def start(self) -> None:
+        """Start the warming loop (called from the FastAPI lifespan); stale refreshes work without it."""
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._warm_forever())
+            logger.info("[WARM] Warming the top %s queries every %.0fs.", WARM_TOP_K, WARM_INTERVAL_SECONDS)
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._loop_task, *self._running.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+    def stats(self) -> dict:
+        return {
+            "tracked_queries": len(self.popularity),
+            "refreshing": len(self._running),
+            "budget_available": round(self.budget.available(), 2),
+        }
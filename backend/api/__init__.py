@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 from api.ask import router as ask_router
+from api.jobs import router as jobs_router
 
 api_router = APIRouter(prefix="/api", tags=["api"])
 
-api_router.include_router(ask_router)
\ No newline at end of file
+api_router.include_router(ask_router)
+api_router.include_router(jobs_router)
\ No newline at end of file
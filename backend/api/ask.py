@@ -1,33 +1,229 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Query
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from starlette.status import HTTP_401_UNAUTHORIZED
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import os
-from typing import Optional
-from dotenv import load_dotenv
-
-# Ensure environment variables are loaded
-load_dotenv()
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from pydantic import BaseModel, Field
+from agent.admission import AdmissionRejected, Lease, pipeline_admission
+from agent.metrics import METRICS_TIMING_HEADER, current_timings, server_timing_header, span
+from agent.sessions import session_key, session_store
+from agent.upstream import key_id
 
 router = APIRouter(prefix="/ask")
+logger = logging.getLogger("api")
+
+# How often to check whether the HTTP client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+# Idle interval after which an SSE comment is sent to keep proxies from closing the stream
+SSE_KEEPALIVE_SECONDS = 15.0
+# Largest per-request latency budget a caller may ask for (`budget` query parameter)
+MAX_BUDGET_SECONDS = float(os.getenv("MAX_BUDGET_SECONDS", "120"))
+SESSION_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
 
 # Load the API key from the environment
 EXPECTED_API_KEY = os.getenv("AGENT_API_KEY")
 
 # Dependency to validate API key
-async def verify_api_key(api_key: Optional[str] = Header(None)):
+async def verify_api_key(api_key: Optional[str] = Header(None)) -> Optional[str]:
     if api_key != EXPECTED_API_KEY:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Invalid or missing API key",
         )
+    return api_key
+
+# Take a pipeline slot for this API key, shedding the request with 429/503 when saturated
+async def acquire_pipeline_slot(api_key: Optional[str]) -> Lease:
+    try:
+        with span("admission"):
+            return await pipeline_admission.acquire(key_id(api_key))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+async def run_admitted(api_key: Optional[str], run: Callable[[], Awaitable]):
+    lease = await acquire_pipeline_slot(api_key)
+    try:
+        return await run()
+    finally:
+        lease.release()
+
+# Run an agent coroutine, cancelling it if the HTTP client goes away
+async def run_until_disconnected(request: Request, coro):
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.warning("[API] Client disconnected, cancelling agent run.")
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                # The client is gone; this status is only visible in access logs.
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
 
 # Import your agent function
-from agent.main import process_query  # Replace with actual import
+from agent.main import BATCH_MAX_QUERIES, process_batch, process_query  # Replace with actual import
 
 @router.get("/")
 async def ask_llm(
+    request: Request,
+    response: Response,
+    query: str = Query(..., min_length=1, description="Query string for the agent"),
+    budget: Optional[float] = Query(None, gt=0, le=MAX_BUDGET_SECONDS, description="End-to-end latency budget in seconds"),
+    session_id: Optional[str] = Query(None, pattern=SESSION_ID_PATTERN, description="Conversation ID; follow-ups reuse its sources"),
+    api_key: Optional[str] = Depends(verify_api_key),
+):
+    """
+    Route that sends a query to the LLM agent after API key validation and admission.
+
+    Per-stage durations are reported in a Server-Timing header (METRICS_TIMING_HEADER).
+    Requests with the same client-chosen `session_id` form a conversation: follow-up
+    questions reuse the documents gathered by earlier ones.
+    """
+    # Spans record into this dict from the agent task, which inherits our context
+    timings = {}
+    current_timings.set(timings)
+    session = session_key(api_key, session_id) if session_id else None
+    result = await run_until_disconnected(
+        request, run_admitted(api_key, lambda: process_query(query, budget_seconds=budget, session_id=session))
+    )
+    if METRICS_TIMING_HEADER and timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    if session_id:
+        return {"answer": result, "session_id": session_id}
+    return {"answer": result}
+
+
+# Encode one Server-Sent Event; multi-line payloads become multiple data fields
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/stream")
+async def ask_llm_stream(
     query: str = Query(..., min_length=1, description="Query string for the agent"),
-    _: None = Depends(verify_api_key),
+    budget: Optional[float] = Query(None, gt=0, le=MAX_BUDGET_SECONDS, description="End-to-end latency budget in seconds"),
+    session_id: Optional[str] = Query(None, pattern=SESSION_ID_PATTERN, description="Conversation ID; follow-ups reuse its sources"),
+    api_key: Optional[str] = Depends(verify_api_key),
 ):
-    """Route that sends a query to the LLM agent after API key validation."""
-    result = await process_query(query)
-    return {"answer": result}
\ No newline at end of file
+    """
+    Streaming variant of the ask route (text/event-stream).
+
+    Emits one event per pipeline stage (named after the stage, JSON payload with a
+    human-readable "message"), "token" events with chunks of the detailed analysis
+    as the LLM writes it, and finally a "final" event whose data is
+    `FINAL_RESPONSE::<json>`. Failures end the stream with an "error" event.
+    Admission happens before the stream opens, so shed requests get a plain 429/503.
+    """
+    lease = await acquire_pipeline_slot(api_key)
+    session = session_key(api_key, session_id) if session_id else None
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_agent():
+        try:
+            result = await process_query(query, on_event=events.put_nowait, budget_seconds=budget, session_id=session)
+            events.put_nowait({"stage": "final", "result": result})
+        except Exception as e:
+            logger.exception("[API] Streaming agent run failed: %s", e)
+            events.put_nowait({"stage": "error", "message": f"Error: {e}"})
+
+    async def event_stream():
+        task = asyncio.create_task(run_agent())
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                stage = event["stage"]
+                if stage == "final":
+                    yield sse_event("FINAL_RESPONSE::" + json.dumps(event["result"], ensure_ascii=False), event="final")
+                    return
+                if stage == "error":
+                    yield sse_event(event["message"], event="error")
+                    return
+                yield sse_event(json.dumps(event, ensure_ascii=False), event=stage)
+        finally:
+            # Client disconnected or stream finished: never leave the pipeline running
+            if not task.done():
+                task.cancel()
+            lease.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the stream never started (release is idempotent)
+        background=BackgroundTask(lease.release),
+    )
+
+
+class BatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUERIES, description="Questions to answer")
+
+
+@router.post("/batch")
+async def ask_llm_batch(body: BatchRequest, api_key: Optional[str] = Depends(verify_api_key)):
+    """
+    Answer many questions in one request (e.g. report generation), as newline-delimited JSON.
+
+    Searches and Firecrawl scrape jobs are shared across the batch (see `process_batch`).
+    Each line is `{"index", "query", "answer"}` or `{"index", "query", "error"}` and is
+    sent as soon as that question is answered, so lines arrive out of order; a final
+    `{"done": true, ...}` line closes the stream. The batch holds one admission slot.
+    """
+    queries = [query.strip() for query in body.queries]
+    if not all(queries):
+        raise HTTPException(status_code=422, detail="Queries must not be empty")
+    lease = await acquire_pipeline_slot(api_key)
+
+    async def result_lines():
+        failed = 0
+        results = process_batch(queries)
+        try:
+            async for index, result in results:
+                line = {"index": index, "query": queries[index]}
+                if isinstance(result, Exception):
+                    failed += 1
+                    line["error"] = f"Error: {result}"
+                else:
+                    line["answer"] = result
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "answered": len(queries) - failed, "failed": failed}) + "\n"
+        finally:
+            # Client disconnected or batch finished: stop any work still running
+            await results.aclose()
+            lease.release()
+
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(lease.release),
+    )
+
+
+@router.delete("/session/{session_id}")
+async def end_session(session_id: str, api_key: Optional[str] = Depends(verify_api_key)):
+    """Forget a conversation's documents before its idle timeout."""
+    dropped = session_store is not None and session_store.drop(session_key(api_key, session_id))
+    return {"session_id": session_id, "dropped": dropped}
@@ -0,0 +1,60 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from starlette.status import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND, HTTP_503_SERVICE_UNAVAILABLE
+
+from api.ask import MAX_BUDGET_SECONDS, SESSION_ID_PATTERN, verify_api_key
+from agent.jobs import JobScheduler, QueueFullError
+from agent.main import process_query
+from agent.metrics import register_collector
+from agent.sessions import session_key
+
+router = APIRouter(prefix="/jobs")
+
+# Background scheduler shared by every request handled in this worker process
+scheduler = JobScheduler(process_query)
+register_collector(lambda: {f'agent_jobs{{status="{status}"}}': count for status, count in scheduler.stats().items()})
+
+
+class JobRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="Query string for the agent")
+    priority: int = Field(0, description="Higher values run first")
+    budget: Optional[float] = Field(None, gt=0, le=MAX_BUDGET_SECONDS, description="Latency budget in seconds, counted from when the job starts")
+    session_id: Optional[str] = Field(None, pattern=SESSION_ID_PATTERN, description="Conversation ID; follow-ups reuse its sources")
+
+
+@router.post("/", status_code=HTTP_202_ACCEPTED)
+async def submit_job(body: JobRequest, api_key: Optional[str] = Depends(verify_api_key)):
+    """
+    Queue a query for background processing and return its task_id immediately.
+
+    `budget` and `session_id` behave as on the ask route; the budget starts when a
+    worker picks the job up, not while it waits in the queue.
+    """
+    session = session_key(api_key, body.session_id) if body.session_id else None
+    try:
+        job = scheduler.submit(body.query, priority=body.priority, budget_seconds=body.budget, session_id=session)
+    except QueueFullError as e:
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if body.session_id:
+        return {"task_id": job.task_id, "status": job.status, "session_id": body.session_id}
+    return {"task_id": job.task_id, "status": job.status}
+
+
+@router.get("/{task_id}")
+async def get_job(task_id: str, _: None = Depends(verify_api_key)):
+    """Report a job's status and current stage; includes the answer once completed."""
+    job = scheduler.get(task_id)
+    if job is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Unknown or expired task_id")
+    return job.to_dict()
+
+
+@router.delete("/{task_id}")
+async def cancel_job(task_id: str, _: None = Depends(verify_api_key)):
+    """Cancel a queued or running job."""
+    job = scheduler.cancel(task_id)
+    if job is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="Unknown or expired task_id")
+    return {"task_id": job.task_id, "status": job.status}
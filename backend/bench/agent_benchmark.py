@@ -0,0 +1,330 @@
+"""
+End-to-end load benchmark for the agent API.
+
+By default the FastAPI app is started in-process (uvicorn, real HTTP) with
+AGENT_FAKE_SERVICES=true, so no SerpAPI/Firecrawl/Gemini quota is used. The harness
+drives GET /api/ask/ at a fixed concurrency and reports:
+
+- throughput and end-to-end latency percentiles
+- p50/p95/p99 per pipeline stage, read from each response's Server-Timing header
+- event-loop lag, sampled by a monitor task on the server's loop; any stall above
+  --stall-ms is counted, and --fail-on-stall turns one into a non-zero exit code
+
+Run from backend/:
+
+    python -m bench.agent_benchmark --concurrency 16 --requests 200
+    python -m bench.agent_benchmark --fixtures ./recorded --scrape-ms 500 --scrape-p95-ms 3000
+    python -m bench.agent_benchmark --trace-blocking --fail-on-stall      # CI regression gate
+    python -m bench.agent_benchmark --url http://localhost:8000 --api-key KEY  # remote, no lag monitor
+
+`--fixtures DIR` replays searches and pages recorded by the agent: artifact store
+records under DIR (e.g. point it at ARTIFACTS_DIR) or legacy `serpai_folder/` and
+`final_results/` dumps. Artifacts written during an in-process run go to a temporary
+working directory.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "what are the trends of indian stock market indices?",
+    "compare the latest electric vehicle models and their safety features",
+    "how did the RBI repo rate change affect home loan rates this year",
+    "best performing mid cap mutual funds over the last five years",
+    "impact of rising crude oil prices on indian airline stocks",
+    "outlook for indian IT services companies after the latest earnings",
+    "which smartphones under 30000 rupees have the best cameras",
+    "how is the monsoon forecast expected to affect food inflation",
+]
+
+
+# === Statistics === #
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: List[float]) -> dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """`stage;dur=12.3, other;dur=4` -> {"stage": 12.3, "other": 4.0} (milliseconds)."""
+    timings = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+# === Event Loop Lag Monitor === #
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires; a late timer means something blocked the loop."""
+
+    def __init__(self, interval: float = 0.01, stall_threshold: float = 0.1):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags: List[float] = []
+        self.stalls: List[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.lags.append(lag)
+            if lag >= self.stall_threshold:
+                self.stalls.append(lag)
+
+
+# === Load Generator === #
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, api_key: str, queries: List[str], unique: bool, timeout: float):
+        self.client = client
+        self.api_key = api_key
+        self.queries = queries
+        self.unique = unique
+        self.timeout = timeout
+        self.latencies: List[float] = []
+        self.stage_ms: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, int] = {}
+        self._issued = 0
+
+    def _next_query(self) -> str:
+        query = self.queries[self._issued % len(self.queries)]
+        if self.unique:
+            # Distinct text keeps query coalescing and the answer cache out of the measurement
+            query = f"{query} (run {self._issued})"
+        self._issued += 1
+        return query
+
+    async def worker(self, total: int, stop_at: float) -> None:
+        while self._issued < total and time.monotonic() < stop_at:
+            query = self._next_query()
+            start = time.perf_counter()
+            try:
+                response = await self.client.get(
+                    "/api/ask/", params={"query": query}, headers={"api-key": self.api_key}, timeout=self.timeout
+                )
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            elapsed = time.perf_counter() - start
+
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status != "200":
+                continue
+            self.latencies.append(elapsed * 1000)
+            for stage, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                self.stage_ms.setdefault(stage, []).append(ms)
+
+
+async def run_benchmark(args: argparse.Namespace, base_url: str, monitor: Optional[LoopLagMonitor]) -> dict:
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        run = LoadRun(client, args.api_key, queries, unique=args.unique_queries, timeout=args.timeout)
+        stop_at = time.monotonic() + (args.duration or float("inf"))
+        total = args.requests if not args.duration else sys.maxsize
+        started = time.perf_counter()
+        await asyncio.gather(*(run.worker(total, stop_at) for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    completed = len(run.latencies)
+    report = {
+        "concurrency": args.concurrency,
+        "wall_seconds": wall,
+        "completed": completed,
+        "statuses": run.statuses,
+        "throughput_rps": completed / wall if wall else 0.0,
+        "latency_ms": summarize(run.latencies),
+        "stages_ms": {stage: summarize(values) for stage, values in run.stage_ms.items()},
+    }
+    if monitor is not None:
+        report["loop_lag_ms"] = summarize([lag * 1000 for lag in monitor.lags])
+        report["loop_stalls"] = {
+            "threshold_ms": monitor.stall_threshold * 1000,
+            "count": len(monitor.stalls),
+            "worst_ms": max(monitor.stalls, default=0.0) * 1000,
+        }
+    return report
+
+
+# === In-Process Server === #
+def configure_in_process_env(args: argparse.Namespace) -> None:
+    """Environment for the in-process app; must run before `main` is imported."""
+    defaults = {
+        "AGENT_FAKE_SERVICES": "true",
+        "AGENT_API_KEY": args.api_key,
+        "ADMISSION_PER_KEY_LIMIT": str(max(args.concurrency, 8)),
+        "FAKE_SERP_LATENCY_MS": str(args.serp_ms),
+        "FAKE_SERP_P95_MS": str(args.serp_p95_ms),
+        "FAKE_SCRAPE_LATENCY_MS": str(args.scrape_ms),
+        "FAKE_SCRAPE_P95_MS": str(args.scrape_p95_ms),
+        "FAKE_LLM_LATENCY_MS": str(args.llm_ms),
+        "FAKE_LLM_P95_MS": str(args.llm_p95_ms),
+        "FAKE_SCRAPE_FAILURE_RATE": str(args.scrape_failure_rate),
+        "FAKE_SERP_FAILURE_RATE": str(args.serp_failure_rate),
+        "FAKE_LLM_FAILURE_RATE": str(args.llm_failure_rate),
+        "FAKE_DOC_MIN_CHARS": str(args.doc_min_chars),
+        "FAKE_DOC_MAX_CHARS": str(args.doc_max_chars),
+    }
+    if args.fixtures:
+        defaults["FAKE_FIXTURES_DIR"] = os.path.abspath(args.fixtures)
+    if args.seed is not None:
+        defaults["FAKE_SEED"] = str(args.seed)
+    if not args.with_caches:
+        defaults.update({"SERP_CACHE_ENABLED": "false", "SCRAPE_CACHE_ENABLED": "false", "ANSWER_CACHE_ENABLED": "false"})
+    if not args.provider_limits:
+        # The fakes answer far faster than the real providers; per-key rate limits would dominate the numbers
+        defaults.update({f"UPSTREAM_{name}_RATE": "0" for name in ("SERPAPI", "FIRECRAWL", "LLM")})
+    os.environ.update(defaults)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_in_process(args: argparse.Namespace) -> dict:
+    import uvicorn
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, backend_dir)
+    configure_in_process_env(args)
+    os.chdir(tempfile.mkdtemp(prefix="agent-bench-"))
+    from main import app
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    loop = asyncio.get_running_loop()
+    if args.trace_blocking:
+        # asyncio logs every callback that holds the loop longer than the stall threshold, with its source
+        loop.set_debug(True)
+        loop.slow_callback_duration = args.stall_ms / 1000
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+
+    monitor = LoopLagMonitor(stall_threshold=args.stall_ms / 1000)
+    monitor_task = asyncio.create_task(monitor.run())
+    try:
+        return await run_benchmark(args, f"http://127.0.0.1:{port}", monitor)
+    finally:
+        monitor_task.cancel()
+        server.should_exit = True
+        await server_task
+
+
+# === Report === #
+def print_report(report: dict) -> None:
+    statuses = ", ".join(f"{status}: {count}" for status, count in sorted(report["statuses"].items()))
+    print(
+        f"\n{report['completed']} requests OK in {report['wall_seconds']:.1f}s at concurrency {report['concurrency']} "
+        f"-> {report['throughput_rps']:.2f} req/s  [{statuses}]\n"
+    )
+    print(f"{'stage':<16}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    rows = [("end_to_end", report["latency_ms"]), *sorted(report["stages_ms"].items())]
+    if "loop_lag_ms" in report:
+        rows.append(("loop_lag", report["loop_lag_ms"]))
+    for name, stats in rows:
+        print(f"{name:<16}{stats['count']:>8}{stats['p50']:>12.1f}{stats['p95']:>12.1f}{stats['p99']:>12.1f}{stats['max']:>12.1f}")
+    if "loop_stalls" in report:
+        stalls = report["loop_stalls"]
+        print(f"\nevent loop stalls >= {stalls['threshold_ms']:.0f} ms: {stalls['count']} (worst {stalls['worst_ms']:.1f} ms)")
+    print("\nStage durations are summed across a request's concurrent sub-queries.")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="total requests (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="run for this many seconds instead")
+    parser.add_argument("--timeout", type=float, default=180.0, help="per-request timeout in seconds")
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--unique-queries", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process one")
+    parser.add_argument("--api-key", default=os.getenv("AGENT_API_KEY", "bench"))
+    parser.add_argument("--json-out", help="also write the report as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logs")
+
+    fakes = parser.add_argument_group("fake services (in-process only)")
+    fakes.add_argument("--fixtures", help="directory with serpai_folder/ and final_results/ to replay")
+    fakes.add_argument("--serp-ms", type=float, default=800)
+    fakes.add_argument("--serp-p95-ms", type=float, default=2500)
+    fakes.add_argument("--scrape-ms", type=float, default=2000)
+    fakes.add_argument("--scrape-p95-ms", type=float, default=8000)
+    fakes.add_argument("--llm-ms", type=float, default=1500)
+    fakes.add_argument("--llm-p95-ms", type=float, default=4000)
+    fakes.add_argument("--scrape-failure-rate", type=float, default=0.05)
+    fakes.add_argument("--serp-failure-rate", type=float, default=0.0, help="share of searches failing with HTTP 503")
+    fakes.add_argument("--llm-failure-rate", type=float, default=0.0, help="share of LLM calls failing with HTTP 503")
+    fakes.add_argument("--doc-min-chars", type=int, default=4000)
+    fakes.add_argument("--doc-max-chars", type=int, default=40000)
+    fakes.add_argument("--seed", type=int, default=None)
+    fakes.add_argument("--with-caches", action="store_true", help="keep the SERP/scrape/answer caches enabled")
+    fakes.add_argument("--provider-limits", action="store_true", help="keep the per-provider rate limits (agent.upstream)")
+
+    blocking = parser.add_argument_group("event-loop blocking (in-process only)")
+    blocking.add_argument("--stall-ms", type=float, default=100.0, help="loop lag counted as a stall")
+    blocking.add_argument("--fail-on-stall", action="store_true", help="exit with status 2 if any stall is seen")
+    blocking.add_argument("--trace-blocking", action="store_true", help="log the callbacks that cause stalls")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # The in-process run changes the working directory
+    args.queries = os.path.abspath(args.queries) if args.queries else None
+    args.json_out = os.path.abspath(args.json_out) if args.json_out else None
+    if args.url:
+        report = asyncio.run(run_benchmark(args, args.url.rstrip("/"), monitor=None))
+    else:
+        report = asyncio.run(run_in_process(args))
+
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.fail_on_stall and report.get("loop_stalls", {}).get("count"):
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Local fetcher vs Firecrawl benchmark for the scrape stage.
+
+Starts a local HTTP server standing in for the web and scrapes a mix of pages with
+`_scrape_sources`, once with every URL sent to (fake) Firecrawl and once with the
+scrape router sending simple pages to the local fetcher. The page mix covers the
+fallback paths:
+
+- article: server-rendered HTML, converted locally
+- shell:   a script-rendered app shell (too little text -> Firecrawl)
+- blocked: HTTP 403 (-> Firecrawl)
+- huge:    larger than LOCAL_FETCH_MAX_BYTES (-> Firecrawl)
+- pdf:     routed to Firecrawl without a local attempt
+
+Pages are spread over --domains loopback addresses (127.0.0.1, 127.0.0.2, ...; Linux
+routes the whole 127/8 block to lo), so per-domain politeness limits apply as they
+would across real sites; LOCAL_FETCH_ALLOW_PRIVATE is turned on to reach them.
+Firecrawl is the offline stand-in (AGENT_FAKE_SERVICES=true) with --firecrawl-ms job
+latency.
+
+Run from backend/:
+
+    python -m bench.local_fetch_benchmark --pages 30 --domains 6 --firecrawl-ms 4000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import statistics
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+MIX = ["article"] * 7 + ["shell", "blocked", "article", "huge", "article", "pdf"]
+_WORDS = (
+    "market index shares rally earnings growth inflation outlook analysts forecast revenue "
+    "quarter margin policy rate investors sector demand supply capital budget"
+).split()
+
+
+# === Local Web Stand-In === #
+def article_html(path: str, chars: int) -> bytes:
+    words = [_WORDS[(hash(path) + i * 7) % len(_WORDS)] for i in range(chars // 7)]
+    paragraphs = "".join(f"<p>{' '.join(words[i:i + 60]).capitalize()}.</p>\n" for i in range(0, len(words), 60))
+    return (
+        f"<html><head><title>Article {path}</title><script src='/app.js'></script></head><body>"
+        f"<nav><a href='/'>Home</a> <a href='/markets'>Markets</a></nav>"
+        f"<article><h1>Report {path}</h1>{paragraphs}</article>"
+        f"<footer>All rights reserved</footer></body></html>"
+    ).encode("utf-8")
+
+
+SHELL_HTML = (
+    b"<html><head><title>App</title>" + b"<script src='/chunk.js'></script>" * 12 +
+    b"</head><body><div id='root'></div><noscript>You need to enable JavaScript to run this app.</noscript></body></html>"
+)
+
+
+def make_handler(page_ms: float, page_chars: int, huge_bytes: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(page_ms / 1000)
+            kind = self.path.strip("/").split("/")[0]
+            status, content_type = 200, "text/html; charset=utf-8"
+            if kind == "shell":
+                body = SHELL_HTML
+            elif kind == "blocked":
+                status, body = 403, b"Forbidden"
+            elif kind == "huge":
+                body = article_html(self.path, huge_bytes)
+            else:
+                body = article_html(self.path, page_chars)
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the fetcher hangs up on pages over its size cap
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_servers(args: argparse.Namespace) -> List[ThreadingHTTPServer]:
+    handler = make_handler(args.page_ms, args.page_chars, args.huge_bytes)
+    first = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    servers = [first]
+    for n in range(2, args.domains + 1):
+        servers.append(ThreadingHTTPServer((f"127.0.0.{n}", first.server_address[1]), handler))
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+
+def page_urls(args: argparse.Namespace, port: int, run: str) -> List[str]:
+    urls = []
+    for i in range(args.pages):
+        kind = MIX[i % len(MIX)]
+        host = f"127.0.0.{i % args.domains + 1}:{port}"
+        urls.append(f"http://{host}/report-{run}-{i}.pdf" if kind == "pdf" else f"http://{host}/{kind}/{run}-{i}")
+    return urls
+
+
+# === Runs === #
+class _TimedQueue(asyncio.Queue):
+    """Records when each document is handed to the pipeline."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.arrivals: List[float] = []
+        self.sources: Counter = Counter()
+
+    def put_nowait(self, item):
+        self.arrivals.append(time.perf_counter() - self.started)
+        self.sources[item[3]] += 1
+        super().put_nowait(item)
+
+
+async def scrape_once(urls: List[str], local: bool) -> dict:
+    from agent.main import _scrape_sources
+    from agent.local_fetch import scrape_router
+    from agent.metrics import local_fetches
+
+    scrape_router.enabled = local
+    before = dict(local_fetches._values)
+    queue = _TimedQueue()
+    await _scrape_sources(urls, queue)
+    outcomes = {labels[0]: count - before.get(labels, 0) for labels, count in local_fetches._values.items()}
+    return {
+        "wall_ms": (time.perf_counter() - queue.started) * 1000,
+        "documents": len(queue.arrivals),
+        "first_ms": min(queue.arrivals, default=0.0) * 1000,
+        "median_ms": statistics.median(queue.arrivals) * 1000 if queue.arrivals else 0.0,
+        "sources": dict(queue.sources),
+        "local_outcomes": {name: int(count) for name, count in outcomes.items() if count},
+    }
+
+
+async def run(args: argparse.Namespace, port: int) -> Dict[str, dict]:
+    from agent.clients import clients
+
+    try:
+        # The server prewarms the converter processes at startup; do the same here
+        await clients.local_fetcher().prewarm()
+        # Separate URLs per run so the in-flight map and router history start clean for each mode
+        return {
+            "firecrawl only": await scrape_once(page_urls(args, port, "a"), local=False),
+            "local + fallback": await scrape_once(page_urls(args, port, "b"), local=True),
+        }
+    finally:
+        await clients.aclose()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=30)
+    parser.add_argument("--domains", type=int, default=6, help="loopback addresses the pages are spread over")
+    parser.add_argument("--page-ms", type=float, default=80, help="server think time per page")
+    parser.add_argument("--page-chars", type=int, default=30_000)
+    parser.add_argument("--huge-bytes", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--firecrawl-ms", type=float, default=4000, help="median fake Firecrawl latency per URL")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.update({
+        "AGENT_FAKE_SERVICES": "true",
+        "FAKE_SCRAPE_LATENCY_MS": str(args.firecrawl_ms),
+        "FAKE_SCRAPE_P95_MS": str(args.firecrawl_ms * 1.5),
+        "FAKE_SCRAPE_FAILURE_RATE": "0",
+        "SCRAPE_CACHE_ENABLED": "false",
+        "ARTIFACTS_SINK": "none",
+        # The stand-in sites live on loopback addresses
+        "LOCAL_FETCH_ALLOW_PRIVATE": "true",
+    })
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    servers = start_servers(args)
+    try:
+        report = asyncio.run(run(args, servers[0].server_address[1]))
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    print(f"\n{args.pages} pages over {args.domains} domains, fake Firecrawl median {args.firecrawl_ms:.0f} ms\n")
+    print(f"{'mode':<18}{'docs':>6}{'first ms':>10}{'median ms':>11}{'all ms':>9}  sources / local outcomes")
+    for mode, result in report.items():
+        print(
+            f"{mode:<18}{result['documents']:>6}{result['first_ms']:>10.0f}{result['median_ms']:>11.0f}{result['wall_ms']:>9.0f}  "
+            f"{result['sources']} {result['local_outcomes'] or ''}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Logging overhead benchmark.
+
+Runs `process_query` in-process against the offline stand-ins (AGENT_FAKE_SERVICES=true)
+with near-zero upstream latency, so what is left per request is the agent's own work,
+and measures it under each logging setup:
+
+- off:           logging disabled (baseline)
+- sync text:     a StreamHandler on the root logger, formatting and writing on the
+                 event loop (the setup before agent/logs.py)
+- queue text:    `configure_logging()`: messages interpolated on the loop, formatted and
+                 written by the writer thread
+- queue json:    the same with LOG_FORMAT=json
+- queue sampled: json with --sample-rates applied to INFO/DEBUG records
+
+Reported per request: time the event-loop thread spent handing records to logging
+handlers (filtering, formatting, and with a synchronous handler the write itself),
+wall time, and records written, sampled out or dropped. Modes take turns over
+--rounds rounds and the median round is reported. Records go to a sink that sleeps
+--sink-delay-ms per write, standing in for a slow terminal, pipe or log shipper.
+Wall time is mostly the stand-ins' job polling and is only a sanity check.
+
+A second section times one call with a large payload on the calling thread: while
+DEBUG is off, an eager f-string around `json.dumps` against `lazy()` from
+agent/logs.py; and at an enabled level, where `lazy()` is rendered by the writer thread.
+
+Run from backend/:
+
+    python -m bench.logging_benchmark --requests 40 --concurrency 4
+    python -m bench.logging_benchmark --sink-delay-ms 1 --sample-rates search=0.1,scrape=0.1
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+import threading
+from typing import Dict, List, Optional
+
+MODES = ["off", "sync text", "queue text", "queue json", "queue sampled"]
+
+
+# === Slow Sink === #
+class SlowSink:
+    """Text stream that counts lines and sleeps on every write."""
+
+    def __init__(self, delay_ms: float):
+        self.delay = delay_ms / 1000
+        self.lines = 0
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def setup_logging(mode: str, sink: SlowSink, args: argparse.Namespace) -> None:
+    from agent.logs import TEXT_FORMAT, configure_logging
+
+    logging.disable(logging.NOTSET)
+    if mode == "off":
+        configure_logging(level=args.level, force=True, stream=sink)
+        logging.disable(logging.CRITICAL)
+    elif mode == "sync text":
+        # Stop the writer thread left by a previous mode, then install the old handler
+        configure_logging(level=args.level, force=True, stream=sink)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+    else:
+        fmt = "text" if mode == "queue text" else "json"
+        rates = args.sample_rates if mode == "queue sampled" else ""
+        configure_logging(level=args.level, fmt=fmt, force=True, stream=sink, sample_rates=rates)
+
+
+# === Loop-Side Logging Time === #
+class HandlerTimer:
+    """Accumulates time spent in `Logger.callHandlers` on one thread."""
+
+    def __init__(self):
+        self.thread = threading.get_ident()
+        self.seconds = 0.0
+        self._original = logging.Logger.callHandlers
+
+    def __enter__(self) -> "HandlerTimer":
+        timer, original = self, self._original
+
+        def call_handlers(logger: logging.Logger, record: logging.LogRecord) -> None:
+            if threading.get_ident() != timer.thread:
+                return original(logger, record)
+            started = time.perf_counter()
+            try:
+                return original(logger, record)
+            finally:
+                timer.seconds += time.perf_counter() - started
+
+        logging.Logger.callHandlers = call_handlers
+        return self
+
+    def __exit__(self, *exc) -> None:
+        logging.Logger.callHandlers = self._original
+
+
+# === Runs === #
+async def run_mode(mode: str, args: argparse.Namespace) -> dict:
+    from agent.logs import configure_logging
+    from agent.main import process_query
+    from agent.metrics import log_records
+
+    sink = SlowSink(args.sink_delay_ms)
+    setup_logging(mode, sink, args)
+    before = dict(log_records._values)
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(n: int) -> None:
+        async with limit:
+            # A distinct question per request, so every run goes through the whole pipeline
+            await process_query(f"{args.query} ({mode} #{n} {time.monotonic_ns()})")
+
+    started = time.perf_counter()
+    with HandlerTimer() as timer:
+        await asyncio.gather(*(one(n) for n in range(args.requests)))
+    wall = time.perf_counter() - started
+
+    # Drain the writer thread before counting what reached the sink
+    configure_logging(level=args.level, force=True, stream=SlowSink(0))
+    logging.disable(logging.NOTSET)
+    not_written = {labels[0]: count - before.get(labels, 0) for labels, count in log_records._values.items()}
+    return {
+        "loop_ms": timer.seconds * 1000 / args.requests,
+        "wall_ms": wall * 1000 / args.requests,
+        "records": sink.lines / args.requests,
+        "sampled_out": not_written.get("sampled_out", 0) / args.requests,
+        "dropped": not_written.get("dropped", 0) / args.requests,
+    }
+
+
+def median_round(results: List[dict]) -> dict:
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+async def run(args: argparse.Namespace) -> Dict[str, dict]:
+    from agent.clients import clients
+    from agent.main import process_query
+
+    try:
+        logging.disable(logging.CRITICAL)
+        for n in range(args.warmup):
+            await process_query(f"{args.query} (warmup #{n})")
+        rounds: Dict[str, List[dict]] = {mode: [] for mode in MODES}
+        for n in range(args.rounds):
+            # Rotate the order so no mode always runs first
+            for mode in MODES[n % len(MODES):] + MODES[:n % len(MODES)]:
+                rounds[mode].append(await run_mode(mode, args))
+        return {mode: median_round(results) for mode, results in rounds.items()}
+    finally:
+        await clients.aclose()
+
+
+def payload_calls(args: argparse.Namespace) -> Dict[str, float]:
+    """Microseconds per call carrying --payload-docs documents, spent on the calling thread."""
+    from agent.logs import configure_logging, lazy
+
+    logger = logging.getLogger("agent.bench")
+    logging.disable(logging.NOTSET)
+    logging.getLogger().setLevel(logging.INFO)
+    docs = [{"link": f"https://example.com/{n}", "markdown": "x" * args.payload_chars} for n in range(args.payload_docs)]
+    calls = 200
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        logger.debug(f"[BATCH ASYNC] Documents: {json.dumps(docs)}")
+    eager = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        logger.debug("[BATCH ASYNC] Documents: %s", lazy(lambda: json.dumps(docs)))
+    deferred = time.perf_counter() - started
+
+    configure_logging(level="INFO", fmt="json", force=True, stream=SlowSink(0))
+    started = time.perf_counter()
+    for _ in range(calls):
+        logger.info("[BATCH ASYNC] Documents: %s", lazy(lambda: json.dumps(docs)))
+    written = time.perf_counter() - started
+    configure_logging(level="INFO", force=True, stream=SlowSink(0))
+    return {
+        "eager f-string, DEBUG off": eager * 1e6 / calls,
+        "lazy(), DEBUG off": deferred * 1e6 / calls,
+        "lazy(), written": written * 1e6 / calls,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="requests per mode and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--query", default="what are the trends of indian stock market indices?")
+    parser.add_argument("--level", default="INFO")
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2, help="sleep per write to the log sink")
+    parser.add_argument("--sample-rates", default="search=0.1,scrape=0.1,map=0.1", help="LOG_SAMPLE_RATES for 'queue sampled'")
+    parser.add_argument("--payload-docs", type=int, default=20)
+    parser.add_argument("--payload-chars", type=int, default=20_000)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    workdir = tempfile.mkdtemp(prefix="logging-bench-")
+    os.environ.update({
+        "AGENT_FAKE_SERVICES": "true",
+        "FAKE_SERP_LATENCY_MS": "1",
+        "FAKE_SERP_P95_MS": "2",
+        "FAKE_SCRAPE_LATENCY_MS": "1",
+        "FAKE_SCRAPE_P95_MS": "2",
+        "FAKE_LLM_LATENCY_MS": "1",
+        "FAKE_LLM_P95_MS": "2",
+        "FAKE_SCRAPE_FAILURE_RATE": "0",
+        "ANSWER_CACHE_ENABLED": "false",
+        "SERP_CACHE_ENABLED": "false",
+        "SCRAPE_CACHE_ENABLED": "false",
+        "SUMMARY_CACHE_ENABLED": "false",
+        "CACHE_DB_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "ARTIFACTS_SINK": "none",
+    })
+    for name in ("SERPAPI", "FIRECRAWL", "LLM"):
+        os.environ.setdefault(f"UPSTREAM_{name}_RATE", "0")
+
+    report = asyncio.run(run(args))
+    payload = payload_calls(args)
+
+    print(
+        f"\n{args.requests} requests x {args.rounds} rounds per mode at concurrency {args.concurrency}, level {args.level}, "
+        f"sink {args.sink_delay_ms:g} ms per write\n"
+    )
+    print(f"{'mode':<16}{'loop ms':>10}{'wall ms':>10}{'records':>10}{'sampled':>10}{'dropped':>10}")
+    for mode, result in report.items():
+        print(
+            f"{mode:<16}{result['loop_ms']:>10.2f}{result['wall_ms']:>10.2f}{result['records']:>10.1f}"
+            f"{result['sampled_out']:>10.1f}{result['dropped']:>10.1f}"
+        )
+    print(f"\nOne log call with {args.payload_docs} x {args.payload_chars} char documents, calling thread:")
+    for name, micros in payload.items():
+        print(f"  {name:<28}{micros:>10.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
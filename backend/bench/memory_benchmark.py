@@ -0,0 +1,146 @@
+"""
+Peak-memory benchmark for the query pipeline.
+
+Runs `process_query` in-process against the fake services (AGENT_FAKE_SERVICES=true)
+with tracemalloc on, and reports Python heap bytes per request:
+
+- sequential: peak allocated above the idle baseline while one request runs, and
+  what it still holds when summarization starts (kept through the LLM call, which is
+  the longest stage in production)
+- concurrent: peak above baseline with --concurrency requests in flight, divided by
+  the number of requests
+- retained: heap still allocated after every request finished (should stay near 0)
+
+Large pages (--doc-chars) make per-document copies show up clearly. Caches are off and
+the latency budget is lifted, so every request scrapes and summarizes all its pages.
+
+Run from backend/:
+
+    python -m bench.memory_benchmark --requests 8 --concurrency 50 --doc-chars 400000
+"""
+import os
+import gc
+import sys
+import asyncio
+import argparse
+import logging
+import statistics
+import tempfile
+import tracemalloc
+from typing import List, Optional
+
+from bench.agent_benchmark import DEFAULT_QUERIES
+
+MIB = 1024 * 1024
+
+
+def configure_env(args: argparse.Namespace) -> None:
+    """Environment for the in-process pipeline; must run before `agent.main` is imported."""
+    os.environ.update({
+        "AGENT_FAKE_SERVICES": "true",
+        "FAKE_SERP_LATENCY_MS": str(args.latency_ms),
+        "FAKE_SCRAPE_LATENCY_MS": str(args.latency_ms),
+        "FAKE_LLM_LATENCY_MS": str(args.latency_ms),
+        "FAKE_SCRAPE_FAILURE_RATE": "0",
+        "FAKE_DOC_MIN_CHARS": str(args.doc_chars),
+        "FAKE_DOC_MAX_CHARS": str(args.doc_chars),
+        "SERP_CACHE_ENABLED": "false",
+        "SCRAPE_CACHE_ENABLED": "false",
+        "SUMMARY_CACHE_ENABLED": "false",
+        "ANSWER_CACHE_ENABLED": "false",
+        "HEDGE_ENABLED": "false",
+        # tracemalloc slows everything down; let every selected page land instead of cutting stragglers
+        "PIPELINE_BUDGET_SECONDS": "3600",
+        "PIPELINE_QUORUM_DEADLINE_SECONDS": "3600",
+        "PIPELINE_DOC_QUORUM": "1000",
+        "ADMISSION_PER_KEY_LIMIT": str(max(args.concurrency, 8)),
+    })
+
+
+def heap_now() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import agent.main as pipeline
+    from agent.main import process_query
+
+    summarize = pipeline.summarize_for_user
+    heap_at_summarize = []
+
+    async def measured_summarize(*call_args, **kwargs):
+        heap_at_summarize.append(tracemalloc.get_traced_memory()[0])
+        return await summarize(*call_args, **kwargs)
+
+    pipeline.summarize_for_user = measured_summarize
+    queries = [f"{DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)]} (run {i})" for i in range(args.requests + args.concurrency + 1)]
+    # Warm-up: first-use imports, client construction and caches of compiled regexes stay out of the numbers
+    await process_query(queries.pop())
+
+    tracemalloc.start()
+    baseline = heap_now()
+
+    sequential = []
+    held = []
+    for _ in range(args.requests):
+        before = heap_now()
+        tracemalloc.reset_peak()
+        await process_query(queries.pop())
+        sequential.append(tracemalloc.get_traced_memory()[1] - before)
+        held.append(heap_at_summarize[-1] - before)
+
+    before = heap_now()
+    tracemalloc.reset_peak()
+    await asyncio.gather(*(process_query(queries.pop()) for _ in range(args.concurrency)))
+    concurrent_peak = tracemalloc.get_traced_memory()[1] - before
+
+    # Let artifact writes and other background work settle before measuring what stayed behind
+    await asyncio.sleep(0.5)
+    retained = heap_now() - baseline
+    tracemalloc.stop()
+    return {
+        "doc_chars": args.doc_chars,
+        "sequential_median": statistics.median(sequential),
+        "sequential_max": max(sequential),
+        "held_while_summarizing": statistics.median(held),
+        "concurrency": args.concurrency,
+        "concurrent_peak": concurrent_peak,
+        "concurrent_per_request": concurrent_peak / args.concurrency,
+        "retained": retained,
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8, help="sequential requests measured one at a time")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight for the concurrent peak")
+    parser.add_argument("--doc-chars", type=int, default=400_000, help="size of every fake page")
+    parser.add_argument("--latency-ms", type=float, default=50, help="median latency of each fake service")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    configure_env(args)
+    # Artifacts written by the runs go to a temporary working directory
+    os.chdir(tempfile.mkdtemp(prefix="agent-membench-"))
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print(f"pages of {report['doc_chars'] / 1000:.0f}k chars, Python heap above idle baseline:")
+    print(f"  one request at a time   median {report['sequential_median'] / MIB:8.1f} MiB   max {report['sequential_max'] / MIB:8.1f} MiB")
+    print(f"  held while summarizing  median {report['held_while_summarizing'] / MIB:8.1f} MiB")
+    print(
+        f"  {report['concurrency']:>3} in flight           peak   {report['concurrent_peak'] / MIB:8.1f} MiB   "
+        f"-> {report['concurrent_per_request'] / MIB:.1f} MiB per request"
+    )
+    print(f"  retained after the runs        {report['retained'] / MIB:8.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Import-to-ready benchmark for the backend.
+
+Imports the FastAPI app (`main`) in fresh interpreters and reports the median wall
+time, plus the slowest top-level imports from `python -X importtime` so regressions
+(a heavy SDK imported eagerly again) are easy to spot.
+
+Run from backend/:
+
+    python -m bench.startup_benchmark --runs 5 --top 15
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROBE = (
+    "import time; t = time.perf_counter(); import main; "
+    "print(f'IMPORT_MS={(time.perf_counter() - t) * 1000:.1f}')"
+)
+
+
+def run_once(importtime: bool) -> Tuple[float, str]:
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", PROBE]
+    result = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    import_ms = next(float(line.split("=", 1)[1]) for line in result.stdout.splitlines() if line.startswith("IMPORT_MS="))
+    return import_ms, result.stderr
+
+
+def slowest_imports(importtime_log: str, top: int) -> List[Tuple[int, str]]:
+    """(cumulative microseconds, module) for the heaviest packages imported directly by the app."""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nesting depth is encoded as indentation; keep imports at most two levels deep
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    timings = [run_once(importtime=False)[0] for _ in range(args.runs)]
+    print(f"import main: median {statistics.median(timings):.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms over {args.runs} runs")
+
+    _, log = run_once(importtime=True)
+    print(f"\n{'cumulative ms':>14}  module")
+    for cumulative_us, name in slowest_imports(log, args.top):
+        print(f"{cumulative_us / 1000:>14.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
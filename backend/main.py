@@ -1,23 +1,59 @@
+import time
+
+# Import-to-ready is measured from here
+IMPORT_STARTED_AT = time.perf_counter()
+
 import json
+import asyncio
 import traceback
+from contextlib import asynccontextmanager
+
+# Load environment variables once, before any module reads its settings
+from dotenv import load_dotenv, find_dotenv
+load_dotenv(find_dotenv())
+
+# Logging goes through a queue to a writer thread; set up before any module logs at import
+import logging
+from agent.logs import configure_logging
+configure_logging()
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
-from fastapi.middleware.cors import CORSMiddleware
 from api import api_router
+from api.jobs import scheduler
+from agent.artifacts import artifact_sink
+from agent.clients import CLIENTS_PREWARM, clients
+from agent.metrics import render as render_metrics
+from agent.main import answer_warmer
+from agent.warming import WARM_ENABLED
 
-import logging
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED_AT
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(
+        "[STARTUP] App imported in %.0f ms, ready to serve %.0f ms after import start.",
+        IMPORT_SECONDS * 1000, (time.perf_counter() - IMPORT_STARTED_AT) * 1000,
+    )
+    # Upstream clients are built lazily; prewarming builds them off the loop before the first request needs them
+    prewarm = asyncio.create_task(clients.prewarm()) if CLIENTS_PREWARM else None
+    if WARM_ENABLED and answer_warmer is not None:
+        answer_warmer.start()
+    yield
+    if prewarm is not None and not prewarm.done():
+        prewarm.cancel()
+    if answer_warmer is not None:
+        await answer_warmer.stop()
+    await scheduler.shutdown()
+    await clients.aclose()
+    await asyncio.to_thread(artifact_sink.close)
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allowed origins (Frontend URLs)
 origins = [
@@ -37,3 +73,9 @@ app.add_middleware(
 app.include_router(api_router)
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint: stage latency histograms, token/byte counters, cache and queue gauges."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
@@ -0,0 +1,9 @@
+"""
+Unit tests for the agent's pure modules. Run from backend/:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
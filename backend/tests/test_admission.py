@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from agent.admission import AdmissionController, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_slots_are_handed_to_waiters_in_order():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=5, per_key_limit=5)
+    order = []
+
+    async def request(name: str, hold: float):
+        async with controller.slot(name):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def main():
+        first = asyncio.ensure_future(request("a", 0.02))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(request(name, 0)) for name in "bcd"]
+        await asyncio.sleep(0)
+        assert controller.stats() == {"running": 1, "waiting": 3, "rejected": 0}
+        await asyncio.gather(first, *rest)
+
+    run(main())
+    assert order == ["a", "b", "c", "d"]
+    assert controller.stats() == {"running": 0, "waiting": 0, "rejected": 0}
+
+
+def test_full_queue_is_rejected_with_503():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5, per_key_limit=5)
+
+    async def main():
+        lease = await controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire("c")
+        assert info.value.status_code == 503
+        lease.release()
+        (await waiter).release()
+
+    run(main())
+    assert controller.stats() == {"running": 0, "waiting": 0, "rejected": 1}
+
+
+def test_waiting_past_max_wait_is_shed():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=0.01, per_key_limit=5)
+
+    async def main():
+        lease = await controller.acquire("a")
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire("b")
+        assert info.value.status_code == 503 and info.value.retry_after == 1
+        assert controller.stats()["waiting"] == 0
+        lease.release()
+
+    run(main())
+    assert controller.running == 0
+
+
+def test_per_key_limit_counts_running_and_waiting_requests():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=5, per_key_limit=2)
+
+    async def main():
+        lease = await controller.acquire("key")
+        waiter = asyncio.ensure_future(controller.acquire("key"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire("key")
+        assert info.value.status_code == 429
+        other = asyncio.ensure_future(controller.acquire("other"))
+        await asyncio.sleep(0)
+        lease.release()
+        (await waiter).release()
+        (await other).release()
+
+    run(main())
+    assert controller.stats() == {"running": 0, "waiting": 0, "rejected": 1}
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    controller = AdmissionController(max_concurrent=1, max_queue=5, max_wait=5, per_key_limit=1)
+
+    async def main():
+        lease = await controller.acquire("a")
+        waiter = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.stats()["waiting"] == 0
+        # The key's place is free again, and releasing twice frees one slot only
+        lease.release()
+        lease.release()
+        (await controller.acquire("b")).release()
+
+    run(main())
+    assert controller.running == 0
+
+
+def test_a_lone_key_can_fill_every_slot_and_then_queue():
+    controller = AdmissionController(max_concurrent=16, max_queue=64, max_wait=5, per_key_limit=0)
+
+    async def main():
+        leases = [await controller.acquire("key") for _ in range(16)]
+        waiters = [asyncio.ensure_future(controller.acquire("key")) for _ in range(64)]
+        await asyncio.sleep(0)
+        assert controller.stats() == {"running": 16, "waiting": 64, "rejected": 0}
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire("key")
+        assert info.value.status_code == 503
+        for lease in leases:
+            lease.release()
+        for waiter in waiters:
+            (await waiter).release()
+
+    run(main())
+    assert controller.running == 0
+
+
+def test_fair_share_applies_once_another_key_is_active():
+    controller = AdmissionController(max_concurrent=2, max_queue=2, max_wait=5, per_key_limit=0)
+
+    async def main():
+        leases = [await controller.acquire("busy") for _ in range(2)]
+        other = asyncio.ensure_future(controller.acquire("other"))
+        await asyncio.sleep(0)
+        # Two active keys share four slots: "busy" already holds its two
+        with pytest.raises(AdmissionRejected) as info:
+            await controller.acquire("busy")
+        assert info.value.status_code == 429
+        for lease in leases:
+            lease.release()
+        (await other).release()
+
+    run(main())
+    assert controller.stats() == {"running": 0, "waiting": 0, "rejected": 1}
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from agent.answer_cache import ANSWER_CACHE_SIMILARITY, SemanticAnswerCache, guard_terms, query_key, query_terms, vectorize_query
+
+NEAR_MISSES = [
+    ("which smartphones under 30000 rupees have the best cameras", "which smartphones under 20000 rupees have the best cameras"),
+    ("nifty 50 performance in 2023", "nifty 50 performance in 2024"),
+    ("hdfc bank q1 results", "hdfc bank q2 results"),
+    ("is it safe to invest in adani", "is it not safe to invest in adani"),
+    ("is it safe to invest in adani", "isn't it safe to invest in adani"),
+    ("rbi policy decision in june", "rbi policy decision in july"),
+]
+
+
+def similarity(a: str, b: str) -> float:
+    return float(vectorize_query(a) @ vectorize_query(b))
+
+
+def test_query_terms_drop_stopwords_and_plurals():
+    assert query_terms("What are the trends of Indian stock markets?") == ["indian", "market", "stock", "trend"]
+    assert query_key("stock market trends") == query_key("trends in the stock market")
+
+
+def test_guard_terms():
+    assert guard_terms(query_terms("hdfc bank q1 results for fy24 in june")) == {"q1", "fy24", "june"}
+    assert guard_terms(query_terms("is it not safe")) == {"not"}
+    assert guard_terms(query_terms("stock market trends")) == frozenset()
+
+
+def test_rephrased_question_is_served():
+    cache = SemanticAnswerCache()
+    cache.add("what are the trends of indian stock market indices?", {"answer": "up"})
+    hit = cache.lookup("trends of the indian stock market indices")
+    assert hit is not None
+    assert hit.answer == {"answer": "up"}
+    assert not hit.stale
+
+
+@pytest.mark.parametrize("stored, asked", NEAR_MISSES)
+def test_near_miss_questions_are_not_served(stored, asked):
+    # The vectors alone would call these duplicates; the guard terms must not
+    assert similarity(stored, asked) >= ANSWER_CACHE_SIMILARITY
+    cache = SemanticAnswerCache()
+    cache.add(stored, {"answer": stored})
+    assert cache.lookup(asked) is None
+    assert cache.misses == 1
+
+
+def test_low_term_overlap_is_not_served():
+    cache = SemanticAnswerCache(threshold=0.0)
+    cache.add("electric vehicle safety ratings", {"answer": "ev"})
+    assert cache.lookup("electric scooter subsidy ratings india") is None
+
+
+def test_guarded_match_falls_through_to_next_best_row():
+    cache = SemanticAnswerCache()
+    cache.add("nifty 50 performance in 2023", {"answer": 2023})
+    cache.add("nifty 50 performance in 2024", {"answer": 2024})
+    assert cache.lookup("performance of the nifty 50 in 2024").answer == {"answer": 2024}
+    assert cache.lookup("performance of the nifty 50 in 2023").answer == {"answer": 2023}
+
+
+def test_stale_answers_are_flagged_then_expire():
+    cache = SemanticAnswerCache(ttl=0.05, stale_seconds=0.05)
+    cache.add("gold price outlook", {"answer": "gold"})
+    time.sleep(0.06)
+    hit = cache.lookup("gold price outlook")
+    assert hit is not None and hit.stale
+    time.sleep(0.05)
+    assert cache.lookup("gold price outlook") is None
+
+
+def test_same_content_words_replace_their_row():
+    cache = SemanticAnswerCache()
+    cache.add("gold price outlook", {"answer": 1})
+    cache.add("outlook for the gold price", {"answer": 2})
+    assert len(cache) == 1
+    assert cache.lookup("gold price outlook").answer == {"answer": 2}
+
+
+def test_full_cache_reuses_least_recently_used_row():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.add("gold price outlook", {"answer": "gold"})
+    cache.add("crude oil price outlook", {"answer": "oil"})
+    cache.lookup("gold price outlook")
+    cache.add("rupee dollar exchange rate", {"answer": "fx"})
+    assert cache.lookup("gold price outlook") is not None
+    assert cache.lookup("crude oil price outlook") is None
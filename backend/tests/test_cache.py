@@ -0,0 +1,22 @@
+import asyncio
+
+from agent.cache import SqliteTTLStore
+
+
+def test_store_opens_the_database_on_first_use(tmp_path):
+    path = tmp_path / "nested" / "cache.sqlite3"
+    store = SqliteTTLStore("test_cache", max_entries=10, path=str(path))
+    assert not path.parent.exists()
+
+    asyncio.run(store.set("key", b"value", ttl=60))
+    assert path.exists()
+    assert asyncio.run(store.get("key")) == b"value"
+
+
+def test_store_reads_rows_written_by_another_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SqliteTTLStore("test_cache", max_entries=10, path=path).set_blocking("key", b"value", ttl=60)
+    reader = SqliteTTLStore("test_cache", max_entries=10, path=path)
+    assert reader.get_blocking("key") == b"value"
+    assert reader.get_blocking("missing") is None
+    assert reader.stats()["hits"] == 1
@@ -0,0 +1,61 @@
+import pytest
+
+from agent.cleaning import DocumentCleaner
+
+FILLER = " ".join(f"word{n}" for n in range(40))
+
+
+@pytest.mark.parametrize("line", [
+    "Retail investors can subscribe to the IPO until June 5.",
+    "The bank will ask customers to log in to the new app before March to keep their accounts active.",
+    "Read more: Sensex falls 500 points as IT stocks drag",
+    "Apple shares drop on cookies ruling",
+    "Sponsored funds saw record inflows in the last quarter, according to AMFI data.",
+])
+def test_content_mentioning_a_boilerplate_word_is_kept(line):
+    assert DocumentCleaner().clean(line) == line
+
+
+@pytest.mark.parametrize("line", [
+    "Subscribe to our newsletter",
+    "Sign up for free",
+    "Read more",
+    "We use cookies to improve your experience. Accept all cookies",
+    "Follow us on Twitter",
+    "Share this article",
+    "All rights reserved. © 2024 Example Media",
+    "Advertisement",
+])
+def test_boilerplate_lines_are_dropped(line):
+    assert DocumentCleaner().clean(f"Real paragraph about markets.\n{line}") == "Real paragraph about markets."
+
+
+def test_images_link_lines_and_link_markup_are_stripped():
+    markdown = (
+        "![logo](https://example.com/logo.png)\n"
+        "https://example.com/standalone\n"
+        "[Home](https://example.com/) [Markets](https://example.com/markets) [News](https://example.com/news)\n"
+        "The [RBI](https://rbi.org.in) kept rates unchanged.\n"
+        "Watch the [briefing](https://www.youtube.com/watch?v=abc)."
+    )
+    assert DocumentCleaner().clean(markdown) == (
+        "The RBI kept rates unchanged.\n"
+        "Watch the [briefing](https://www.youtube.com/watch?v=abc)."
+    )
+
+
+def test_near_duplicate_paragraphs_across_documents_are_dropped():
+    cleaner = DocumentCleaner()
+    paragraph = f"Syndicated wire story about the market {FILLER}"
+    assert cleaner.clean(f"Intro one.\n\n{paragraph}") == f"Intro one.\n\n{paragraph}"
+    assert cleaner.clean(f"Intro two.\n\n{paragraph} extra") == "Intro two."
+    stats = cleaner.stats()
+    assert stats["duplicate_paragraphs"] == 1
+    assert stats["documents"] == 2
+    assert stats["bytes_saved"] > 0
+
+
+def test_short_paragraphs_are_never_deduplicated():
+    cleaner = DocumentCleaner()
+    cleaner.clean("Markets closed higher today.")
+    assert cleaner.clean("Markets closed higher today.") == "Markets closed higher today."
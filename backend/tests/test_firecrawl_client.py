@@ -0,0 +1,37 @@
+import pytest
+import requests
+
+from agent.firecrawl_client import PooledFirecrawlApp
+
+
+class RecordingSession:
+    """Answers every request with one canned response and remembers what was asked."""
+
+    def __init__(self, status: int, body: dict):
+        self.status, self.body = status, body
+        self.calls = []
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        self.calls.append((method, url))
+        response = requests.Response()
+        response.status_code = self.status
+        response._content = requests.compat.json.dumps(self.body).encode()
+        return response
+
+
+def app_with(session: RecordingSession) -> PooledFirecrawlApp:
+    app = PooledFirecrawlApp(api_key="fc-test", api_url="https://firecrawl.test")
+    app.session = session
+    return app
+
+
+def test_cancel_batch_scrape_hits_the_batch_endpoint():
+    session = RecordingSession(200, {"status": "cancelled"})
+    assert app_with(session).cancel_batch_scrape("job-1") == {"status": "cancelled"}
+    assert session.calls == [("DELETE", "https://firecrawl.test/v1/batch/scrape/job-1")]
+
+
+def test_cancel_batch_scrape_raises_when_rejected():
+    session = RecordingSession(404, {"error": "Job not found"})
+    with pytest.raises(requests.exceptions.HTTPError):
+        app_with(session).cancel_batch_scrape("job-1")
@@ -0,0 +1,175 @@
+import asyncio
+
+import pytest
+
+from agent.jobs import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, JobScheduler, QueueFullError
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+async def wait_for_status(job, *statuses):
+    for _ in range(200):
+        if job.status in statuses:
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError(f"job stayed {job.status}")
+
+
+def test_job_runs_and_reports_stage():
+    async def runner(query, on_event, task_id):
+        on_event({"stage": "search", "message": "searching"})
+        return {"answer": query.upper()}
+
+    async def main():
+        scheduler = JobScheduler(runner, workers=1)
+        job = scheduler.submit("gold price")
+        await wait_for_status(job, COMPLETED)
+        await scheduler.shutdown()
+        return job
+
+    job = run(main())
+    assert job.result == {"answer": "GOLD PRICE"}
+    assert job.stage == "search"
+    assert job.started_at is not None and job.finished_at is not None
+
+
+def test_submit_options_reach_the_runner():
+    async def runner(query, on_event, task_id, **options):
+        return options
+
+    async def main():
+        scheduler = JobScheduler(runner, workers=1)
+        job = scheduler.submit("follow-up", budget_seconds=20.0, session_id="owner:chat-1")
+        await wait_for_status(job, COMPLETED)
+        await scheduler.shutdown()
+        return job
+
+    assert run(main()).result == {"budget_seconds": 20.0, "session_id": "owner:chat-1"}
+
+
+def test_higher_priority_runs_first_and_fifo_within_priority():
+    order = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def runner(query, on_event, task_id):
+            if query == "blocker":
+                await release.wait()
+            order.append(query)
+
+        scheduler = JobScheduler(runner, workers=1)
+        blocker = scheduler.submit("blocker")
+        await wait_for_status(blocker, RUNNING)
+        jobs = [scheduler.submit("low-1"), scheduler.submit("high", priority=5), scheduler.submit("low-2")]
+        release.set()
+        for job in jobs:
+            await wait_for_status(job, COMPLETED)
+        await scheduler.shutdown()
+
+    run(main())
+    assert order == ["blocker", "high", "low-1", "low-2"]
+
+
+def test_failed_job_keeps_its_error():
+    async def runner(query, on_event, task_id):
+        raise RuntimeError("upstream down")
+
+    async def main():
+        scheduler = JobScheduler(runner, workers=1)
+        job = scheduler.submit("q")
+        await wait_for_status(job, FAILED)
+        await scheduler.shutdown()
+        return job
+
+    assert run(main()).error == "upstream down"
+
+
+def test_running_job_can_be_cancelled():
+    async def runner(query, on_event, task_id):
+        await asyncio.sleep(10)
+
+    async def main():
+        scheduler = JobScheduler(runner, workers=1)
+        job = scheduler.submit("q")
+        await wait_for_status(job, RUNNING)
+        scheduler.cancel(job.task_id)
+        await wait_for_status(job, CANCELLED)
+        await scheduler.shutdown()
+
+    run(main())
+
+
+def test_queue_full_counts_only_waiting_jobs():
+    async def main():
+        release = asyncio.Event()
+        ran = []
+
+        async def runner(query, on_event, task_id):
+            await release.wait()
+            ran.append(query)
+
+        scheduler = JobScheduler(runner, workers=1, max_queued=2)
+        blocker = scheduler.submit("blocker")
+        await wait_for_status(blocker, RUNNING)
+        first, second = scheduler.submit("a"), scheduler.submit("b")
+        with pytest.raises(QueueFullError):
+            scheduler.submit("c")
+
+        # Cancelling queued jobs frees their places at once, many times over
+        for n in range(50):
+            scheduler.cancel(first.task_id)
+            first = scheduler.submit(f"a{n}")
+        assert scheduler._queue.qsize() <= 2 * scheduler.max_queued + 1
+        with pytest.raises(QueueFullError):
+            scheduler.submit("c")
+
+        release.set()
+        await wait_for_status(first, COMPLETED)
+        await wait_for_status(second, COMPLETED)
+        await scheduler.shutdown()
+        return ran
+
+    assert run(main()) == ["blocker", "b", "a49"]
+
+
+def test_cancelled_queued_job_is_never_run():
+    async def main():
+        release = asyncio.Event()
+        ran = []
+
+        async def runner(query, on_event, task_id):
+            await release.wait()
+            ran.append(query)
+
+        scheduler = JobScheduler(runner, workers=1)
+        blocker = scheduler.submit("blocker")
+        await wait_for_status(blocker, RUNNING)
+        queued = scheduler.submit("cancelled")
+        assert queued.status == QUEUED
+        scheduler.cancel(queued.task_id)
+        after = scheduler.submit("after")
+        release.set()
+        await wait_for_status(after, COMPLETED)
+        await scheduler.shutdown()
+        return ran, queued.status
+
+    assert run(main()) == (["blocker", "after"], CANCELLED)
+
+
+def test_closing_the_loop_with_a_running_job_does_not_hang():
+    # asyncio.run cancels the worker and the job task together on the way out
+    async def runner(query, on_event, task_id):
+        await asyncio.sleep(10)
+
+    async def main():
+        scheduler = JobScheduler(runner, workers=1)
+        job = scheduler.submit("q")
+        scheduler.submit("next")
+        await wait_for_status(job, RUNNING)
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == CANCELLED
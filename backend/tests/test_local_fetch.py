@@ -0,0 +1,107 @@
+import asyncio
+
+import httpx
+import pytest
+
+from agent import local_fetch
+from agent.local_fetch import LocalFetcher, LocalFetchError, check_destination
+
+ADDRESSES = {
+    "news.example.com": ["93.184.216.34"],
+    "other.example.com": ["2606:2800:220:1:248:1893:25c8:1946"],
+    "internal.example.com": ["10.0.0.7"],
+    "rebound.example.com": ["93.184.216.34", "127.0.0.1"],
+}
+
+
+@pytest.fixture(autouse=True)
+def fake_dns(monkeypatch):
+    async def resolve(host, port):
+        if host in ADDRESSES:
+            return ADDRESSES[host]
+        return [host]  # IP literals resolve to themselves
+
+    monkeypatch.setattr(local_fetch, "_resolve", resolve)
+
+
+def fetcher(handler) -> LocalFetcher:
+    return LocalFetcher(httpx.AsyncClient(transport=httpx.MockTransport(handler)), allow_private=False)
+
+
+def page(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html>ok</html>")
+
+
+@pytest.mark.parametrize("url", [
+    "http://169.254.169.254/latest/meta-data/",
+    "http://127.0.0.1:8000/metrics",
+    "http://[::1]/",
+    "http://[::ffff:127.0.0.1]/",
+    "http://192.168.1.1/",
+    "http://internal.example.com/admin",
+    "http://rebound.example.com/",
+    "http://224.0.0.1/",
+    "file:///etc/passwd",
+])
+def test_internal_destinations_are_refused(url):
+    with pytest.raises(LocalFetchError) as info:
+        asyncio.run(check_destination(url))
+    assert info.value.reason == "forbidden_address"
+
+
+@pytest.mark.parametrize("url", ["https://news.example.com/markets", "http://other.example.com:8080/"])
+def test_public_destinations_are_allowed(url):
+    asyncio.run(check_destination(url))
+
+
+def test_direct_request_to_an_internal_address_is_never_sent():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return page(request)
+
+    with pytest.raises(LocalFetchError) as info:
+        asyncio.run(fetcher(handler).fetch("http://169.254.169.254/latest/meta-data/"))
+    assert info.value.reason == "forbidden_address"
+    assert requests == []
+
+
+def test_redirect_to_an_internal_address_is_not_followed():
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        return httpx.Response(302, headers={"location": "http://169.254.169.254/latest/meta-data/"})
+
+    with pytest.raises(LocalFetchError) as info:
+        asyncio.run(fetcher(handler).fetch("https://news.example.com/story"))
+    assert info.value.reason == "forbidden_address"
+    assert requests == ["https://news.example.com/story"]
+
+
+def test_public_redirects_are_followed_to_the_final_page():
+    def handler(request):
+        if request.url.path == "/story":
+            return httpx.Response(301, headers={"location": "/markets/story"})
+        if request.url.host == "news.example.com":
+            return httpx.Response(302, headers={"location": "http://other.example.com/final"})
+        return page(request)
+
+    final_url, body, _ = asyncio.run(fetcher(handler)._download("https://news.example.com/story"))
+    assert final_url == "http://other.example.com/final"
+    assert body == b"<html>ok</html>"
+
+
+def test_redirect_loops_stop_after_the_limit(monkeypatch):
+    monkeypatch.setattr(local_fetch, "LOCAL_FETCH_MAX_REDIRECTS", 3)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(302, headers={"location": "https://news.example.com/again"})
+
+    with pytest.raises(LocalFetchError) as info:
+        asyncio.run(fetcher(handler)._download("https://news.example.com/start"))
+    assert info.value.reason == "redirects"
+    assert len(requests) == 4
@@ -0,0 +1,134 @@
+import io
+import sys
+import json
+import queue
+import logging
+import logging.handlers
+import threading
+
+import pytest
+
+from agent.logs import ContextFilter, JsonFormatter, NonBlockingQueueHandler, lazy, parse_sample_rates
+from agent.metrics import current_stage, current_task_id, log_records
+
+
+def emit(handler: logging.Handler, level: int, msg: str, *args) -> None:
+    # Straight to the handler (with its filters): pytest attaches its own capture
+    # handlers to loggers, and those would render the message on this thread
+    handler.handle(logging.LogRecord("tests.logs", level, __file__, 1, msg, args, None))
+
+
+def drain(records: queue.Queue, formatter: logging.Formatter) -> str:
+    output = io.StringIO()
+    sink = logging.StreamHandler(output)
+    sink.setFormatter(formatter)
+    listener = logging.handlers.QueueListener(records, sink)
+    listener.start()
+    listener.stop()
+    return output.getvalue()
+
+
+def test_lazy_payload_is_rendered_by_the_writer_thread():
+    records: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    rendered_on = []
+
+    def render():
+        rendered_on.append(threading.get_ident())
+        return "big payload"
+
+    emit(handler, logging.INFO, "[TEST] Payload: %s", lazy(render))
+    assert rendered_on == []
+    assert "[TEST] Payload: big payload" in drain(records, logging.Formatter("%(message)s"))
+    assert rendered_on and rendered_on[0] != threading.get_ident()
+
+
+def test_arguments_are_captured_when_the_call_is_made():
+    records: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    sources = ["a.com"]
+    emit(handler, logging.INFO, "[TEST] Sources: %s (%d)", sources, len(sources))
+    sources.append("b.com")
+    assert drain(records, logging.Formatter("%(message)s")) == "[TEST] Sources: ['a.com'] (1)\n"
+
+
+def test_lazy_payloads_mix_with_eager_arguments():
+    records: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    counts = {"docs": 2}
+    emit(handler, logging.INFO, "[TEST] %r docs, %s, then %s", counts, lazy(lambda: "first"), lazy(lambda: "second"))
+    counts["docs"] = 3
+    emit(handler, logging.INFO, "[TEST] %.0s%s", lazy(lambda: "hidden"), "shown")
+    assert drain(records, logging.Formatter("%(message)s")) == "[TEST] {'docs': 2} docs, first, then second\n[TEST] shown\n"
+
+
+def test_tracebacks_are_rendered_before_queueing():
+    records: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("tests.logs", logging.ERROR, __file__, 1, "[TEST] Failed", None, sys.exc_info())
+    handler.handle(record)
+    queued = records.get_nowait()
+    assert queued.exc_info is None and "ValueError: boom" in queued.exc_text
+
+
+def test_lazy_payload_is_not_rendered_below_the_level():
+    logger = logging.getLogger("tests.logs.quiet")
+    logger.setLevel(logging.INFO)
+    logger.debug("[TEST] %s", lazy(lambda: pytest.fail("rendered")))
+
+
+def test_lazy_payload_is_truncated(monkeypatch):
+    monkeypatch.setattr("agent.logs.LOG_MAX_PAYLOAD_CHARS", 10)
+    assert str(lazy(lambda: "x" * 25)) == "xxxxxxxxxx... [25 chars]"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    records: queue.Queue = queue.Queue(maxsize=1)
+    handler = NonBlockingQueueHandler(records)
+    before = log_records._values.get(("dropped",), 0)
+    for n in range(3):
+        emit(handler, logging.INFO, "[TEST] %s", n)
+    assert records.qsize() == 1
+    assert log_records._values[("dropped",)] - before == 2
+
+
+def test_json_records_carry_task_and_stage():
+    records: queue.Queue = queue.Queue()
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(ContextFilter({}))
+    task_token, stage_token = current_task_id.set("task-1"), current_stage.set("search")
+    try:
+        emit(handler, logging.INFO, "[TEST] Retrieved %s results.", 5)
+    finally:
+        current_stage.reset(stage_token)
+        current_task_id.reset(task_token)
+    entry = json.loads(drain(records, JsonFormatter()))
+    assert entry["message"] == "[TEST] Retrieved 5 results."
+    assert (entry["task_id"], entry["stage"], entry["level"]) == ("task-1", "search", "INFO")
+
+
+def test_sampling_keeps_or_drops_a_whole_stage_and_never_warnings():
+    context_filter = ContextFilter({"search": 0.5})
+
+    def decisions(task_id: str, level: int) -> set:
+        task_token, stage_token = current_task_id.set(task_id), current_stage.set("search")
+        try:
+            return {
+                context_filter.filter(logging.LogRecord("t", level, __file__, 1, "msg", None, None))
+                for _ in range(5)
+            }
+        finally:
+            current_stage.reset(stage_token)
+            current_task_id.reset(task_token)
+
+    per_task = [decisions(f"task-{n}", logging.INFO) for n in range(40)]
+    assert all(len(kept) == 1 for kept in per_task)
+    assert {True} in per_task and {False} in per_task
+    assert all(decisions(f"task-{n}", logging.WARNING) == {True} for n in range(40))
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates(" search=0.2, scrape=2 ,bad=x,") == {"search": 0.2, "scrape": 1.0}
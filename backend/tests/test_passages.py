@@ -0,0 +1,57 @@
+from agent.passages import BM25Index, chunk_markdown, estimate_tokens, select_passages, tokenize, utf8_size
+
+
+def paragraphs(*texts: str) -> str:
+    return "\n\n".join(texts)
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What is the Repo-Rate in 2024?") == ["repo", "rate", "2024"]
+
+
+def test_utf8_size_counts_encoded_bytes():
+    assert utf8_size("nifty") == 5
+    assert utf8_size("₹500") == len("₹500".encode("utf-8"))
+
+
+def test_chunks_follow_paragraphs_and_respect_the_target():
+    texts = [f"Paragraph {n}" + " word" * 30 for n in range(10)]
+    chunks = chunk_markdown(paragraphs(*texts), target_tokens=50)
+    assert len(chunks) > 1
+    assert [text for chunk in chunks for text in chunk.split("\n\n")] == texts
+    assert all(len(chunk) <= 2 * 50 * 4 for chunk in chunks)
+
+
+def test_oversized_paragraph_is_hard_split():
+    chunks = chunk_markdown("x" * 5000, target_tokens=100)
+    assert [len(chunk) for chunk in chunks] == [400] * 11 + [600]
+
+
+def test_bm25_ranks_the_matching_passage_first():
+    index = BM25Index(["cricket scores and fixtures", "nifty index closed higher on bank stocks", "weather in mumbai"])
+    scores = index.scores("nifty bank index")
+    assert scores.index(max(scores)) == 1
+    assert scores[2] == 0.0
+
+
+def test_every_source_keeps_its_best_passage_under_a_tight_budget():
+    relevant = paragraphs("Filler about cricket. " * 30, "The repo rate was held at 6.5 percent by the RBI.", "More filler on weather. " * 30)
+    other = paragraphs("Gold prices rose on global cues.", "Unrelated travel notes. " * 30)
+    condensed = select_passages([relevant, other], ["rbi repo rate"], token_budget=30, min_tokens_per_source=10)
+
+    assert "repo rate was held" in condensed[0]
+    assert condensed[1]
+    assert "[...]" in condensed[0]
+
+
+def test_budget_is_respected_beyond_the_guaranteed_share():
+    documents = [paragraphs(*(f"Sensex update {d}.{n}: " + "markets moved " * 20 for n in range(8))) for d in range(3)]
+    budget = 1000
+    condensed = select_passages(documents, ["sensex markets"], token_budget=budget, min_tokens_per_source=50)
+    kept = [chunk for doc, text in zip(documents, condensed) for chunk in chunk_markdown(doc) if chunk in text]
+    assert all(condensed)
+    assert sum(estimate_tokens(doc) for doc in documents) > budget >= sum(estimate_tokens(chunk) for chunk in kept)
+
+
+def test_empty_documents_stay_empty():
+    assert select_passages(["", ""], ["anything"], token_budget=100, min_tokens_per_source=10) == ["", ""]
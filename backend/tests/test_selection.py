@@ -0,0 +1,16 @@
+from agent.selection import rank_candidates, select_sources
+
+
+def test_pages_found_by_several_sub_queries_rank_first():
+    results = [
+        [{"link": "https://a.com/1"}, {"link": "https://b.com/shared?utm_source=x"}],
+        [{"link": "https://c.com/2"}, {"link": "https://b.com/shared"}],
+    ]
+    ranked = rank_candidates(results)
+    assert ranked[0].canonical == "https://b.com/shared"
+    assert ranked[0].sub_queries == {0, 1}
+
+
+def test_malformed_result_link_does_not_fail_selection():
+    results = [[{"link": "http://host:abc/x"}, {"link": "https://example.com/a"}]]
+    assert {candidate.link for candidate in select_sources(results)} == {"http://host:abc/x", "https://example.com/a"}
@@ -0,0 +1,29 @@
+from agent.sessions import SessionStore, session_key
+
+
+def test_session_key_does_not_contain_the_api_key():
+    key = session_key("SUPERSECRETAPIKEY", "chat-1")
+    assert "SUPERSECRETAPIKEY" not in key
+    assert "SUPERSECRET" not in key
+    assert key.endswith(":chat-1")
+
+
+def test_session_key_is_scoped_per_api_key():
+    assert session_key("key-a", "chat-1") == session_key("key-a", "chat-1")
+    assert session_key("key-a", "chat-1") != session_key("key-b", "chat-1")
+    assert session_key(None, "chat-1") == "anonymous:chat-1"
+
+
+def test_session_search_finds_indexed_document():
+    store = SessionStore()
+    session = store.get(session_key("key-a", "chat-1"))
+    store.add_document(
+        session,
+        "https://example.com/rbi?utm_source=x",
+        {"title": "RBI policy"},
+        "The RBI kept the repo rate unchanged at 6.5 percent in its latest policy meeting.",
+    )
+    hits = session.search("rbi repo rate policy")
+    assert [document.link for document, _ in hits] == ["https://example.com/rbi?utm_source=x"]
+    assert store.drop(session_key("key-a", "chat-1"))
+    assert store.get(session_key("key-a", "chat-1"), create=False) is None
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+
+import pytest
+
+from agent.singleflight import InFlightMap, SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert calls == 1
+    assert flight.stats() == {"executions": 1, "shared": 4, "in_flight": 0}
+
+
+def test_exception_reaches_every_caller():
+    flight = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert "key" not in flight
+
+
+def test_shared_call_survives_until_every_caller_cancels():
+    flight = SingleFlight("test")
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+        return "done"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+    assert finished == [True]
+
+
+def test_last_cancelled_caller_cancels_the_work():
+    flight = SingleFlight("test")
+    started = []
+
+    async def work():
+        started.append(True)
+        await asyncio.sleep(10)
+
+    async def main():
+        callers = [asyncio.ensure_future(flight.do("key", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert "key" not in flight
+
+    asyncio.run(main())
+    assert started == [True]
+
+
+def test_join_log_never_contains_the_key(caplog):
+    flight = SingleFlight("query")
+    secret_key = "SUPERSECRETAPIKEY:chat-1\x00what is the repo rate"
+
+    async def work():
+        await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(flight.do(secret_key, work), flight.do(secret_key, work))
+
+    with caplog.at_level(logging.INFO, logger="agent.singleflight"):
+        asyncio.run(main())
+    assert "joined" in caplog.text
+    assert "SUPERSECRET" not in caplog.text
+
+
+def test_in_flight_map_hands_owner_result_to_joiners():
+    registry = InFlightMap("test")
+
+    async def main():
+        assert registry.claim("url") is None
+        joined = registry.claim("url")
+        assert joined is not None
+        registry.resolve("url", "markdown")
+        assert await joined == "markdown"
+        # Resolved keys can be claimed again
+        assert registry.claim("url") is None
+
+    asyncio.run(main())
+    assert registry.shared == 1
+
+
+def test_caller_arriving_after_the_last_cancel_starts_afresh():
+    flight = SingleFlight("test")
+    runs = []
+
+    async def work():
+        runs.append(True)
+        await asyncio.sleep(0.01)
+        return len(runs)
+
+    async def main():
+        leaving = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        # Let the cancellation reach `do` without letting the cancelled task finish unwinding
+        await asyncio.sleep(0)
+        assert leaving.cancelled()
+        return await flight.do("key", work)
+
+    assert asyncio.run(main()) == 2
+    assert flight.executions == 2
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from agent.streaming import JsonStringFieldStreamer
+
+ANALYSIS = 'Nifty rose 1.2% — "broad" gains\n\tled by banks \\ IT 😀 ₹500'
+DOCUMENT = json.dumps({"summary": "short", "detailed_analysis": ANALYSIS, "sources": ["a"]})
+
+
+def stream(chunks, field="detailed_analysis"):
+    streamer = JsonStringFieldStreamer(field)
+    return "".join(streamer.feed(chunk) for chunk in chunks), streamer.done
+
+
+def test_whole_document_decodes_like_json():
+    assert stream([DOCUMENT]) == (ANALYSIS, True)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 13])
+def test_any_chunking_decodes_the_same(size):
+    chunks = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+    assert stream(chunks) == (ANALYSIS, True)
+
+
+def test_every_split_point_decodes_the_same():
+    for split in range(len(DOCUMENT)):
+        assert stream([DOCUMENT[:split], DOCUMENT[split:]]) == (ANALYSIS, True), split
+
+
+def test_nothing_before_the_field_and_nothing_after_it():
+    streamer = JsonStringFieldStreamer("detailed_analysis")
+    assert streamer.feed('{"summary": "detailed_analysis is next", ') == ""
+    assert streamer.feed('"detailed_analysis": "abc') == "abc"
+    assert streamer.feed('def", "more": "ignored"}') == "def"
+    assert streamer.done
+    assert streamer.feed('"detailed_analysis": "again"') == ""
+
+
+def test_missing_field_yields_nothing():
+    assert stream([DOCUMENT], field="absent") == ("", False)
+
+
+@pytest.mark.parametrize("escaped, decoded", [
+    ("a\\ud83d", "a\ufffd"),
+    ("\\ud83dx", "\ufffdx"),
+    ("\\ud83d\\n", "\ufffd\n"),
+    ("\\ude00b", "\ufffdb"),
+    ("\\ud83d\\ud83d\\ude00", "\ufffd\U0001F600"),
+])
+def test_unpaired_surrogates_become_replacement_characters(escaped, decoded):
+    document = '{"detailed_analysis": "%s", "sources": []}' % escaped
+    for split in range(len(document)):
+        assert stream([document[:split], document[split:]]) == (decoded, True), split
+
+
+def test_finish_flushes_a_dangling_high_surrogate():
+    streamer = JsonStringFieldStreamer("detailed_analysis")
+    assert streamer.feed('{"detailed_analysis": "up \\ud83d') == "up "
+    assert streamer.finish() == "\ufffd"
+    assert streamer.finish() == ""
+
+
+def test_finish_drops_a_cut_off_escape():
+    streamer = JsonStringFieldStreamer("detailed_analysis")
+    assert streamer.feed('{"detailed_analysis": "up \\u20') == "up "
+    assert streamer.finish() == ""
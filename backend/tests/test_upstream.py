@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+import requests
+
+from agent import upstream
+from agent.upstream import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, TokenBucket, Upstream, UpstreamError, UpstreamUnavailable, classify, key_id,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream.time, "monotonic", clock)
+    return clock
+
+
+def http_error(status: int, headers: dict = None) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f"HTTP {status}", response=response)
+
+
+# === Error Classification === #
+class ReadTimeout(Exception):
+    """Named like the httpx/requests transport error."""
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (UpstreamError("throttled", status=429, retry_after=2.0), (429, True, 2.0)),
+    (http_error(503, {"Retry-After": "3"}), (503, True, 3.0)),
+    (http_error(404), (404, False, None)),
+    (ConnectionError("reset"), (None, True, None)),
+    (asyncio.TimeoutError(), (None, True, None)),
+    (ReadTimeout(), (None, True, None)),
+    (ValueError("bad json"), (None, False, None)),
+])
+def test_classify(exc, expected):
+    assert classify(exc) == expected
+
+
+def test_key_id_hides_the_credential():
+    assert key_id(None) == key_id("") == "none"
+    assert key_id("sk-secret") == key_id("sk-secret") != key_id("sk-other")
+    assert "secret" not in key_id("sk-secret") and len(key_id("sk-secret")) == 8
+
+
+# === Token Bucket === #
+def test_bucket_allows_a_burst_then_spaces_calls(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve(max_wait=10) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve(max_wait=10) == pytest.approx(0.5)
+    assert bucket.reserve(max_wait=10) == pytest.approx(1.0)
+
+
+def test_bucket_fails_fast_without_taking_a_token(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.reserve(max_wait=0)
+    assert bucket.reserve(max_wait=0.5) is None
+    clock.now += 1
+    assert bucket.reserve(max_wait=0) == 0.0
+
+
+def test_pause_stops_refill_until_it_ends(clock):
+    bucket = TokenBucket(rate=10, burst=5)
+    bucket.pause(2)
+    clock.now += 1
+    assert bucket.available() == 0.0
+    assert bucket.reserve(max_wait=0.5) is None
+    clock.now += 1.5
+    assert bucket.available() == pytest.approx(5.0)
+
+
+def test_zero_rate_is_unlimited():
+    assert TokenBucket(rate=0, burst=1).reserve(max_wait=0) == 0.0
+
+
+# === Circuit Breaker === #
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failures=3, reset_seconds=10)
+    assert [breaker.record_failure() for _ in range(3)] == [False, False, True]
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10)
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failures=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failures=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    assert breaker.record_failure()
+    assert breaker.state == OPEN and breaker.opened == 2
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failures=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+# === Upstream Calls === #
+@pytest.fixture
+def provider(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_BACKOFF_BASE_SECONDS", 0.0)
+    return Upstream("test", "TEST_UPSTREAM_KEY", rate=0, burst=1, retries=2, failures=3, reset_seconds=30)
+
+
+def flaky(*errors, result="ok"):
+    attempts = []
+
+    async def fn():
+        attempts.append(True)
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return result
+
+    return fn, attempts
+
+
+def test_retryable_errors_are_retried(provider):
+    fn, attempts = flaky(http_error(503), ConnectionError("reset"))
+    assert asyncio.run(provider.call(fn, "search")) == "ok"
+    assert len(attempts) == 3
+    assert provider.breaker.state == CLOSED
+
+
+def test_client_errors_are_not_retried_and_leave_the_circuit_alone(provider):
+    fn, attempts = flaky(http_error(400))
+    with pytest.raises(requests.exceptions.HTTPError):
+        asyncio.run(provider.call(fn, "search"))
+    assert len(attempts) == 1
+    assert provider.breaker.failures == 0
+
+
+def test_open_circuit_fails_fast_without_calling(provider):
+    fn, attempts = flaky(*[http_error(503)] * 3)
+    with pytest.raises(requests.exceptions.HTTPError):
+        asyncio.run(provider.call(fn, "search"))
+    assert provider.breaker.state == OPEN
+
+    fn, attempts = flaky()
+    with pytest.raises(UpstreamUnavailable) as info:
+        asyncio.run(provider.call(fn, "search"))
+    assert attempts == [] and info.value.reason == "circuit open"
+
+
+def test_retry_after_pauses_the_shared_bucket():
+    limited = Upstream("test", "TEST_UPSTREAM_KEY", rate=100, burst=5, retries=0, failures=0, reset_seconds=30)
+    fn, _ = flaky(UpstreamError("throttled", status=429, retry_after=60))
+    with pytest.raises(UpstreamError):
+        asyncio.run(limited.call(fn, "search", key="k"))
+    with pytest.raises(UpstreamUnavailable) as info:
+        asyncio.run(limited.call(flaky()[0], "search", key="k"))
+    assert info.value.reason == "rate limited"
+    assert asyncio.run(limited.call(flaky()[0], "search", key="other")) == "ok"
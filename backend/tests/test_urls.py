@@ -0,0 +1,43 @@
+import pytest
+
+from agent.urls import canonical_host, canonicalize_url
+
+
+def test_trivial_spellings_share_one_canonical_form():
+    variants = [
+        "http://www.Example.com/markets/",
+        "https://example.com/markets#top",
+        "https://example.com:443/markets",
+        "https://EXAMPLE.com/markets?utm_source=news&utm_medium=email",
+        "https://example.com/markets?gclid=abc&fbclid=def&mc_eid=1",
+    ]
+    assert {canonicalize_url(url) for url in variants} == {"https://example.com/markets"}
+
+
+def test_remaining_query_parameters_are_sorted():
+    assert canonicalize_url("https://example.com/s?b=2&a=1&utm_campaign=x") == "https://example.com/s?a=1&b=2"
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://github.com/org/repo/blob/main/README.md?ref=main", "https://github.com/org/repo/blob/main/README.md?ref=v2"),
+    ("https://docs.example.com/page?source=api", "https://docs.example.com/page?source=cli"),
+    ("https://example.com/img?src=a.png", "https://example.com/img?src=b.png"),
+    ("https://example.com/search?sa=1", "https://example.com/search?sa=2"),
+    ("https://example.com/p?ei=1", "https://example.com/p?ei=2"),
+])
+def test_content_parameters_are_kept(first, second):
+    assert canonicalize_url(first) != canonicalize_url(second)
+
+
+def test_non_default_port_is_kept():
+    assert canonicalize_url("http://localhost:8080/a/") == "https://localhost:8080/a"
+
+
+def test_canonical_host():
+    assert canonical_host("https://WWW.Example.com:8443/path") == "example.com"
+
+
+@pytest.mark.parametrize("url", ["http://host:abc/page", "http://host:99999/page", "http://[::1/page"])
+def test_malformed_urls_fall_back_to_the_raw_url(url):
+    assert canonicalize_url(f" {url} ") == url
+    assert canonical_host(url) in ("", "host")